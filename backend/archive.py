@@ -0,0 +1,100 @@
+import os
+import time
+import zipfile
+import logging
+from typing import Iterable, Iterator, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+# Bytes read from a member file per step; also the bound on buffered output
+ZIP_CHUNK_SIZE = 64 * 1024
+
+
+class _ChunkSink:
+    """
+    Write-only, unseekable file object collecting ZipFile output.
+
+    ZipFile writes local headers, member data and data descriptors to it;
+    stream_zip() drains it after every chunk so at most one chunk (plus
+    headers) is buffered at a time. Lacking tell()/seek(), it makes ZipFile
+    use streaming mode (sizes and CRCs go into data descriptors).
+    """
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def unique_names(names: Iterable[str]) -> List[str]:
+    """
+    Make archive member names unique by numbering duplicates.
+
+    "Song.mp3" appearing twice becomes "Song.mp3" and "Song (2).mp3".
+    """
+    taken = set()
+    unique = []
+    for name in names:
+        stem, ext = os.path.splitext(name)
+        candidate, number = name, 1
+        while candidate.casefold() in taken:
+            number += 1
+            candidate = f"{stem} ({number}){ext}"
+        taken.add(candidate.casefold())
+        unique.append(candidate)
+    return unique
+
+
+def stream_zip(entries: Iterable[Tuple[str, str]], chunk_size: int = ZIP_CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    Build a ZIP archive on the fly and yield it in chunks.
+
+    Members are stored uncompressed (MP3 does not compress) and read in
+    chunk_size pieces, so memory use does not depend on the number or size
+    of the files and nothing is written to disk. Files that disappear
+    before they are reached are skipped.
+
+    Args:
+        entries: (archive name, path on disk) pairs
+        chunk_size: Bytes read from a file per step
+
+    Yields:
+        Consecutive pieces of the archive
+    """
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_STORED) as archive:
+        for arcname, path in entries:
+            try:
+                source = open(path, "rb")
+            except OSError as e:
+                logger.warning(f"Skipping {arcname} in archive: {e}")
+                continue
+            with source:
+                stat = os.fstat(source.fileno())
+                info = zipfile.ZipInfo(arcname, date_time=time.localtime(stat.st_mtime)[:6])
+                info.compress_type = zipfile.ZIP_STORED
+                # Known size lets ZipFile decide whether the entry needs zip64
+                info.file_size = stat.st_size
+                with archive.open(info, "w") as member:
+                    while True:
+                        chunk = source.read(chunk_size)
+                        if not chunk:
+                            break
+                        member.write(chunk)
+                        yield sink.drain()
+            data = sink.drain()
+            if data:
+                yield data
+    # Central directory, written when the archive is closed
+    yield sink.drain()
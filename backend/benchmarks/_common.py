@@ -0,0 +1,70 @@
+"""Shared helpers for the offline benchmarks"""
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+FAKE_TOOLS_DIR = os.path.join(BENCH_DIR, "fake_tools")
+
+# Make the backend modules importable (they use flat imports)
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+
+def use_fake_tools() -> str:
+    """Put the fake yt-dlp/ffmpeg first on PATH and return their directory"""
+    path = os.environ.get("PATH", "")
+    if not path.startswith(FAKE_TOOLS_DIR + os.pathsep):
+        os.environ["PATH"] = FAKE_TOOLS_DIR + os.pathsep + path
+    return FAKE_TOOLS_DIR
+
+
+def temp_output_dir() -> str:
+    """Create a scratch output directory for one benchmark run"""
+    return tempfile.mkdtemp(prefix="yt_to_mp3_bench_")
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_until_up(base_url: str, timeout: float = 20.0) -> None:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(base_url + "/", timeout=1).read()
+            return
+        except (urllib.error.URLError, ConnectionError):
+            time.sleep(0.1)
+    raise SystemExit("server did not start")
+
+
+def start_server(output_dir: str, **env) -> tuple:
+    """
+    Start the API with uvicorn against the fake tools.
+
+    Returns:
+        (process, base_url); terminate the process when done
+    """
+    fake_tools = use_fake_tools()
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    env = dict(os.environ, OUTPUT_DIR=output_dir, FFMPEG_PATH=fake_tools, **env)
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        wait_until_up(base_url)
+    except SystemExit:
+        server.terminate()
+        raise
+    return server, base_url
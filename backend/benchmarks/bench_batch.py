@@ -0,0 +1,53 @@
+"""
+Throughput of convert_batch against the fake yt-dlp/ffmpeg tools.
+
+Runs the same batch with an increasing number of workers and reports wall
+time and items per second. Usage:
+
+    python benchmarks/bench_batch.py --items 20 --workers 1 2 4 8
+"""
+import argparse
+import shutil
+import time
+
+from _common import use_fake_tools, temp_output_dir
+
+import converter
+
+
+def run(items: int, workers: int, ffmpeg_path: str) -> float:
+    output_dir = temp_output_dir()
+    urls = [f"https://www.youtube.com/watch?v=bench{i:06d}" for i in range(items)]
+    try:
+        start = time.perf_counter()
+        results = converter.convert_batch(urls, [], output_dir, ffmpeg_path, max_workers=workers)
+        elapsed = time.perf_counter() - start
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+
+    failed = [r for r in results if not r['success']]
+    if failed:
+        raise SystemExit(f"{len(failed)} items failed, first error: {failed[0]['error']}")
+    assert [r['originalInput'] for r in results] == urls, "results out of order"
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--items", type=int, default=20)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--max-transcodes", type=int, default=4)
+    args = parser.parse_args()
+
+    ffmpeg_path = use_fake_tools()
+    baseline = None
+    print(f"{'workers':>8} {'seconds':>9} {'items/s':>9} {'speedup':>8}")
+    for workers in args.workers:
+        converter.configure_limits(max_downloads=workers, max_transcodes=args.max_transcodes)
+        elapsed = run(args.items, workers, ffmpeg_path)
+        baseline = baseline or elapsed
+        print(f"{workers:>8} {elapsed:>9.2f} {args.items / elapsed:>9.2f} {baseline / elapsed:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Batch CLI: throughput with 1 vs. N workers, and resuming an interrupted run.
+
+Runs cli.py on --items fake video URLs with the fake yt-dlp/ffmpeg, once
+with a single worker (what link_to_mp3.py did) and once with --workers.
+Then starts a parallel run, interrupts it with SIGINT after --stop-after
+seconds and runs it again, checking that the second run skips every item
+the first one journaled and that every item ends up converted exactly
+once. Usage:
+
+    python benchmarks/bench_cli.py --items 40 --workers 8 --delay 0.5
+"""
+import argparse
+import json
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import time
+
+from _common import BACKEND_DIR, use_fake_tools, temp_output_dir
+
+CLI = os.path.join(BACKEND_DIR, "cli.py")
+
+
+def run_cli(input_path: str, output_dir: str, workers: int, stop_after: float = None):
+    cmd = [sys.executable, CLI, input_path, "-o", output_dir, "-j", str(workers), "--no-tags", "--interval", "3600"]
+    start = time.perf_counter()
+    process = subprocess.Popen(cmd, stderr=subprocess.PIPE, text=True)
+    if stop_after is not None:
+        time.sleep(stop_after)
+        process.send_signal(signal.SIGINT)
+    stderr = process.communicate()[1]
+    return process.returncode, time.perf_counter() - start, stderr.strip().splitlines()
+
+
+def journal_entries(output_dir: str) -> list:
+    with open(os.path.join(output_dir, ".ytmp3-journal.jsonl"), encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--items", type=int, default=40)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--delay", type=float, default=0.5, help="Fake download time per item")
+    parser.add_argument("--stop-after", type=float, default=2.0, help="Seconds before the interrupted run gets SIGINT")
+    args = parser.parse_args()
+
+    os.environ["FFMPEG_PATH"] = use_fake_tools()
+    os.environ["FAKE_YTDLP_DELAY"] = str(args.delay)
+    os.environ["SEARCH_BACKEND"] = "off"
+    scratch = temp_output_dir()
+    input_path = os.path.join(scratch, "inputs.txt")
+    with open(input_path, "w", encoding="utf-8") as f:
+        f.write("\n".join(f"https://www.youtube.com/watch?v=cli{n:08d}" for n in range(args.items)))
+
+    try:
+        print(f"{args.items} items, {args.delay}s fake download each")
+        for workers in (1, args.workers):
+            output_dir = os.path.join(scratch, f"out-{workers}")
+            status, elapsed, lines = run_cli(input_path, output_dir, workers)
+            if status != 0:
+                raise SystemExit(f"FAIL: exit status {status}: {lines[-1:]}")
+            print(f"{workers:>2} workers: {elapsed:6.2f} s  {args.items * 60 / elapsed:7.1f} items/min")
+
+        output_dir = os.path.join(scratch, "out-resume")
+        status, _, lines = run_cli(input_path, output_dir, args.workers, stop_after=args.stop_after)
+        first = journal_entries(output_dir)
+        print(f"\ninterrupted run: exit {status}, {len(first)} items journaled")
+        print(f"  {lines[-2] if len(lines) > 1 else ''}")
+        status, _, lines = run_cli(input_path, output_dir, args.workers)
+        print(f"resumed run:     exit {status}")
+        print(f"  {lines[-1]}")
+
+        entries = journal_entries(output_dir)
+        inputs = [entry['input'] for entry in entries]
+        files = [name for name in os.listdir(output_dir) if name.endswith(".mp3")]
+        if status != 0 or len(set(inputs)) != args.items or len(inputs) != args.items:
+            raise SystemExit(f"FAIL: {len(inputs)} journal entries for {len(set(inputs))} of {args.items} items")
+        if len(files) != args.items:
+            raise SystemExit(f"FAIL: {len(files)} files for {args.items} items")
+        print(f"every item converted exactly once ({len(files)} files)")
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Request coalescing: concurrent identical conversions share one subprocess.
+
+Fires N concurrent convert_single calls for the same video (using several
+URL spellings) against a slow fake yt-dlp, counts how many yt-dlp processes
+were spawned and prints the coalescing counters. Usage:
+
+    python benchmarks/bench_coalescing.py --clients 20 --delay 2
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from _common import use_fake_tools, temp_output_dir
+
+import converter
+
+URL_FORMS = [
+    "https://www.youtube.com/watch?v=dQw4w9WgXcQ",
+    "https://youtu.be/dQw4w9WgXcQ",
+    "https://www.youtube.com/watch?v=dQw4w9WgXcQ&t=42",
+    "youtube.com/shorts/dQw4w9WgXcQ",
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--clients", type=int, default=20)
+    parser.add_argument("--delay", type=float, default=2.0, help="Fake download time")
+    args = parser.parse_args()
+
+    ffmpeg_path = use_fake_tools()
+    output_dir = temp_output_dir()
+    spawn_log = tempfile.mktemp(prefix="yt_to_mp3_spawns_")
+    os.environ["FAKE_YTDLP_DELAY"] = str(args.delay)
+    os.environ["FAKE_YTDLP_SPAWN_LOG"] = spawn_log
+    converter.configure_cache(None)
+
+    urls = [URL_FORMS[i % len(URL_FORMS)] for i in range(args.clients)]
+    try:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.clients) as pool:
+            results = list(pool.map(lambda url: converter.convert_single(url, output_dir, ffmpeg_path), urls))
+        elapsed = time.perf_counter() - start
+
+        with open(spawn_log) as f:
+            spawns = len(f.read().splitlines())
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+        if os.path.exists(spawn_log):
+            os.remove(spawn_log)
+
+    succeeded = sum(1 for r in results if r['success'])
+    print(f"clients:            {args.clients}")
+    print(f"succeeded:          {succeeded}")
+    print(f"yt-dlp spawned:     {spawns}")
+    print(f"distinct files:     {len({r['filename'] for r in results})}")
+    print(f"wall time:          {elapsed:.2f}s (single conversion ~{args.delay:.2f}s)")
+    print(f"coalescing stats:   {converter.coalescing_stats()}")
+    if spawns != 1 or succeeded != args.clients:
+        raise SystemExit("FAIL: expected exactly one yt-dlp process and every client to succeed")
+
+
+if __name__ == "__main__":
+    main()
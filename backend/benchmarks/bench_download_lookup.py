@@ -0,0 +1,90 @@
+"""
+Download lookup latency: directory scan vs. file index.
+
+Creates N empty {file_id}_{title}.mp3 files twice, once in a flat directory
+(old layout, looked up with os.listdir + startswith) and once in shard
+directories registered in a FileIndex, then times random lookups. Usage:
+
+    python benchmarks/bench_download_lookup.py --files 100000
+"""
+import argparse
+import os
+import random
+import shutil
+import statistics
+import time
+import uuid
+
+from _common import temp_output_dir
+
+from storage import FileIndex, shard_dir
+
+
+def scan_lookup(output_dir: str, file_id: str) -> str:
+    files = [f for f in os.listdir(output_dir) if f.startswith(file_id)]
+    return os.path.join(output_dir, files[0])
+
+
+def index_lookup(index: FileIndex, file_id: str) -> str:
+    record = index.get(file_id)
+    if not os.path.isfile(record['path']):
+        raise FileNotFoundError(record['path'])
+    return record['path']
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def measure(lookup, ids, samples):
+    timings = []
+    for file_id in random.sample(ids, min(samples, len(ids))):
+        start = time.perf_counter()
+        lookup(file_id)
+        timings.append((time.perf_counter() - start) * 1e6)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--files", type=int, default=100000)
+    parser.add_argument("--samples", type=int, default=200)
+    parser.add_argument("--scan-samples", type=int, default=20, help="Scans are slow; fewer samples")
+    args = parser.parse_args()
+
+    flat_dir = temp_output_dir()
+    sharded_dir = temp_output_dir()
+    ids = [str(uuid.uuid4()) for _ in range(args.files)]
+    try:
+        start = time.perf_counter()
+        index = FileIndex(os.path.join(sharded_dir, ".index", "files.sqlite3"), sharded_dir)
+        for file_id in ids:
+            name = f"{file_id}_Some Track Title.mp3"
+            open(os.path.join(flat_dir, name), "wb").close()
+            directory = shard_dir(sharded_dir, file_id)
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, name)
+            open(path, "wb").close()
+            index.add(file_id, path, size=0)
+        print(f"created {args.files} files in each layout in {time.perf_counter() - start:.1f}s")
+
+        start = time.perf_counter()
+        reloaded = FileIndex(index.db_path, sharded_dir)
+        print(f"index reload from SQLite: {(time.perf_counter() - start) * 1000:.0f} ms ({len(reloaded)} records)")
+
+        print(f"{'lookup':>12} {'p50 (us)':>12} {'p99 (us)':>12}")
+        for name, timings in (
+            ("listdir", measure(lambda i: scan_lookup(flat_dir, i), ids, args.scan_samples)),
+            ("index", measure(lambda i: index_lookup(reloaded, i), ids, args.samples)),
+        ):
+            print(f"{name:>12} {statistics.median(timings):>12.1f} {percentile(timings, 0.99):>12.1f}")
+        index.close()
+        reloaded.close()
+    finally:
+        shutil.rmtree(flat_dir, ignore_errors=True)
+        shutil.rmtree(sharded_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
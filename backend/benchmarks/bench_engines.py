@@ -0,0 +1,58 @@
+"""
+Per-item overhead of the subprocess and in-process yt-dlp engines.
+
+Serves a small generated WAV file from a local HTTP server and downloads it
+repeatedly with each engine (real yt-dlp, generic extractor, no network
+beyond localhost). The difference per item is the cost of spawning the CLI:
+interpreter startup plus extractor imports. Usage:
+
+    python benchmarks/bench_engines.py --items 10
+"""
+import argparse
+import os
+import shutil
+import statistics
+import time
+
+from _common import temp_output_dir
+from media_server import serve_directory, write_sine_wav
+
+from engines import InProcessEngine, SubprocessEngine
+
+
+def run(engine, url: str, items: int, output_dir: str) -> list:
+    timings = []
+    for i in range(items):
+        template = os.path.join(output_dir, f"{engine.name}{i:04d}_%(title)s.%(ext)s")
+        start = time.perf_counter()
+        info = engine.download(url, template, output_dir)
+        timings.append((time.perf_counter() - start) * 1000)
+        os.remove(info['filepath'])
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--items", type=int, default=10)
+    parser.add_argument("--seconds", type=float, default=5.0, help="Length of the served audio")
+    args = parser.parse_args()
+
+    media_dir = temp_output_dir()
+    output_dir = temp_output_dir()
+    write_sine_wav(os.path.join(media_dir, "clip.wav"), args.seconds)
+    server, base_url = serve_directory(media_dir)
+    url = f"{base_url}/clip.wav"
+    try:
+        print(f"{'engine':>11} {'first':>9} {'mean':>9} {'median':>9}   (ms per item, {args.items} items)")
+        for engine in (SubprocessEngine(), InProcessEngine(pool_size=1)):
+            timings = run(engine, url, args.items + 1, output_dir)
+            first, rest = timings[0], timings[1:]
+            print(f"{engine.name:>11} {first:>9.1f} {statistics.mean(rest):>9.1f} {statistics.median(rest):>9.1f}")
+    finally:
+        server.shutdown()
+        shutil.rmtree(media_dir, ignore_errors=True)
+        shutil.rmtree(output_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Fair queuing: latency of small requests while a huge batch is running.
+
+One client submits a --batch item request; while it runs, other clients
+submit single-item requests every --interval seconds. All items run on
+one FairExecutor of --workers threads with the fake yt-dlp/ffmpeg, in
+three modes: arrival order (every item under one client in the bulk lane,
+which is how the job queue used to work), fair queuing without and with a
+fast-lane worker. Reports the latency of the small requests and the time
+the batch took. Usage:
+
+    python benchmarks/bench_fairness.py --batch 300 --workers 4 --delay 0.2 --interval 0.5
+"""
+import argparse
+import os
+import shutil
+import threading
+import time
+
+from _common import use_fake_tools, temp_output_dir
+
+import converter
+from fairness import BULK, FAST, FairExecutor, FairQueue
+
+MODES = (
+    # name, fair (per-client queues and fast lane), fast lane workers
+    ("arrival order", False, 0),
+    ("fair", True, 0),
+    ("fair + fast lane", True, 1),
+)
+
+
+def percentile(values: list, share: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(share * len(ordered)))]
+
+
+def run(args, fair: bool, fast_lane_workers: int, ffmpeg_path: str, run_id: int) -> tuple:
+    output_dir = temp_output_dir()
+    fair_queue = FairQueue()
+    executor = FairExecutor(fair_queue, args.workers, fast_lane_workers)
+    try:
+        def submit(client: str, url: str, lane: str):
+            if not fair:
+                client, lane = "all", BULK
+            return executor.submit(client, converter.convert_single, url, output_dir, ffmpeg_path, lane=lane)
+
+        start = time.perf_counter()
+        batch = [
+            submit("batch", f"https://www.youtube.com/watch?v=big{run_id}{n:07d}", BULK)
+            for n in range(args.batch)
+        ]
+        latencies = []
+
+        def small_request(n: int) -> None:
+            submitted = time.perf_counter()
+            submit(f"client-{n}", f"https://www.youtube.com/watch?v=sml{run_id}{n:07d}", FAST).result()
+            latencies.append(time.perf_counter() - submitted)
+
+        threads = []
+        n = 0
+        while not all(future.done() for future in batch):
+            thread = threading.Thread(target=small_request, args=(n,))
+            thread.start()
+            threads.append(thread)
+            n += 1
+            time.sleep(args.interval)
+        batch_seconds = time.perf_counter() - start
+        for thread in threads:
+            thread.join()
+        failed = sum(1 for future in batch if not future.result()['success'])
+        if failed:
+            raise SystemExit(f"FAIL: {failed} batch items failed")
+        return latencies, batch_seconds
+    finally:
+        executor.shutdown()
+        shutil.rmtree(output_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--batch", type=int, default=300, help="Items of the big request")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--delay", type=float, default=0.2, help="Fake download time per item")
+    parser.add_argument("--interval", type=float, default=0.5, help="Seconds between single-item requests")
+    args = parser.parse_args()
+
+    ffmpeg_path = use_fake_tools()
+    os.environ["FAKE_YTDLP_DELAY"] = str(args.delay)
+    converter.configure_cache(None)
+    converter.configure_limits(max_downloads=args.workers + 1, max_transcodes=args.workers + 1)
+
+    print(f"{args.batch}-item batch, single-item request every {args.interval}s, "
+          f"{args.workers} workers, {args.delay}s per item")
+    print(f"{'mode':<18} {'small reqs':>10} {'p50 s':>7} {'p99 s':>7} {'max s':>7} {'batch s':>8}")
+    for run_id, (name, fair, fast_lane_workers) in enumerate(MODES):
+        latencies, batch_seconds = run(args, fair, fast_lane_workers, ffmpeg_path, run_id)
+        print(f"{name:<18} {len(latencies):>10} {percentile(latencies, 0.5):>7.2f} "
+              f"{percentile(latencies, 0.99):>7.2f} {max(latencies):>7.2f} {batch_seconds:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Metrics: cost of the stage timers and a conversion batch with and without them.
+
+Times --calls entries of the stage() context manager while metrics are
+disabled (the shared no-op) and enabled (a histogram observation), then
+converts the same batch with the fake yt-dlp/ffmpeg in both modes and
+checks that every stage of the batch was recorded and that the text
+exposition of /metrics parses. Usage:
+
+    python benchmarks/bench_metrics.py --calls 1000000 --items 40 --workers 4
+"""
+import argparse
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from _common import use_fake_tools, temp_output_dir
+
+import converter
+from metrics import Metrics, configure_metrics, stage
+
+
+def time_stage(calls: int) -> float:
+    """Nanoseconds a `with stage(...)` block adds to an empty loop iteration"""
+    start = time.perf_counter()
+    for _ in range(calls):
+        pass
+    baseline = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(calls):
+        with stage("bench"):
+            pass
+    return (time.perf_counter() - start - baseline) / calls * 1e9
+
+
+def run_batch(urls: list, args, ffmpeg_path: str) -> float:
+    output_dir = temp_output_dir()
+    try:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.workers) as pool:
+            results = list(pool.map(lambda url: converter.convert_single(url, output_dir, ffmpeg_path), urls))
+        elapsed = time.perf_counter() - start
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+    failed = [r for r in results if not r['success']]
+    if failed:
+        raise SystemExit(f"{len(failed)} items failed, first error: {failed[0]['error']}")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--calls", type=int, default=1_000_000, help="stage() calls timed per mode")
+    parser.add_argument("--items", type=int, default=40)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--delay", type=float, default=0.05, help="Fake download time")
+    args = parser.parse_args()
+
+    ffmpeg_path = use_fake_tools()
+    os.environ["FAKE_YTDLP_DELAY"] = str(args.delay)
+    converter.configure_limits(max_downloads=args.workers, max_transcodes=args.workers)
+    converter.configure_cache(None)
+    urls = [f"https://www.youtube.com/watch?v=met{n:08d}" for n in range(args.items)]
+    metrics = Metrics()
+
+    print(f"{'mode':<10} {'ns/stage':>10} {'batch s':>9}")
+    for name, configured in (("disabled", None), ("enabled", metrics)):
+        configure_metrics(configured)
+        try:
+            per_call = time_stage(args.calls)
+            elapsed = run_batch(urls, args, ffmpeg_path)
+        finally:
+            configure_metrics(None)
+        print(f"{name:<10} {per_call:>10.0f} {elapsed:>9.2f}")
+
+    from prometheus_client.parser import text_string_to_metric_families
+
+    content, _ = metrics.render()
+    counts = {}
+    for family in text_string_to_metric_families(content.decode()):
+        for sample in family.samples:
+            if sample.name == "ytmp3_stage_duration_seconds_count":
+                counts[sample.labels["stage"]] = sample.value
+    print(f"\nrecorded stages (bench = timing loop): {counts}")
+    for name in ("download", "transcode"):
+        if counts.get(name) != args.items:
+            raise SystemExit(f"FAIL: {counts.get(name)} {name} observations, expected {args.items}")
+
+
+if __name__ == "__main__":
+    main()
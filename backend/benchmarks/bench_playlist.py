@@ -0,0 +1,103 @@
+"""
+Playlist expansion: time to the first conversion and in-flight items.
+
+Submits a job with one playlist URL to a JobScheduler converting with the
+fake yt-dlp/ffmpeg. The fake playlist is fetched in pages of 100 entries
+taking --page-delay seconds each. Reports when the first entry started
+converting compared to how long enumerating the whole list takes (what an
+expand-then-convert approach would wait), and the largest number of entries
+that were queued or converting at once, which stays at the playlist window
+regardless of the playlist length. Usage:
+
+    python benchmarks/bench_playlist.py --entries 1000 --page-delay 0.5 --window 8
+"""
+import argparse
+import os
+import shutil
+import threading
+import time
+from functools import partial
+
+from _common import use_fake_tools, temp_output_dir
+
+import converter
+from jobs import COMPLETED, MemoryJobStore, JobScheduler
+from playlists import PlaylistExpander
+
+PLAYLIST_URL = "https://www.youtube.com/playlist?list=PLbenchmark"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--entries", type=int, default=1000, help="Playlist length")
+    parser.add_argument("--page-delay", type=float, default=0.5, help="Fake time per page of 100 entries")
+    parser.add_argument("--delay", type=float, default=0.05, help="Fake download time per entry")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--window", type=int, default=8, help="Entries in flight per playlist")
+    args = parser.parse_args()
+
+    ffmpeg_path = use_fake_tools()
+    os.environ["FAKE_YTDLP_DELAY"] = str(args.delay)
+    os.environ["FAKE_YTDLP_PLAYLIST_SIZE"] = str(args.entries)
+    os.environ["FAKE_YTDLP_PAGE_DELAY"] = str(args.page_delay)
+    converter.configure_limits(max_downloads=args.workers, max_transcodes=args.workers)
+    converter.configure_cache(None)
+    expander = PlaylistExpander(max_items=args.entries, max_duration_seconds=0)
+
+    start = time.perf_counter()
+    listed = sum(1 for _ in expander.expand(PLAYLIST_URL))
+    enumeration = time.perf_counter() - start
+    print(f"{args.entries} entries, {args.workers} workers, window {args.window}")
+    print(f"enumerating the whole playlist:   {enumeration:8.2f} s ({listed} entries)")
+
+    output_dir = temp_output_dir()
+    done = threading.Event()
+    stats = {'first': None, 'in_flight': 0, 'max_in_flight': 0}
+    lock = threading.Lock()
+
+    def on_event(job_id, event):
+        with lock:
+            if event['type'] == 'added':
+                stats['in_flight'] += 1
+                stats['max_in_flight'] = max(stats['max_in_flight'], stats['in_flight'])
+            elif event['type'] == 'item' and event['index'] > 0 and event['status'] != 'running':
+                stats['in_flight'] -= 1
+            elif event['type'] == 'item' and event['index'] > 0 and stats['first'] is None:
+                stats['first'] = time.perf_counter() - start
+            elif event['type'] == 'job' and event['status'] == COMPLETED:
+                done.set()
+
+    scheduler = JobScheduler(
+        MemoryJobStore(),
+        partial(converter.convert_single, output_dir=output_dir, ffmpeg_path=ffmpeg_path),
+        workers=args.workers,
+        max_queue=max(100, args.window),
+        on_event=on_event,
+        expander=expander,
+        playlist_window=args.window
+    )
+    scheduler.start()
+    try:
+        start = time.perf_counter()
+        job = scheduler.submit([(PLAYLIST_URL, False)])
+        done.wait()
+        elapsed = time.perf_counter() - start
+        record = scheduler.store.get(job['id'])
+    finally:
+        scheduler.stop()
+        shutil.rmtree(output_dir, ignore_errors=True)
+
+    videos = [item for item in record['items'] if item['kind'] == 'video']
+    failed = [item for item in videos if item['status'] != COMPLETED]
+    print(f"first entry converting after:     {stats['first']:8.2f} s")
+    print(f"whole job finished after:         {elapsed:8.2f} s")
+    print(f"max entries queued or converting: {stats['max_in_flight']:8d}")
+    print(f"playlist result: {record['items'][0]['result']}")
+    if len(videos) != args.entries or failed:
+        raise SystemExit(f"FAIL: {len(videos)} entries, {len(failed)} not completed")
+    if stats['max_in_flight'] > args.window:
+        raise SystemExit("FAIL: more entries in flight than the playlist window")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Encoder cost per profile: CPU-seconds per minute of audio.
+
+Needs a real ffmpeg (with libmp3lame and libopus). Generates a stereo test
+signal, stores it as the two source formats YouTube serves (Opus in WebM
+and AAC in M4A), then runs the converter's transcode step for every
+profile and measures the CPU time of the ffmpeg child processes. Profiles
+that can remux a source are measured on both the matching source (fast
+path) and the other one (re-encode). Usage:
+
+    python benchmarks/bench_profiles.py --ffmpeg /usr/bin --minutes 3
+"""
+import argparse
+import os
+import resource
+import shutil
+import subprocess
+import time
+
+from _common import temp_output_dir
+
+from converter import _transcode, find_executable
+from profiles import PROFILES, can_copy, codec_args
+
+# Source containers as served by YouTube: (file name, ffmpeg codec args, codec reported by yt-dlp)
+SOURCES = [
+    ("source.webm", ["-codec:a", "libopus", "-b:a", "128k"], "opus"),
+    ("source.m4a", ["-codec:a", "aac", "-b:a", "128k"], "mp4a.40.2"),
+]
+
+
+def make_source(ffmpeg: str, path: str, audio_args: list, seconds: float) -> None:
+    # Two detuned tones plus pink noise: cheap to generate, not trivially compressible
+    subprocess.run(
+        [
+            ffmpeg, "-y", "-loglevel", "error",
+            "-f", "lavfi", "-i", f"sine=frequency=220:duration={seconds}",
+            "-f", "lavfi", "-i", f"sine=frequency=331:duration={seconds}",
+            "-f", "lavfi", "-i", f"anoisesrc=color=pink:amplitude=0.05:duration={seconds}",
+            "-filter_complex", "[0][1]amerge=inputs=2[tones];[tones][2]amix=inputs=2:duration=first",
+            *audio_args, path
+        ],
+        check=True
+    )
+
+
+def children_cpu() -> float:
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def measure(source: str, output: str, ffmpeg_dir: str, audio_args: list, repeat: int):
+    cpu, wall = [], []
+    for _ in range(repeat):
+        before_cpu, before_wall = children_cpu(), time.perf_counter()
+        result = _transcode(source, output, ffmpeg_dir, audio_args)
+        if result.returncode != 0:
+            raise SystemExit(f"ffmpeg failed: {result.stderr[:300]}")
+        cpu.append(children_cpu() - before_cpu)
+        wall.append(time.perf_counter() - before_wall)
+    return min(cpu), min(wall), os.path.getsize(output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--ffmpeg", default=None, help="Directory containing ffmpeg (default: PATH)")
+    parser.add_argument("--minutes", type=float, default=3.0, help="Length of the test signal")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per measurement (best is reported)")
+    args = parser.parse_args()
+
+    ffmpeg = find_executable("ffmpeg", args.ffmpeg)
+    if ffmpeg is None:
+        raise SystemExit("ffmpeg not found; pass --ffmpeg DIR")
+    ffmpeg_dir = os.path.dirname(ffmpeg)
+
+    work_dir = temp_output_dir()
+    try:
+        sources = []
+        for name, audio_args, codec in SOURCES:
+            path = os.path.join(work_dir, name)
+            make_source(ffmpeg, path, audio_args, args.minutes * 60)
+            sources.append((path, codec))
+
+        print(f"{args.minutes:g} min test signal, best of {args.repeat}")
+        print(f"{'profile':<10} {'source':<12} {'mode':<9} {'cpu s/min':>10} {'wall s':>8} {'x realtime':>11} {'kbit/s':>7}")
+        for profile in PROFILES.values():
+            output = os.path.join(work_dir, f"out.{profile.extension}")
+            for path, codec in sources:
+                mode = "remux" if can_copy(profile, codec) else "encode"
+                cpu, wall, size = measure(path, output, ffmpeg_dir, codec_args(profile, codec), args.repeat)
+                print(
+                    f"{profile.name:<10} {os.path.basename(path):<12} {mode:<9} "
+                    f"{cpu / args.minutes:>10.3f} {wall:>8.2f} {args.minutes * 60 / wall:>11.0f} "
+                    f"{size * 8 / (args.minutes * 60) / 1000:>7.0f}"
+                )
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
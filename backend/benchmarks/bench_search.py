@@ -0,0 +1,103 @@
+"""
+Search resolution: inline ytsearch1: downloads vs. a resolve-first stage.
+
+Runs a batch of search queries (each query repeated with different case and
+spacing) twice against the fake yt-dlp, once with searches done by yt-dlp
+as part of every download (SEARCH_BACKEND=off) and once with the batch
+resolved up front through the query cache. Reports wall time and yt-dlp
+processes per round; the second round models repeated popular queries.
+Finally checks with the static stub backend that duplicate queries cost
+one search. Usage:
+
+    python benchmarks/bench_search.py --queries 8 --repeats 3 --delay 1
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from _common import use_fake_tools, temp_output_dir
+
+import converter
+from cache import ConversionCache
+from search import SearchResolver, StaticSearchBackend, YtDlpSearchBackend
+
+
+def variants(query: str, repeats: int) -> list:
+    forms = [query, query.upper(), f"  {query.lower()} ", query.title()]
+    return [forms[i % len(forms)] for i in range(repeats)]
+
+
+def count_lines(path: str) -> int:
+    if not os.path.exists(path):
+        return 0
+    with open(path) as f:
+        return len(f.read().splitlines())
+
+
+def run_mode(name: str, resolver, queries: list, workers: int, ffmpeg_path: str) -> None:
+    output_dir = temp_output_dir()
+    spawn_log = tempfile.mktemp(prefix="yt_to_mp3_spawns_")
+    os.environ["FAKE_YTDLP_SPAWN_LOG"] = spawn_log
+    converter.configure_search(resolver)
+    converter.configure_cache(ConversionCache(os.path.join(output_dir, ".cache")))
+    try:
+        for round_number in (1, 2):
+            before = count_lines(spawn_log)
+            start = time.perf_counter()
+            results = converter.convert_batch([], queries, output_dir, ffmpeg_path, max_workers=workers)
+            elapsed = time.perf_counter() - start
+            failed = [r for r in results if not r['success']]
+            if failed:
+                raise SystemExit(f"{name}: {len(failed)} items failed, first error: {failed[0]['error']}")
+            assert [r['originalInput'] for r in results] == queries, "results out of order"
+            print(
+                f"{name:<10} {round_number:>6} {elapsed:>9.2f} {count_lines(spawn_log) - before:>8} "
+                f"{len({r['filename'][37:] for r in results}):>7}"
+            )
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+        if os.path.exists(spawn_log):
+            os.remove(spawn_log)
+
+
+def check_stub(queries: list, distinct: int) -> None:
+    backend = StaticSearchBackend({q: f"stub{i:07d}" for i, q in enumerate(dict.fromkeys(queries))}, delay=0.05)
+    resolver = SearchResolver(backend, max_workers=8)
+    results = resolver.resolve_all(queries)
+    ids = {video_id for video_id, _ in results}
+    print(f"\nstub backend: {len(queries)} queries -> {backend.calls} searches, {len(ids)} videos")
+    print(f"resolver stats: {resolver.stats()}")
+    if backend.calls != distinct or len(ids) != distinct:
+        raise SystemExit("FAIL: duplicate queries were searched more than once")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--queries", type=int, default=8, help="Distinct queries")
+    parser.add_argument("--repeats", type=int, default=3, help="Spellings of each query in the batch")
+    parser.add_argument("--delay", type=float, default=1.0, help="Fake download time")
+    parser.add_argument("--search-delay", type=float, default=0.3, help="Fake search time")
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    ffmpeg_path = use_fake_tools()
+    os.environ["FAKE_YTDLP_DELAY"] = str(args.delay)
+    os.environ["FAKE_YTDLP_SEARCH_DELAY"] = str(args.search_delay)
+    converter.configure_limits(max_downloads=args.workers, max_transcodes=args.workers)
+
+    queries = [
+        query
+        for n in range(args.queries)
+        for query in variants(f"Artist {n} - Song Title", args.repeats)
+    ]
+    print(f"{len(queries)} queries ({args.queries} distinct), {args.workers} workers")
+    print(f"{'mode':<10} {'round':>6} {'seconds':>9} {'yt-dlp':>8} {'files':>7}")
+    run_mode("inline", None, queries, args.workers, ffmpeg_path)
+    run_mode("resolved", SearchResolver(YtDlpSearchBackend(), max_workers=8), queries, args.workers, ffmpeg_path)
+    check_stub(queries, args.queries)
+
+
+if __name__ == "__main__":
+    main()
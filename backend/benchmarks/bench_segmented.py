@@ -0,0 +1,136 @@
+"""
+Segmented MP3 encoding: one ffmpeg vs. segments on parallel processes.
+
+Needs a real ffmpeg (with libmp3lame and libopus). Generates --minutes of
+stereo audio as Opus in WebM (what YouTube serves), then encodes it to MP3
+with every MP3 profile twice: with the converter's single ffmpeg transcode
+and with SegmentedTranscoder on --processes transcode slots. Both outputs
+are decoded again to check that they have exactly the samples of the
+source (gapless: encoder delay and padding removed) and to compare the
+signal-to-noise ratio against the source around every segment seam.
+Exits non-zero if the sample counts differ or a seam is more than 1 dB
+worse than the same place in the single encode. Usage:
+
+    python benchmarks/bench_segmented.py --ffmpeg /usr/bin --minutes 30 --processes 4
+"""
+import argparse
+import array
+import math
+import os
+import resource
+import shutil
+import subprocess
+import threading
+import time
+
+from _common import temp_output_dir
+from bench_profiles import make_source
+
+from converter import _transcode, find_executable
+from profiles import PROFILES, codec_args
+from segmented import FRAME_SAMPLES, SegmentedTranscoder
+
+# Samples on both sides of a seam the SNR is computed over
+SEAM_WINDOW = 4096
+
+
+def children_cpu() -> float:
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def decode(ffmpeg: str, source: str, path: str) -> int:
+    """Decode source to mono 16-bit PCM at path and return its sample count"""
+    subprocess.run(
+        [ffmpeg, "-y", "-loglevel", "error", "-i", source, "-ac", "1", "-ar", "48000", "-f", "s16le", path],
+        check=True
+    )
+    return os.path.getsize(path) // 2
+
+
+def window(path: str, center: int) -> array.array:
+    samples = array.array("h")
+    start = max(0, center - SEAM_WINDOW)
+    with open(path, "rb") as f:
+        f.seek(start * 2)
+        samples.frombytes(f.read(2 * SEAM_WINDOW * 2))
+    return samples
+
+
+def snr(reference: array.array, decoded: array.array) -> float:
+    signal = sum(v * v for v in reference)
+    noise = sum((a - b) ** 2 for a, b in zip(reference, decoded))
+    return 10 * math.log10(signal / max(noise, 1))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--ffmpeg", default=None, help="Directory containing ffmpeg (default: PATH)")
+    parser.add_argument("--minutes", type=float, default=30.0, help="Length of the test signal")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1, help="Transcode slots of the segmented run")
+    parser.add_argument("--segment-seconds", type=float, default=120.0)
+    args = parser.parse_args()
+
+    ffmpeg = find_executable("ffmpeg", args.ffmpeg)
+    if ffmpeg is None:
+        raise SystemExit("ffmpeg not found; pass --ffmpeg DIR")
+    ffmpeg_dir = os.path.dirname(ffmpeg)
+
+    work_dir = temp_output_dir()
+    try:
+        source = os.path.join(work_dir, "source.webm")
+        make_source(ffmpeg, source, ["-codec:a", "libopus", "-b:a", "128k"], args.minutes * 60)
+        reference = os.path.join(work_dir, "reference.pcm")
+        source_samples = decode(ffmpeg, source, reference)
+        transcoder = SegmentedTranscoder(0, args.segment_seconds, max_workers=args.processes)
+        seams = [
+            n * round(args.segment_seconds * 48000 / FRAME_SAMPLES) * FRAME_SAMPLES
+            for n in range(1, int(args.minutes * 60 / args.segment_seconds) + 1)
+        ]
+        seams = [seam for seam in seams if seam + SEAM_WINDOW < source_samples]
+
+        print(f"{args.minutes:g} min test signal, {args.processes} processes, "
+              f"{args.segment_seconds:g} s segments ({len(seams)} seams), {os.cpu_count()} CPUs")
+        print(f"{'profile':<10} {'mode':<10} {'wall s':>8} {'cpu s':>8} {'samples':>12} {'kbit/s':>7} {'seam SNR dB':>12}")
+        failures = []
+        for profile in PROFILES.values():
+            if profile.extension != "mp3":
+                continue
+            audio_args = codec_args(profile, "opus")
+            measured = {}
+            for mode in ("single", "segmented"):
+                output = os.path.join(work_dir, f"{mode}.mp3")
+                before_cpu, before_wall = children_cpu(), time.perf_counter()
+                if mode == "single":
+                    result = _transcode(source, output, ffmpeg_dir, audio_args)
+                else:
+                    # The conversion holds one slot; the segments take the others while free
+                    slots = threading.BoundedSemaphore(args.processes)
+                    slots.acquire()
+                    result = transcoder.transcode(source, output, ffmpeg, audio_args, slots)
+                    slots.release()
+                if result is None or result.returncode != 0:
+                    raise SystemExit(f"{mode} encode failed: {result.stderr[:300] if result else 'not segmented'}")
+                cpu, wall = children_cpu() - before_cpu, time.perf_counter() - before_wall
+                decoded = os.path.join(work_dir, f"{mode}.pcm")
+                samples = decode(ffmpeg, output, decoded)
+                seam_snr = [snr(window(reference, seam), window(decoded, seam)) for seam in seams]
+                measured[mode] = (samples, seam_snr)
+                print(
+                    f"{profile.name:<10} {mode:<10} {wall:>8.2f} {cpu:>8.2f} {samples:>12} "
+                    f"{os.path.getsize(output) * 8 / (args.minutes * 60) / 1000:>7.0f} "
+                    f"{min(seam_snr, default=0):>12.2f}"
+                )
+                if samples != source_samples:
+                    failures.append(f"{profile.name} {mode}: {samples} samples, source has {source_samples}")
+            worst = [b - a for a, b in zip(measured["single"][1], measured["segmented"][1])]
+            if worst and min(worst) < -1.0:
+                failures.append(f"{profile.name}: a seam is {-min(worst):.2f} dB worse than in the single encode")
+        if failures:
+            raise SystemExit("FAIL: " + "; ".join(failures))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Time to first byte of streaming conversions vs. convert-then-download.
+
+Starts the API against the fake tools, with a generated WAV file as the
+media the fake yt-dlp "downloads" (paced over --delay seconds). Compares
+how long a client waits for the first audio byte via /api/convert +
+/api/download and via /api/stream, and checks that readers joining an
+in-progress stream (a second /api/stream and /api/download of its
+X-File-Id) receive byte-identical output. Usage:
+
+    python benchmarks/bench_streaming.py --delay 4 --seconds 30
+"""
+import argparse
+import http.client
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+import urllib.parse
+
+from _common import start_server, temp_output_dir
+from media_server import write_sine_wav
+
+
+def fetch(base_url: str, path: str, method: str = "GET", body: dict = None) -> dict:
+    """Request path, recording the time to the first body byte and to the end"""
+    url = urllib.parse.urlparse(base_url)
+    connection = http.client.HTTPConnection(url.hostname, url.port, timeout=120)
+    start = time.perf_counter()
+    try:
+        payload = json.dumps(body).encode() if body is not None else None
+        connection.request(method, path, body=payload, headers={"Content-Type": "application/json"})
+        response = connection.getresponse()
+        first = response.read1(1)
+        first_byte = time.perf_counter() - start
+        data = first + response.read()
+        return {
+            'status': response.status,
+            'headers': {k.lower(): v for k, v in response.getheaders()},
+            'body': data,
+            'firstByte': first_byte,
+            'total': time.perf_counter() - start,
+        }
+    finally:
+        connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--delay", type=float, default=4.0, help="Fake download time per item")
+    parser.add_argument("--seconds", type=float, default=30.0, help="Length of the generated audio")
+    args = parser.parse_args()
+
+    output_dir = temp_output_dir()
+    source = os.path.join(output_dir, ".source.wav")
+    write_sine_wav(source, args.seconds)
+    with open(source, "rb") as f:
+        expected = f.read()
+
+    server, base_url = start_server(
+        output_dir,
+        FAKE_YTDLP_SOURCE=source,
+        FAKE_YTDLP_DELAY=str(args.delay),
+        FAKE_FFMPEG_DELAY="0",
+        # Tags would make the converted file differ from the source
+        TAGGING_ENABLED="false",
+    )
+    failures = 0
+    try:
+        converted = fetch(base_url, "/api/convert", "POST", {
+            "urls": ["https://www.youtube.com/watch?v=convertAAAA"], "searchQueries": []
+        })
+        file_id = json.loads(converted['body'])['results'][0]['id']
+        download = fetch(base_url, f"/api/download/{file_id}")
+
+        stream_path = "/api/stream?url=" + urllib.parse.quote("https://www.youtube.com/watch?v=streamBBBBB")
+        results = {}
+        leader = threading.Thread(target=lambda: results.update(leader=fetch(base_url, stream_path)))
+        leader.start()
+        time.sleep(args.delay / 2)
+        joiner = fetch(base_url, stream_path)
+        stream_id = joiner['headers'].get('x-file-id')
+        follower = fetch(base_url, f"/api/download/{stream_id}")
+        leader.join()
+        leader_result = results['leader']
+        finished = fetch(base_url, f"/api/download/{stream_id}")
+        cached = fetch(base_url, stream_path)
+
+        print(f"{'path':<36} {'first byte':>11} {'total':>8}")
+        print(f"{'convert + download':<36} {converted['total'] + download['firstByte']:>10.2f}s "
+              f"{converted['total'] + download['total']:>7.2f}s")
+        print(f"{'stream (leader)':<36} {leader_result['firstByte']:>10.2f}s {leader_result['total']:>7.2f}s")
+        print(f"{'stream (joined after delay/2)':<36} {joiner['firstByte']:>10.2f}s {joiner['total']:>7.2f}s")
+        print()
+        checks = [
+            ("convert + download is byte-exact", download['body'] == expected),
+            ("leader stream is byte-exact", leader_result['body'] == expected),
+            ("joined stream is byte-exact", joiner['body'] == expected),
+            ("download of an in-progress stream is byte-exact", follower['body'] == expected),
+            ("finished stream is served from the index", finished['status'] == 200
+             and finished['headers'].get('content-length') == str(len(expected)) and finished['body'] == expected),
+            ("repeated stream is a cache hit", cached['body'] == expected and cached['headers'].get('x-file-id') != stream_id
+             and cached['total'] < args.delay / 2),
+        ]
+        for name, ok in checks:
+            failures += not ok
+            print(f"{'ok' if ok else 'FAIL':>4}  {name}")
+    finally:
+        server.terminate()
+        server.wait()
+        shutil.rmtree(output_dir, ignore_errors=True)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+Tagging stage: tagging inside the conversion worker vs. a pipelined pool.
+
+Converts a batch with the fake yt-dlp/ffmpeg and tags every file with ID3v2
+tags and cover art. Thumbnails come from a local server answering after
+--thumb-delay seconds, standing in for i.ytimg.com. In "inline" mode each
+worker waits for its file to be tagged before taking the next item; in
+"pipelined" mode the worker moves on and the tagging pool catches up.
+Each mode runs twice: the second round finds the thumbnails in the cache.
+Finally checks that the tags were written in place (same inode) and read
+back correctly. Usage:
+
+    python benchmarks/bench_tagging.py --items 16 --workers 2 --delay 0.5 --thumb-delay 0.5
+"""
+import argparse
+import http.server
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from _common import use_fake_tools, temp_output_dir
+
+import converter
+from storage import FileIndex
+from tagging import Tagger, TaggingStage, ThumbnailCache
+
+# Smallest byte string image_mime() accepts as a JPEG, padded to a thumbnail's size
+FAKE_JPEG = b"\xff\xd8\xff\xe0" + b"\0" * 20000
+
+
+def serve_thumbnails(delay: float):
+    """Thumbnail server answering every path with FAKE_JPEG after delay seconds"""
+    counter = {'requests': 0}
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            counter['requests'] += 1
+            time.sleep(delay)
+            self.send_response(200)
+            self.send_header("Content-Type", "image/jpeg")
+            self.send_header("Content-Length", str(len(FAKE_JPEG)))
+            self.end_headers()
+            self.wfile.write(FAKE_JPEG)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}", counter
+
+
+def run_mode(name: str, urls: list, args, ffmpeg_path: str, counter: dict) -> None:
+    output_dir = temp_output_dir()
+    index = FileIndex(os.path.join(output_dir, ".index", "files.sqlite3"), output_dir)
+    thumbnails = ThumbnailCache(os.path.join(output_dir, ".thumbnails"))
+    stage = TaggingStage(Tagger(thumbnails), max_workers=args.tag_workers)
+    converter.configure_file_index(index)
+    converter.configure_tagging(stage)
+    inline = name == "inline"
+
+    def convert(url):
+        result = converter.convert_single(url, output_dir, ffmpeg_path, profile="mp3-128")
+        pending = converter.pending_tagging(result['id'])
+        if inline and pending is not None:
+            pending.result()
+        return result
+
+    try:
+        for round_number in (1, 2):
+            before = counter['requests']
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=args.workers) as pool:
+                results = list(pool.map(convert, urls))
+            converted = time.perf_counter() - start
+            for result in results:
+                pending = converter.pending_tagging(result['id'])
+                if pending is not None:
+                    pending.result()
+            elapsed = time.perf_counter() - start
+            failed = [r for r in results if not r['success']]
+            if failed:
+                raise SystemExit(f"{name}: {len(failed)} items failed, first error: {failed[0]['error']}")
+            print(
+                f"{name:<10} {round_number:>6} {converted:>10.2f} {elapsed:>9.2f} "
+                f"{counter['requests'] - before:>7}"
+            )
+        check_tags(index, results)
+        print(f"{'':<10} tagging stats: {stage.stats()}")
+    finally:
+        converter.configure_tagging(None)
+        converter.configure_file_index(None)
+        stage.shutdown()
+        shutil.rmtree(output_dir, ignore_errors=True)
+
+
+def check_tags(index: FileIndex, results: list) -> None:
+    from mutagen.id3 import ID3
+
+    for result in results:
+        record = index.get(result['id'])
+        if record is None:
+            raise SystemExit(f"FAIL: {result['id']} was never registered")
+        tags = ID3(record['path'])
+        if str(tags['TIT2']) != result['title'] or tags.getall('APIC')[0].data != FAKE_JPEG:
+            raise SystemExit(f"FAIL: wrong tags in {record['path']}")
+        if record['size'] != os.path.getsize(record['path']):
+            raise SystemExit("FAIL: indexed size is not the size of the tagged file")
+
+
+def check_in_place() -> None:
+    """Tagging a file keeps its inode, i.e. it is edited rather than replaced"""
+    output_dir = temp_output_dir()
+    try:
+        path = os.path.join(output_dir, "audio.mp3")
+        with open(path, "wb") as f:
+            f.write(b"\0" * 1024 * 1024)
+        inode = os.stat(path).st_ino
+        Tagger().tag(path, {'title': "Title", 'uploader': "Channel", 'year': "2024"})
+        if os.stat(path).st_ino != inode:
+            raise SystemExit("FAIL: tagging replaced the file")
+        print("\ntags written in place (inode unchanged)")
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--items", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=2, help="Conversion workers")
+    parser.add_argument("--tag-workers", type=int, default=2)
+    parser.add_argument("--delay", type=float, default=0.5, help="Fake download time")
+    parser.add_argument("--thumb-delay", type=float, default=0.5, help="Thumbnail server response time")
+    args = parser.parse_args()
+
+    ffmpeg_path = use_fake_tools()
+    os.environ["FAKE_YTDLP_DELAY"] = str(args.delay)
+    server, base_url, counter = serve_thumbnails(args.thumb_delay)
+    os.environ["FAKE_YTDLP_THUMBNAIL"] = base_url + "/{id}.jpg"
+    converter.configure_limits(max_downloads=args.workers, max_transcodes=args.workers)
+    converter.configure_cache(None)
+
+    urls = [f"https://www.youtube.com/watch?v=tag{n:08d}" for n in range(args.items)]
+    print(f"{args.items} items, {args.workers} workers, {args.tag_workers} tagging workers")
+    print(f"{'mode':<10} {'round':>6} {'converted':>10} {'tagged':>9} {'thumbs':>7}")
+    try:
+        run_mode("inline", urls, args, ffmpeg_path, counter)
+        run_mode("pipelined", urls, args, ffmpeg_path, counter)
+        check_in_place()
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Upstream throttling: fixed vs. adaptive download concurrency, and retries.
+
+The fake yt-dlp answers HTTP 429 to downloads above --upstream-limit at
+once (FAKE_YTDLP_MAX_CONCURRENT). A batch of --items URLs is converted on
+--workers threads with MAX_CONCURRENT_DOWNLOADS = --workers in three modes:
+no retries with a fixed limit (the old behaviour), retries with a fixed
+limit, and retries with the adaptive (AIMD) limit. Then checks the failure
+classes with injected failure patterns: "transient,throttled,ok" converts
+every item on its third attempt, "geo_blocked" fails every item at once.
+Usage:
+
+    python benchmarks/bench_upstream.py --items 60 --workers 8 --upstream-limit 3 --delay 0.5
+"""
+import argparse
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from _common import use_fake_tools, temp_output_dir
+
+import converter
+from upstream import RetryPolicy
+
+MODES = (
+    # name, retries, adaptive
+    ("fixed, no retries", 0, False),
+    ("fixed + retries", 6, False),
+    ("adaptive + retries", 6, True),
+)
+
+
+def run_batch(urls: list, workers: int, ffmpeg_path: str) -> tuple:
+    output_dir = temp_output_dir()
+    try:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(lambda url: converter.convert_single(url, output_dir, ffmpeg_path), urls))
+        return results, time.perf_counter() - start
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+
+
+def configure(args, retries: int, adaptive: bool) -> None:
+    converter.configure_limits(
+        max_downloads=args.workers,
+        max_transcodes=args.workers,
+        min_downloads=1 if adaptive else args.workers
+    )
+    converter.configure_retries(RetryPolicy(
+        max_retries=retries, base_delay=args.delay / 4, throttled_delay=args.delay, max_delay=args.delay * 8
+    ))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--items", type=int, default=60)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--upstream-limit", type=int, default=3, help="Concurrent downloads the fake upstream accepts")
+    parser.add_argument("--delay", type=float, default=0.5, help="Fake download time")
+    args = parser.parse_args()
+
+    ffmpeg_path = use_fake_tools()
+    state_dir = temp_output_dir()
+    os.environ["FAKE_YTDLP_DELAY"] = str(args.delay)
+    os.environ["FAKE_YTDLP_STATE_DIR"] = state_dir
+    converter.configure_cache(None)
+
+    try:
+        os.environ["FAKE_YTDLP_MAX_CONCURRENT"] = str(args.upstream_limit)
+        print(f"{args.items} items, {args.workers} workers, upstream accepts {args.upstream_limit} downloads at once")
+        print(f"{'mode':<20} {'ok':>4} {'failed':>7} {'429s':>6} {'retries':>8} {'limit':>6} {'seconds':>8}")
+        for run, (name, retries, adaptive) in enumerate(MODES):
+            configure(args, retries, adaptive)
+            urls = [f"https://www.youtube.com/watch?v=ups{run}{n:07d}" for n in range(args.items)]
+            results, elapsed = run_batch(urls, args.workers, ffmpeg_path)
+            stats = converter.upstream_stats()
+            ok = sum(1 for r in results if r['success'])
+            print(f"{name:<20} {ok:>4} {len(results) - ok:>7} {stats['outcomes'].get('throttled', 0):>6} "
+                  f"{stats['retries']:>8} {stats['limit']:>6} {elapsed:>8.2f}")
+            if retries and ok != args.items:
+                raise SystemExit(f"FAIL: {args.items - ok} items failed with retries enabled")
+        del os.environ["FAKE_YTDLP_MAX_CONCURRENT"]
+
+        print()
+        for run, (pattern, expect_success, expect_kind) in enumerate((
+            ("transient,throttled,ok", True, None),
+            ("geo_blocked", False, "geo_blocked"),
+        )):
+            os.environ["FAKE_YTDLP_FAILURES"] = pattern
+            configure(args, 3, True)
+            urls = [f"https://www.youtube.com/watch?v=pat{run}{n:07d}" for n in range(args.workers)]
+            results, elapsed = run_batch(urls, args.workers, ffmpeg_path)
+            stats = converter.upstream_stats()
+            attempts = sum(stats['outcomes'].values())
+            print(f"pattern {pattern!r}: {sum(r['success'] for r in results)}/{len(results)} converted, "
+                  f"{attempts} attempts, error kinds {sorted({r.get('errorKind') for r in results}, key=str)}")
+            if any(r['success'] != expect_success or r.get('errorKind') != expect_kind for r in results):
+                raise SystemExit(f"FAIL: unexpected results for pattern {pattern!r}")
+            if attempts != len(results) * (3 if expect_success else 1):
+                raise SystemExit(f"FAIL: {attempts} attempts for pattern {pattern!r}")
+    finally:
+        shutil.rmtree(state_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
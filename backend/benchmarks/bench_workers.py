@@ -0,0 +1,115 @@
+"""
+Worker mode: throughput with 1 vs. N worker processes, and a worker crash.
+
+Queues --items fake video URLs on a SQLite broker through RemoteConverter
+(what an API node does) and converts them with worker.py processes using
+the fake yt-dlp/ffmpeg: once with a single worker process and once with
+--processes of them. Then kills a worker with SIGKILL in the middle of a
+batch and starts a fresh one, checking that the tasks the dead worker held
+are handed out again once their lease runs out and every item converts.
+Usage:
+
+    python benchmarks/bench_workers.py --items 40 --processes 4 --concurrency 2 --delay 0.5
+"""
+import argparse
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import time
+
+from _common import BACKEND_DIR, use_fake_tools, temp_output_dir
+
+from broker import RemoteConverter, SQLiteBroker
+from storage import FileIndex
+
+WORKER = os.path.join(BACKEND_DIR, "worker.py")
+
+
+def start_workers(count: int, output_dir: str, broker_path: str, args, lease: float = 60) -> list:
+    env = dict(
+        os.environ,
+        OUTPUT_DIR=output_dir,
+        BROKER="sqlite",
+        BROKER_URL=broker_path,
+        WORKER_CONCURRENCY=str(args.concurrency),
+        WORKER_LEASE_SECONDS=str(lease),
+        TAGGING_ENABLED="false",
+    )
+    return [
+        subprocess.Popen([sys.executable, WORKER], env=env, stderr=subprocess.DEVNULL)
+        for _ in range(count)
+    ]
+
+
+def stop_workers(processes: list) -> None:
+    for process in processes:
+        if process.poll() is None:
+            process.send_signal(signal.SIGTERM)
+    for process in processes:
+        process.wait(timeout=30)
+
+
+def convert(remote: RemoteConverter, urls: list) -> list:
+    return [future.result() for future in remote.submit_batch(urls, [])]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--items", type=int, default=40)
+    parser.add_argument("--processes", type=int, default=4, help="Worker processes of the parallel run")
+    parser.add_argument("--concurrency", type=int, default=2, help="WORKER_CONCURRENCY of each worker")
+    parser.add_argument("--delay", type=float, default=0.5, help="Fake download time per item")
+    parser.add_argument("--lease", type=float, default=3.0, help="Worker lease of the crash run")
+    args = parser.parse_args()
+
+    os.environ["FFMPEG_PATH"] = use_fake_tools()
+    os.environ["FAKE_YTDLP_DELAY"] = str(args.delay)
+    os.environ["SEARCH_BACKEND"] = "off"
+    print(f"{args.items} items, {args.delay}s fake download each, {args.concurrency} conversions per worker")
+
+    for run, processes in enumerate((1, args.processes, None)):
+        output_dir = temp_output_dir()
+        broker_path = os.path.join(output_dir, ".broker", "tasks.sqlite3")
+        remote = RemoteConverter(SQLiteBroker(broker_path), output_dir, FileIndex(":memory:", output_dir, seed=False))
+        urls = [f"https://www.youtube.com/watch?v=wrk{run}{n:07d}" for n in range(args.items)]
+        try:
+            if processes is not None:
+                workers = start_workers(processes, output_dir, broker_path, args)
+                start = time.perf_counter()
+                results = convert(remote, urls)
+                elapsed = time.perf_counter() - start
+                stop_workers(workers)
+            else:
+                workers = start_workers(1, output_dir, broker_path, args, lease=args.lease)
+                futures = remote.submit_batch(urls, [])
+                while remote.stats()['running'] == 0:
+                    time.sleep(0.05)
+                time.sleep(args.delay / 2)
+                held = remote.stats()['running']
+                workers[0].kill()
+                workers[0].wait()
+                start = time.perf_counter()
+                workers = start_workers(1, output_dir, broker_path, args, lease=args.lease)
+                results = [future.result() for future in futures]
+                elapsed = time.perf_counter() - start
+                stop_workers(workers)
+            failed = [r for r in results if not r['success']]
+            if failed:
+                raise SystemExit(f"FAIL: {len(failed)} items failed, first error: {failed[0]['error']}")
+            missing = [r for r in results if not os.path.exists(remote.file_index.get(r['id'])['path'])]
+            if missing:
+                raise SystemExit(f"FAIL: {len(missing)} converted files are missing")
+            if processes is not None:
+                print(f"{processes:>2} worker processes: {elapsed:6.2f} s  {args.items * 60 / elapsed:7.1f} items/min")
+            else:
+                print(f"\nkilled a worker holding {held} tasks; a new worker finished all "
+                      f"{len(results)} items in {elapsed:.2f} s (lease {args.lease} s)")
+        finally:
+            remote.stop()
+            shutil.rmtree(output_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Peak memory of streamed ZIP archives as the number of files grows.
+
+For every file count, a child process streams a ZIP of that many MP3-sized
+files through archive.stream_zip() (discarding the output) and reports its
+peak RSS. With a bounded buffer the peak stays flat no matter how large the
+archive gets. Files are sparse, so the run needs little real disk space.
+Usage:
+
+    python benchmarks/bench_zip_memory.py --files 10 100 500 --size-mb 5
+"""
+import argparse
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import time
+
+from _common import temp_output_dir
+
+from archive import stream_zip
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+
+def child(directory: str, count: int) -> None:
+    entries = [(f"track{i:05d}.mp3", os.path.join(directory, f"{i:05d}.mp3")) for i in range(count)]
+    baseline = peak_rss_mb()
+    start = time.perf_counter()
+    total = sum(len(chunk) for chunk in stream_zip(entries))
+    elapsed = time.perf_counter() - start
+    print(f"{count} {total} {elapsed} {baseline} {peak_rss_mb()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--files", type=int, nargs="+", default=[10, 100, 500])
+    parser.add_argument("--size-mb", type=float, default=5.0)
+    parser.add_argument("--child", nargs=2, metavar=("DIR", "COUNT"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child[0], int(args.child[1]))
+        return
+
+    directory = temp_output_dir()
+    try:
+        for i in range(max(args.files)):
+            with open(os.path.join(directory, f"{i:05d}.mp3"), "wb") as f:
+                f.truncate(int(args.size_mb * 1024 * 1024))
+
+        print(f"{'files':>6} {'archive MB':>11} {'MB/s':>8} {'base RSS MB':>12} {'peak RSS MB':>12}")
+        for count in args.files:
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--child", directory, str(count)],
+                capture_output=True, text=True, check=True
+            ).stdout.split()
+            count, total, elapsed, baseline, peak = int(output[0]), int(output[1]), *map(float, output[2:])
+            size_mb = total / 1024 ** 2
+            print(f"{count:>6} {size_mb:>11.0f} {size_mb / elapsed:>8.0f} {baseline:>12.1f} {peak:>12.1f}")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Conformance check of the disk watermark with hardlinked conversion cache entries.
+
+Fills an output directory with indexed files that are all hardlinked into
+a ConversionCache (as conversions are by default), reports the volume as
+above the high watermark and runs FileCleanupService.enforce_disk_watermark:
+it must free the requested space by evicting the cache entries of the
+files it deletes, and keep the newer files indexed. A second run with files
+whose space cannot be freed (another hardlink outside the output directory)
+must give up after MAX_UNRELEASED_DELETIONS instead of emptying the index.
+Exits non-zero on the first failure. Usage:
+
+    python benchmarks/check_cleanup_watermark.py --files 20
+"""
+import argparse
+import os
+import shutil
+import sys
+from collections import namedtuple
+
+from _common import temp_output_dir
+
+import cleanup
+from cache import ConversionCache
+from cleanup import MAX_UNRELEASED_DELETIONS, FileCleanupService
+from storage import FileIndex, shard_dir
+
+FILE_SIZE = 100 * 1024
+FILE_ID = "{:08d}-0000-4000-8000-000000000000"
+DiskUsage = namedtuple("DiskUsage", "total used free")
+
+
+def check(name: str, condition: bool) -> None:
+    print(f"{'ok' if condition else 'FAIL':>4}  {name}")
+    if not condition:
+        sys.exit(1)
+
+
+def populate(output_dir: str, count: int, cache: ConversionCache, extra_links_dir: str = None) -> FileIndex:
+    """Index count files, each cached under a video id of its own, oldest first"""
+    file_index = FileIndex(":memory:", output_dir, seed=False)
+    for n in range(count):
+        file_id = FILE_ID.format(n)
+        path = os.path.join(shard_dir(output_dir, file_id), f"{file_id}_Track {n}.mp3")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(os.urandom(FILE_SIZE))
+        cache.put(f"video{n:06d}", "mp3", "v0", path, {'title': f"Track {n}"})
+        if extra_links_dir is not None:
+            os.link(path, os.path.join(extra_links_dir, os.path.basename(path)))
+        file_index.add(file_id, path, size=FILE_SIZE, created_at=1000.0 + n)
+    return file_index
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--files", type=int, default=20, help="Cache-linked files of the first check")
+    args = parser.parse_args()
+
+    # The volume is reported at 95% of 100 files; freeing down to 90% takes 5 files
+    total = 100 * FILE_SIZE
+    cleanup.shutil.disk_usage = lambda path: DiskUsage(total, total * 95 // 100, total * 5 // 100)
+
+    output_dir = temp_output_dir()
+    try:
+        cache = ConversionCache(os.path.join(output_dir, ".cache"), max_bytes=10 * 1024 ** 3)
+        file_index = populate(output_dir, args.files, cache)
+        service = FileCleanupService(
+            output_dir, cache=cache, file_index=file_index, high_watermark=92, low_watermark=90
+        )
+        deleted = service.enforce_disk_watermark()
+        check(f"deletes 5 of {args.files} cache-linked files ({deleted})", deleted == 5)
+        check("evicts the cache entries of the deleted files", cache.stats()['entries'] == args.files - 5)
+        check("keeps the newer files indexed", len(file_index) == args.files - 5)
+        check("deletes the oldest files",
+              file_index.get(FILE_ID.format(4)) is None and file_index.get(FILE_ID.format(5)) is not None)
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+
+    output_dir = temp_output_dir()
+    try:
+        count = MAX_UNRELEASED_DELETIONS + 50
+        cache = ConversionCache(os.path.join(output_dir, ".cache"), max_bytes=10 * 1024 ** 3)
+        extra_links_dir = os.path.join(output_dir, ".elsewhere")
+        os.makedirs(extra_links_dir)
+        file_index = populate(output_dir, count, cache, extra_links_dir)
+        service = FileCleanupService(
+            output_dir, cache=cache, file_index=file_index, high_watermark=92, low_watermark=90
+        )
+        deleted = service.enforce_disk_watermark()
+        check(f"stops after {MAX_UNRELEASED_DELETIONS} deletions that free nothing ({deleted})",
+              deleted == MAX_UNRELEASED_DELETIONS)
+        check("keeps the rest of the index", len(file_index) == count - MAX_UNRELEASED_DELETIONS)
+        check("keeps cache entries still linked elsewhere", cache.stats()['entries'] == count)
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
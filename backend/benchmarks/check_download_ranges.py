@@ -0,0 +1,123 @@
+"""
+Conformance check of /api/download: ranges, validators and conditional GET.
+
+Starts the API against a fixture file of random bytes and checks byte-exact
+single, suffix, open-ended and multipart ranges, 416 for unsatisfiable
+ranges, 304 for If-None-Match/If-Modified-Since, If-Range, HEAD and
+?inline=1. Exits non-zero on the first mismatch. Usage:
+
+    python benchmarks/check_download_ranges.py
+"""
+import email.parser
+import http.client
+import os
+import shutil
+import sys
+import urllib.parse
+
+from _common import start_server, temp_output_dir
+
+FILE_ID = "0123abcd-0000-4000-8000-000000000000"
+DISPLAY_NAME = "Fixture Mix.mp3"
+
+
+def request(base_url: str, path: str, method: str = "GET", headers: dict = None):
+    url = urllib.parse.urlparse(base_url)
+    connection = http.client.HTTPConnection(url.hostname, url.port, timeout=10)
+    try:
+        connection.request(method, path, headers=headers or {})
+        response = connection.getresponse()
+        return response.status, {k.lower(): v for k, v in response.getheaders()}, response.read()
+    finally:
+        connection.close()
+
+
+def parse_multipart(content_type: str, body: bytes) -> list:
+    message = email.parser.BytesParser().parsebytes(f"Content-Type: {content_type}\r\n\r\n".encode() + body)
+    return [(part["Content-Range"], part.get_payload(decode=True)) for part in message.get_payload()]
+
+
+def check(name: str, condition: bool) -> None:
+    print(f"{'ok' if condition else 'FAIL':>4}  {name}")
+    if not condition:
+        sys.exit(1)
+
+
+def main():
+    output_dir = temp_output_dir()
+    data = os.urandom(300 * 1024 + 7)
+    size = len(data)
+    with open(os.path.join(output_dir, f"{FILE_ID}_{DISPLAY_NAME}"), "wb") as f:
+        f.write(data)
+
+    server, base_url = start_server(output_dir)
+    path = f"/api/download/{FILE_ID}"
+    try:
+        status, headers, body = request(base_url, path)
+        check("full GET is 200 and byte-exact", status == 200 and body == data)
+        check("Accept-Ranges, ETag and Last-Modified are sent",
+              headers.get("accept-ranges") == "bytes" and "etag" in headers and "last-modified" in headers)
+        check("attachment disposition by default", headers["content-disposition"].startswith("attachment"))
+        etag, last_modified = headers["etag"], headers["last-modified"]
+
+        status, headers, body = request(base_url, path, headers={"Range": "bytes=0-99"})
+        check("single range", status == 206 and body == data[:100]
+              and headers["content-range"] == f"bytes 0-99/{size}" and headers["content-length"] == "100")
+
+        status, headers, body = request(base_url, path, headers={"Range": "bytes=-500"})
+        check("suffix range", status == 206 and body == data[-500:]
+              and headers["content-range"] == f"bytes {size - 500}-{size - 1}/{size}")
+
+        status, headers, body = request(base_url, path, headers={"Range": "bytes=300000-"})
+        check("open-ended range", status == 206 and body == data[300000:])
+
+        status, headers, body = request(base_url, path, headers={"Range": "bytes=10-19, 1000-1999, -3"})
+        parts = parse_multipart(headers["content-type"], body) if status == 206 else []
+        check("multi-range is multipart/byteranges", headers["content-type"].startswith("multipart/byteranges"))
+        check("multi-range parts are byte-exact", parts == [
+            ("bytes 10-19/%d" % size, data[10:20]),
+            ("bytes 1000-1999/%d" % size, data[1000:2000]),
+            (f"bytes {size - 3}-{size - 1}/{size}", data[-3:]),
+        ] and headers["content-length"] == str(len(body)))
+
+        status, headers, body = request(base_url, path, headers={"Range": "bytes=0-9,5-19"})
+        check("overlapping ranges are coalesced", status == 206 and body == data[:20])
+
+        status, headers, _ = request(base_url, path, headers={"Range": f"bytes={size}-"})
+        check("unsatisfiable range is 416", status == 416 and headers.get("content-range") == f"bytes */{size}")
+
+        status, headers, body = request(base_url, path, headers={"Range": "items=0-5"})
+        check("unknown range unit sends the whole file", status == 200 and body == data)
+
+        status, headers, body = request(base_url, path, headers={"If-None-Match": etag})
+        check("If-None-Match with current ETag is 304", status == 304 and body == b"" and headers.get("etag") == etag)
+
+        status, _, body = request(base_url, path, headers={"If-None-Match": '"stale"'})
+        check("If-None-Match with another ETag is 200", status == 200 and body == data)
+
+        status, _, _ = request(base_url, path, headers={"If-Modified-Since": last_modified})
+        check("If-Modified-Since at Last-Modified is 304", status == 304)
+
+        status, _, body = request(base_url, path, headers={"Range": "bytes=0-9", "If-Range": etag})
+        check("If-Range with current ETag honours the range", status == 206 and body == data[:10])
+
+        status, _, body = request(base_url, path, headers={"Range": "bytes=0-9", "If-Range": '"stale"'})
+        check("If-Range with another ETag sends the whole file", status == 200 and body == data)
+
+        status, headers, body = request(base_url, path, method="HEAD", headers={"Range": "bytes=0-9"})
+        check("HEAD sends headers only", status == 206 and body == b"" and headers["content-length"] == "10")
+
+        status, headers, body = request(base_url, path + "?inline=1")
+        check("?inline=1 sets an inline disposition",
+              status == 200 and headers["content-disposition"] == f'inline; filename="{DISPLAY_NAME}"')
+
+        status, _, _ = request(base_url, "/api/download/ffffffff-0000-4000-8000-000000000000")
+        check("unknown id is 404", status == 404)
+    finally:
+        server.terminate()
+        server.wait()
+        shutil.rmtree(output_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Event loop responsiveness under long conversions.
+
+Starts the API with uvicorn against the fake yt-dlp/ffmpeg tools, measures
+/api/health and /api/download latency while idle, then again while slow
+conversions are running. With a blocking /api/convert the second set of
+numbers jumps to the conversion time; it should stay flat. Usage:
+
+    python benchmarks/load_event_loop.py --conversions 4 --delay 5
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import threading
+import time
+import urllib.parse
+import urllib.request
+
+from _common import start_server, temp_output_dir
+
+
+def timed_get(url: str) -> float:
+    start = time.perf_counter()
+    urllib.request.urlopen(url, timeout=60).read()
+    return (time.perf_counter() - start) * 1000
+
+
+def sample(urls, duration: float) -> dict:
+    latencies = {url: [] for url in urls}
+    deadline = time.time() + duration
+    while time.time() < deadline:
+        for url in urls:
+            latencies[url].append(timed_get(url))
+        time.sleep(0.05)
+    return latencies
+
+
+def post_convert(base_url: str, count: int) -> None:
+    body = json.dumps({
+        "urls": [f"https://www.youtube.com/watch?v=load{i:07d}" for i in range(count)],
+        "searchQueries": []
+    }).encode()
+    request = urllib.request.Request(
+        base_url + "/api/convert", data=body, headers={"Content-Type": "application/json"}
+    )
+    urllib.request.urlopen(request, timeout=600).read()
+
+
+def report(label: str, latencies: dict) -> None:
+    for url, values in latencies.items():
+        values = sorted(values)
+        p95 = values[int(len(values) * 0.95) - 1] if len(values) > 1 else values[0]
+        path = urllib.parse.urlparse(url).path
+        print(f"{label:>7} {path:<56} n={len(values):<4} p50={statistics.median(values):7.1f}ms "
+              f"p95={p95:7.1f}ms max={values[-1]:7.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--conversions", type=int, default=4, help="Items in the slow batch")
+    parser.add_argument("--delay", type=float, default=5.0, help="Fake download time per item")
+    args = parser.parse_args()
+
+    output_dir = temp_output_dir()
+    file_id = "00000000-0000-0000-0000-000000000000"
+    with open(os.path.join(output_dir, f"{file_id}_fixture.mp3"), "wb") as f:
+        f.write(b"\0" * 256 * 1024)
+
+    server, base_url = start_server(
+        output_dir,
+        FAKE_YTDLP_DELAY=str(args.delay),
+        CONVERSION_WORKERS=str(args.conversions),
+    )
+    try:
+        urls = [base_url + "/api/health", base_url + f"/api/download/{file_id}"]
+
+        report("idle", sample(urls, duration=2.0))
+
+        converting = threading.Thread(target=post_convert, args=(base_url, args.conversions))
+        converting.start()
+        time.sleep(0.2)
+        report("busy", sample(urls, duration=max(1.0, args.delay - 0.5)))
+        converting.join()
+    finally:
+        server.terminate()
+        server.wait()
+        shutil.rmtree(output_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
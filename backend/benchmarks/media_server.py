@@ -0,0 +1,51 @@
+"""Local media fixtures for the offline benchmarks"""
+import http.server
+import math
+import struct
+import threading
+import wave
+from functools import partial
+
+
+def write_sine_wav(path: str, seconds: float, sample_rate: int = 44100, frequency: float = 440.0) -> None:
+    """Write a mono 16-bit sine tone WAV file"""
+    frames = int(seconds * sample_rate)
+    period = [
+        int(12000 * math.sin(2 * math.pi * frequency * n / sample_rate))
+        for n in range(sample_rate)
+    ]
+    one_second = struct.pack(f"<{sample_rate}h", *period)
+    with wave.open(path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        whole, rest = divmod(frames, sample_rate)
+        for _ in range(whole):
+            f.writeframes(one_second)
+        f.writeframes(one_second[:rest * 2])
+
+
+class _QuietHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class _QuietServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients (yt-dlp probing a direct link) routinely hang up mid-response
+        pass
+
+
+def serve_directory(directory: str):
+    """
+    Serve a directory over HTTP on a free localhost port in a background thread.
+
+    Returns:
+        (server, base_url); call server.shutdown() when done
+    """
+    handler = partial(_QuietHandler, directory=directory)
+    server = _QuietServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
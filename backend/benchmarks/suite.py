@@ -0,0 +1,380 @@
+"""
+End-to-end offline benchmark suite with JSON results and baseline comparison.
+
+Runs scripted workloads against the real API (uvicorn, one fresh server and
+output directory per workload) with the fake yt-dlp/ffmpeg. The fake
+yt-dlp fetches a generated WAV file from a local HTTP media server after
+--delay seconds, so downloads move real bytes over a socket without any
+network access. Workloads:
+
+    single          single-item POST /api/convert requests, one after another
+    batch           one --batch item job (POST /api/jobs), per-item completion latency
+    hot_cache       --cache-items videos converted once, then requested again (cache hits)
+    download_storm  GET /api/download on --files indexed files from --concurrency clients
+    cleanup         --files files expiring at once, /api/health latency while they are deleted
+
+For each workload it reports throughput, p50/p95/p99 latency, and the CPU
+time (including the fake tools it ran) and peak RSS of the server process,
+read from /proc (Linux). Results are saved as JSON (--out); with
+--baseline, every metric is compared against a stored run and the suite
+exits non-zero if one is worse by more than --tolerance. Usage:
+
+    python benchmarks/suite.py --out benchmarks/results/before.json
+    python benchmarks/suite.py --workloads single batch --baseline benchmarks/results/before.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import sys
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from _common import BENCH_DIR, start_server, temp_output_dir
+from media_server import serve_directory, write_sine_wav
+
+from storage import FileIndex, shard_dir
+
+# Metrics compared against a baseline: (key, True if higher is better)
+COMPARED = (
+    ("throughput", True),
+    ("latencyMs.p50", False),
+    ("latencyMs.p95", False),
+    ("latencyMs.p99", False),
+    ("serverCpuSeconds", False),
+    ("serverPeakRssMb", False),
+)
+
+# Seconds after indexing at which the files of the cleanup workload expire
+EXPIRY_DELAY = 10
+
+# Hard links made to one payload file (ext4 allows 65000 per inode)
+LINKS_PER_PAYLOAD = 50000
+
+# Latencies below this many milliseconds are not compared (timer and scheduling noise)
+MIN_COMPARED_LATENCY_MS = 5.0
+
+
+def latency_summary(values_ms: list) -> dict:
+    ordered = sorted(values_ms)
+
+    def percentile(share: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(share * len(ordered)))], 2)
+
+    return {
+        'count': len(ordered),
+        'p50': percentile(0.5),
+        'p95': percentile(0.95),
+        'p99': percentile(0.99),
+        'mean': round(sum(ordered) / len(ordered), 2),
+        'max': round(ordered[-1], 2),
+    }
+
+
+def process_usage(pid: int) -> dict:
+    """CPU seconds (with waited-for children) and peak RSS of a process, None where /proc is missing"""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            # Fields after the command name, starting with field 3 (state)
+            fields = f.read().rpartition(")")[2].split()
+        cpu = sum(int(value) for value in fields[11:15]) / os.sysconf("SC_CLK_TCK")
+        with open(f"/proc/{pid}/status") as f:
+            peak_kb = next(int(line.split()[1]) for line in f if line.startswith("VmHWM:"))
+        return {'serverCpuSeconds': round(cpu, 2), 'serverPeakRssMb': round(peak_kb / 1024, 1)}
+    except (OSError, StopIteration, ValueError):
+        return {'serverCpuSeconds': None, 'serverPeakRssMb': None}
+
+
+def request(base_url: str, path: str, body=None, timeout: float = 600) -> tuple:
+    data = json.dumps(body).encode() if body is not None else None
+    req = urllib.request.Request(
+        base_url + path, data=data, headers={"Content-Type": "application/json"} if data else {}
+    )
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as response:
+            return response.status, response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read()
+
+
+def video_url(tag: str, n: int) -> str:
+    return f"https://www.youtube.com/watch?v={tag}{n:08d}"
+
+
+class Server:
+    """The API on a fresh output directory; usage is read just before it stops"""
+
+    def __init__(self, args, **env):
+        self.output_dir = env.pop('output_dir', None) or temp_output_dir()
+        env = {
+            'CONVERSION_WORKERS': str(args.workers),
+            'FAKE_YTDLP_DELAY': str(args.delay),
+            'FAKE_FFMPEG_DELAY': str(args.ffmpeg_delay),
+            'FAKE_YTDLP_SOURCE': args.media_url,
+            'TAGGING_ENABLED': "false",
+            'SEARCH_BACKEND': "off",
+            **env,
+        }
+        self.started = time.perf_counter()
+        self.process, self.base_url = start_server(self.output_dir, **env)
+        self.startup_seconds = time.perf_counter() - self.started
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.usage = process_usage(self.process.pid)
+        self.process.terminate()
+        self.process.wait(timeout=30)
+        shutil.rmtree(self.output_dir, ignore_errors=True)
+
+
+def convert(base_url: str, urls: list) -> float:
+    """POST /api/convert and return its latency in ms"""
+    start = time.perf_counter()
+    status, body = request(base_url, "/api/convert", {"urls": urls})
+    elapsed = (time.perf_counter() - start) * 1000
+    results = json.loads(body).get('results', []) if status == 200 else []
+    if status != 200 or not all(result['success'] for result in results):
+        raise SystemExit(f"FAIL: /api/convert answered {status}: {body[:300]!r}")
+    return elapsed
+
+
+def run_single(args) -> dict:
+    with Server(args) as server:
+        start = time.perf_counter()
+        latencies = [convert(server.base_url, [video_url("sgl", n)]) for n in range(args.single)]
+        seconds = time.perf_counter() - start
+    return {'items': args.single, 'seconds': seconds, 'latencies': latencies, **server.usage}
+
+
+def run_batch(args) -> dict:
+    with Server(args, JOB_QUEUE_SIZE=str(max(200, args.batch))) as server:
+        start = time.perf_counter()
+        status, body = request(server.base_url, "/api/jobs", {"urls": [video_url("bat", n) for n in range(args.batch)]})
+        if status != 202:
+            raise SystemExit(f"FAIL: /api/jobs answered {status}: {body[:300]!r}")
+        job_id = json.loads(body)['id']
+        finished = {}
+        while len(finished) < args.batch:
+            job = json.loads(request(server.base_url, f"/api/jobs/{job_id}")[1])
+            now = (time.perf_counter() - start) * 1000
+            for item in job['items']:
+                if item['status'] in ("completed", "failed") and item['index'] not in finished:
+                    if item['status'] == "failed":
+                        raise SystemExit(f"FAIL: batch item {item['index']} failed: {item.get('result')}")
+                    finished[item['index']] = now
+            time.sleep(0.05)
+        seconds = time.perf_counter() - start
+    return {'items': args.batch, 'seconds': seconds, 'latencies': list(finished.values()), **server.usage}
+
+
+def run_hot_cache(args) -> dict:
+    with Server(args, CACHE_ENABLED="true") as server:
+        urls = [video_url("hot", n) for n in range(args.cache_items)]
+        cold = [convert(server.base_url, [url]) for url in urls]
+        start = time.perf_counter()
+        latencies = [convert(server.base_url, [url]) for _ in range(args.cache_repeats) for url in urls]
+        seconds = time.perf_counter() - start
+        cache = json.loads(request(server.base_url, "/api/stats")[1])['cache']
+    return {
+        'items': len(latencies), 'seconds': seconds, 'latencies': latencies,
+        'coldLatencyMs': latency_summary(cold), 'cacheHits': cache['hits'], **server.usage
+    }
+
+
+def populate(output_dir: str, count: int, payload: bytes, age: float = 0.0) -> list:
+    """
+    Create count files (hard links of one payload) in shard directories and index them.
+
+    The files are indexed as created age seconds ago, in creation order.
+    """
+    files = []
+    for n in range(count):
+        if n % LINKS_PER_PAYLOAD == 0:
+            source = os.path.join(output_dir, f".payload{n // LINKS_PER_PAYLOAD}")
+            with open(source, "wb") as f:
+                f.write(payload)
+        file_id = str(uuid.uuid4())
+        directory = shard_dir(output_dir, file_id)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{file_id}_Benchmark Track {n}.mp3")
+        os.link(source, path)
+        files.append((file_id, path, f"Benchmark Track {n}.mp3"))
+    created = time.time() - age
+    rows = [(*file, len(payload), created + n / count, None) for n, file in enumerate(files)]
+    db_path = os.path.join(output_dir, ".index", "files.sqlite3")
+    FileIndex(db_path, output_dir, seed=False).close()
+    with sqlite3.connect(db_path) as conn:
+        conn.executemany(
+            "INSERT INTO files (id, path, display_name, size, created_at, metadata) VALUES (?, ?, ?, ?, ?, ?)", rows
+        )
+    return rows
+
+
+def run_download_storm(args) -> dict:
+    output_dir = temp_output_dir()
+    rows = populate(output_dir, args.files, os.urandom(64 * 1024))
+    ids = [row[0] for row in random.choices(rows, k=args.storm_requests)]
+    with Server(args, output_dir=output_dir, CACHE_ENABLED="false") as server:
+        def download(file_id: str) -> float:
+            begin = time.perf_counter()
+            status, body = request(server.base_url, f"/api/download/{file_id}")
+            if status != 200 or len(body) != 64 * 1024:
+                raise SystemExit(f"FAIL: /api/download answered {status} with {len(body)} bytes")
+            return (time.perf_counter() - begin) * 1000
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            latencies = list(pool.map(download, ids))
+        seconds = time.perf_counter() - start
+    return {
+        'items': len(ids), 'seconds': seconds, 'latencies': latencies,
+        'files': args.files, 'startupSeconds': round(server.startup_seconds, 2), **server.usage
+    }
+
+
+def run_cleanup(args) -> dict:
+    output_dir = temp_output_dir()
+    # With a TTL of 1 hour the files expire within a second, EXPIRY_DELAY after being indexed,
+    # so the server is up and serving before the cleanup deletes them
+    rows = populate(output_dir, args.files, b"\0" * 4096, age=3600 - EXPIRY_DELAY)
+    with Server(args, output_dir=output_dir, FILE_TTL_HOURS="1", CLEANUP_INTERVAL_SECONDS="1") as server:
+        last = rows[-1][1]
+        latencies = []
+        deleting = None
+        while os.path.exists(last):
+            begin = time.perf_counter()
+            request(server.base_url, "/api/health/live")
+            latencies.append((time.perf_counter() - begin) * 1000)
+            if deleting is None and not os.path.exists(rows[0][1]):
+                deleting = time.perf_counter()
+            time.sleep(0.02)
+        seconds = time.perf_counter() - (deleting or time.perf_counter())
+        remaining = sum(1 for row in rows if os.path.exists(row[1]))
+    if remaining:
+        raise SystemExit(f"FAIL: {remaining} expired files were not deleted")
+    return {
+        'items': args.files, 'seconds': seconds, 'latencies': latencies,
+        'startupSeconds': round(server.startup_seconds, 2), **server.usage
+    }
+
+
+WORKLOADS = {
+    'single': run_single,
+    'batch': run_batch,
+    'hot_cache': run_hot_cache,
+    'download_storm': run_download_storm,
+    'cleanup': run_cleanup,
+}
+
+
+def lookup(result: dict, key: str):
+    for part in key.split("."):
+        result = result.get(part) if isinstance(result, dict) else None
+    return result
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Print every compared metric next to the baseline and return the regressions"""
+    regressions = []
+    print(f"\n{'workload':<15} {'metric':<17} {'baseline':>10} {'now':>10} {'change':>8}")
+    for name, result in results['workloads'].items():
+        before = baseline.get('workloads', {}).get(name)
+        if before is None:
+            continue
+        for key, higher_is_better in COMPARED:
+            old, new = lookup(before, key), lookup(result, key)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            worse = -change if higher_is_better else change
+            noise = key.startswith("latencyMs") and max(old, new) < MIN_COMPARED_LATENCY_MS
+            flag = ""
+            if worse > tolerance and not noise:
+                flag = "  REGRESSION"
+                regressions.append(f"{name} {key}: {old} -> {new}")
+            print(f"{name:<15} {key:<17} {old:>10} {new:>10} {change:>+8.0%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workloads", nargs="+", choices=list(WORKLOADS), default=list(WORKLOADS))
+    parser.add_argument("--delay", type=float, default=0.2, help="Fake yt-dlp latency per download")
+    parser.add_argument("--ffmpeg-delay", type=float, default=0.05, help="Fake ffmpeg time per transcode")
+    parser.add_argument("--audio-seconds", type=float, default=10.0, help="Length of the served WAV file")
+    parser.add_argument("--workers", type=int, default=4, help="CONVERSION_WORKERS of the server")
+    parser.add_argument("--single", type=int, default=20, help="Requests of the single workload")
+    parser.add_argument("--batch", type=int, default=100, help="Items of the batch workload")
+    parser.add_argument("--cache-items", type=int, default=10)
+    parser.add_argument("--cache-repeats", type=int, default=5)
+    parser.add_argument("--files", type=int, default=100000, help="Files of the download storm and cleanup")
+    parser.add_argument("--storm-requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=16, help="Clients of the download storm")
+    parser.add_argument("--out", default=None, help="Results file (default: benchmarks/results/<time>.json)")
+    parser.add_argument("--baseline", default=None, help="Results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Relative change counted as a regression")
+    args = parser.parse_args()
+
+    media_dir = temp_output_dir()
+    write_sine_wav(os.path.join(media_dir, "audio.wav"), args.audio_seconds)
+    media_server, media_base = serve_directory(media_dir)
+    args.media_url = media_base + "/audio.wav"
+
+    started = datetime.now(timezone.utc)
+    results = {
+        'createdAt': started.isoformat(timespec="seconds"),
+        'host': {
+            'platform': platform.platform(),
+            'python': platform.python_version(),
+            'cpus': os.cpu_count(),
+        },
+        'config': {key: value for key, value in vars(args).items() if key not in ("out", "baseline", "media_url")},
+        'workloads': {},
+    }
+    print(f"{'workload':<15} {'items':>7} {'seconds':>8} {'items/s':>9} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'p99 ms':>8} {'cpu s':>7} {'rss MB':>7}")
+    try:
+        for name in args.workloads:
+            measured = WORKLOADS[name](args)
+            latencies = measured.pop('latencies')
+            result = {
+                **measured,
+                'seconds': round(measured['seconds'], 3),
+                'throughput': round(measured['items'] / measured['seconds'], 2) if measured['seconds'] else None,
+                'latencyMs': latency_summary(latencies),
+            }
+            results['workloads'][name] = result
+            latency = result['latencyMs']
+            print(f"{name:<15} {result['items']:>7} {result['seconds']:>8.2f} {result['throughput'] or 0:>9.1f} "
+                  f"{latency['p50']:>8.1f} {latency['p95']:>8.1f} {latency['p99']:>8.1f} "
+                  f"{result['serverCpuSeconds'] or 0:>7.1f} {result['serverPeakRssMb'] or 0:>7.0f}")
+    finally:
+        media_server.shutdown()
+        shutil.rmtree(media_dir, ignore_errors=True)
+
+    out = args.out or os.path.join(BENCH_DIR, "results", started.strftime("%Y%m%dT%H%M%SZ") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nresults saved to {out}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} metrics worse than the baseline by more than {args.tolerance:.0%}")
+            sys.exit(1)
+        print(f"\nno metric worse than the baseline by more than {args.tolerance:.0%}")
+
+
+if __name__ == "__main__":
+    main()
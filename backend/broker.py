@@ -0,0 +1,609 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+import logging
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from playlists import PlaylistError
+from storage import FileIndex
+
+logger = logging.getLogger(__name__)
+
+
+# Seconds a claimed task stays with its worker without a lease renewal;
+# after that the worker is presumed dead and the task is handed out again
+LEASE_SECONDS = 60
+
+# Times a task is handed out before it fails (its workers keep vanishing)
+MAX_ATTEMPTS = 3
+
+# Seconds between polls for new tasks (workers) and for results (API nodes)
+POLL_INTERVAL = 0.2
+
+# Task states
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+
+# Payload kind of playlist enumeration tasks (conversion tasks have none)
+PLAYLIST_TASK = "playlist"
+
+
+def default_broker_url(kind: str, output_dir: str) -> str:
+    """Broker location used when BROKER_URL is not set"""
+    if kind == "redis":
+        return "redis://localhost:6379/0"
+    return os.path.join(output_dir, ".broker", "tasks.sqlite3")
+
+
+class Broker:
+    """
+    Task queue between API nodes and conversion workers.
+
+    A task is a convert_single() call: the API node submits its arguments,
+    a worker claims it under a lease, reports progress events while it runs
+    and completes it with the conversion result, which the API node picks
+    up with poll() and then forgets. A worker renews the leases of its
+    running tasks; a task whose lease ran out (the worker crashed or lost
+    its connection) is handed to the next worker asking for one, up to
+    MAX_ATTEMPTS times.
+    """
+
+    def submit(self, task_id: str, payload: Dict[str, Any]) -> None:
+        """Queue a task"""
+        raise NotImplementedError
+
+    def claim(self, worker_id: str, lease_seconds: float = LEASE_SECONDS) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """Take the oldest queued (or abandoned) task, or None if there is none"""
+        raise NotImplementedError
+
+    def renew(self, task_ids: Iterable[str], worker_id: str, lease_seconds: float = LEASE_SECONDS) -> None:
+        """Extend the leases of tasks the worker is still running"""
+        raise NotImplementedError
+
+    def progress(self, task_id: str, event: Dict[str, Any]) -> None:
+        """Store the latest progress event of a running task"""
+        raise NotImplementedError
+
+    def complete(self, task_id: str, result: Dict[str, Any]) -> None:
+        """Store the result of a task (ignored if the task was forgotten meanwhile)"""
+        raise NotImplementedError
+
+    def poll(self, task_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """State of tasks: {task_id: {'status': ..., 'result': ..., 'progress': ...}}"""
+        raise NotImplementedError
+
+    def forget(self, task_ids: List[str]) -> None:
+        """Drop tasks, whatever their state"""
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, int]:
+        """Number of queued and running tasks"""
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+def _lost_result(attempts: int) -> Dict[str, Any]:
+    return {'success': False, 'error': f"Conversion worker lost ({attempts} attempts)"}
+
+
+class SQLiteBroker(Broker):
+    """
+    Broker kept in a SQLite database shared by the processes of one machine.
+
+    Claims run in an IMMEDIATE transaction, so two workers never take the
+    same task. SQLite locking is unreliable on network filesystems; use the
+    Redis broker when workers run on several machines.
+    """
+
+    def __init__(self, db_path: str):
+        """
+        Open (or create) the broker database
+
+        Args:
+            db_path: SQLite database file
+        """
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS tasks (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                id TEXT NOT NULL UNIQUE,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL,
+                worker TEXT,
+                lease_until REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                progress TEXT,
+                result TEXT
+            );
+            CREATE INDEX IF NOT EXISTS tasks_status ON tasks(status, seq);
+            """
+        )
+
+    def submit(self, task_id, payload):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO tasks (id, payload, status) VALUES (?, ?, ?)",
+                (task_id, json.dumps(payload), QUEUED)
+            )
+
+    def claim(self, worker_id, lease_seconds=LEASE_SECONDS):
+        now = time.time()
+        candidate = (
+            "SELECT id, payload, attempts FROM tasks"
+            " WHERE status = ? OR (status = ? AND lease_until < ?) ORDER BY seq LIMIT 1"
+        )
+        with self._lock:
+            # Idle workers poll often; only take the write lock when there is work
+            if self._conn.execute(candidate, (QUEUED, RUNNING, now)).fetchone() is None:
+                return None
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                while True:
+                    row = self._conn.execute(candidate, (QUEUED, RUNNING, now)).fetchone()
+                    if row is None:
+                        self._conn.execute("COMMIT")
+                        return None
+                    task_id, payload, attempts = row
+                    if attempts >= MAX_ATTEMPTS:
+                        self._conn.execute(
+                            "UPDATE tasks SET status = ?, result = ?, lease_until = NULL WHERE id = ?",
+                            (DONE, json.dumps(_lost_result(attempts)), task_id)
+                        )
+                        continue
+                    self._conn.execute(
+                        "UPDATE tasks SET status = ?, worker = ?, lease_until = ?, attempts = attempts + 1"
+                        " WHERE id = ?",
+                        (RUNNING, worker_id, now + lease_seconds, task_id)
+                    )
+                    self._conn.execute("COMMIT")
+                    return task_id, json.loads(payload)
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def renew(self, task_ids, worker_id, lease_seconds=LEASE_SECONDS):
+        task_ids = list(task_ids)
+        if not task_ids:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE tasks SET lease_until = ? WHERE id = ? AND worker = ? AND status = ?",
+                [(time.time() + lease_seconds, task_id, worker_id, RUNNING) for task_id in task_ids]
+            )
+
+    def progress(self, task_id, event):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE tasks SET progress = ? WHERE id = ? AND status = ?",
+                (json.dumps(event), task_id, RUNNING)
+            )
+
+    def complete(self, task_id, result):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE tasks SET status = ?, result = ?, lease_until = NULL WHERE id = ? AND status != ?",
+                (DONE, json.dumps(result), task_id, DONE)
+            )
+
+    def poll(self, task_ids):
+        states = {}
+        with self._lock:
+            # Stay below SQLite's limit on host parameters
+            for start in range(0, len(task_ids), 500):
+                chunk = task_ids[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT id, status, progress, result FROM tasks WHERE id IN ({','.join('?' * len(chunk))})",
+                    chunk
+                ).fetchall()
+                for task_id, status, progress, result in rows:
+                    states[task_id] = {
+                        'status': status,
+                        'progress': json.loads(progress) if progress else None,
+                        'result': json.loads(result) if result else None,
+                    }
+        return states
+
+    def forget(self, task_ids):
+        if not task_ids:
+            return
+        with self._lock:
+            self._conn.executemany("DELETE FROM tasks WHERE id = ?", [(task_id,) for task_id in task_ids])
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self._conn.execute("SELECT status, COUNT(*) FROM tasks GROUP BY status").fetchall())
+        return {'queued': counts.get(QUEUED, 0), 'running': counts.get(RUNNING, 0)}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# Atomically pop the next task id and lease it, skipping ids of forgotten
+# tasks: KEYS = queue, leases; ARGV = lease deadline, worker id, task key prefix
+_REDIS_CLAIM = """
+while true do
+    local id = redis.call('LPOP', KEYS[1])
+    if not id then return nil end
+    local payload = redis.call('HGET', ARGV[3] .. id, 'payload')
+    if payload then
+        redis.call('ZADD', KEYS[2], ARGV[1], id)
+        redis.call('HSET', ARGV[3] .. id, 'status', 'running', 'worker', ARGV[2])
+        redis.call('HINCRBY', ARGV[3] .. id, 'attempts', 1)
+        return {id, payload}
+    end
+end
+"""
+
+
+class RedisBroker(Broker):
+    """
+    Broker kept in Redis, for workers on several machines.
+
+    Queued task ids are a list, leases a sorted set scored by deadline and
+    each task a hash. Expired leases are moved back to the front of the
+    queue by whichever worker asks for a task next.
+    """
+
+    def __init__(self, url: str, prefix: str = "ytmp3:broker:"):
+        """
+        Connect to Redis
+
+        Args:
+            url: Redis URL (redis://host:port/db)
+            prefix: Prefix of every key the broker uses
+
+        Raises:
+            ImportError: If the redis package is not installed
+        """
+        import redis
+        self._redis = redis.Redis.from_url(url, decode_responses=True)
+        self._queue = prefix + "queue"
+        self._leases = prefix + "leases"
+        self._task_prefix = prefix + "task:"
+        self._claim = self._redis.register_script(_REDIS_CLAIM)
+
+    def _key(self, task_id: str) -> str:
+        return self._task_prefix + task_id
+
+    def submit(self, task_id, payload):
+        pipe = self._redis.pipeline()
+        pipe.hset(self._key(task_id), mapping={'payload': json.dumps(payload), 'status': QUEUED, 'attempts': 0})
+        pipe.rpush(self._queue, task_id)
+        pipe.execute()
+
+    def _requeue_expired(self) -> None:
+        for task_id in self._redis.zrangebyscore(self._leases, "-inf", time.time(), start=0, num=10):
+            # Only the worker whose ZREM succeeds requeues the task
+            if not self._redis.zrem(self._leases, task_id):
+                continue
+            attempts = self._redis.hget(self._key(task_id), 'attempts')
+            if attempts is None:
+                continue
+            if int(attempts) >= MAX_ATTEMPTS:
+                self.complete(task_id, _lost_result(int(attempts)))
+            else:
+                self._redis.hset(self._key(task_id), 'status', QUEUED)
+                self._redis.lpush(self._queue, task_id)
+
+    def claim(self, worker_id, lease_seconds=LEASE_SECONDS):
+        self._requeue_expired()
+        claimed = self._claim(
+            keys=[self._queue, self._leases],
+            args=[time.time() + lease_seconds, worker_id, self._task_prefix]
+        )
+        if not claimed:
+            return None
+        task_id, payload = claimed
+        return task_id, json.loads(payload)
+
+    def renew(self, task_ids, worker_id, lease_seconds=LEASE_SECONDS):
+        deadline = time.time() + lease_seconds
+        task_ids = list(task_ids)
+        if task_ids:
+            self._redis.zadd(self._leases, {task_id: deadline for task_id in task_ids}, xx=True)
+
+    def progress(self, task_id, event):
+        if self._redis.hget(self._key(task_id), 'status') == RUNNING:
+            self._redis.hset(self._key(task_id), 'progress', json.dumps(event))
+
+    def complete(self, task_id, result):
+        key = self._key(task_id)
+        self._redis.zrem(self._leases, task_id)
+        if self._redis.exists(key):
+            self._redis.hset(key, mapping={'status': DONE, 'result': json.dumps(result)})
+
+    def poll(self, task_ids):
+        pipe = self._redis.pipeline()
+        for task_id in task_ids:
+            pipe.hmget(self._key(task_id), 'status', 'progress', 'result')
+        states = {}
+        for task_id, (status, progress, result) in zip(task_ids, pipe.execute()):
+            if status is not None:
+                states[task_id] = {
+                    'status': status,
+                    'progress': json.loads(progress) if progress else None,
+                    'result': json.loads(result) if result else None,
+                }
+        return states
+
+    def forget(self, task_ids):
+        if not task_ids:
+            return
+        pipe = self._redis.pipeline()
+        for task_id in task_ids:
+            pipe.delete(self._key(task_id))
+            pipe.lrem(self._queue, 0, task_id)
+        pipe.zrem(self._leases, *task_ids)
+        pipe.execute()
+
+    def stats(self):
+        return {'queued': self._redis.llen(self._queue), 'running': self._redis.zcard(self._leases)}
+
+    def close(self):
+        self._redis.close()
+
+
+def create_broker(kind: str, url: str) -> Broker:
+    """Create the broker selected by configuration ('sqlite' or 'redis')"""
+    if kind == "sqlite":
+        return SQLiteBroker(url)
+    if kind == "redis":
+        return RedisBroker(url)
+    raise ValueError(f"Unknown broker: {kind}")
+
+
+class RemoteConverter:
+    """
+    convert_single() for API nodes whose conversions run on workers.
+
+    Every call becomes a broker task. One thread polls the broker for the
+    state of all outstanding tasks, forwards new progress events to their
+    callbacks and resolves the futures of finished ones. A converted file
+    is registered in this node's file index under its path relative to
+    output_dir (workers and API nodes may mount the shared storage at
+    different places) before the result is returned.
+    """
+
+    def __init__(
+        self,
+        broker: Broker,
+        output_dir: str,
+        file_index: FileIndex,
+        result_timeout: float = 3600,
+        poll_interval: float = POLL_INTERVAL
+    ):
+        """
+        Initialize the converter
+
+        Args:
+            broker: Where tasks are queued
+            output_dir: This node's mount of the storage workers convert into
+            file_index: Index the converted files are registered in
+            result_timeout: Seconds after submission a task fails if no worker
+                finished it (it is dropped from the broker)
+            poll_interval: Seconds between polls of the broker
+        """
+        self.broker = broker
+        self.output_dir = output_dir
+        self.file_index = file_index
+        self.result_timeout = result_timeout
+        self.poll_interval = poll_interval
+        self._waiting: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._poller = threading.Thread(target=self._poll_loop, name="broker-poll", daemon=True)
+        self._poller.start()
+
+    def submit(
+        self,
+        input_text: str,
+        is_search: bool = False,
+        progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+        profile: Optional[str] = None
+    ) -> Future:
+        """Queue one conversion; the future resolves to its result dictionary"""
+        return self._submit({'input': input_text, 'isSearch': is_search, 'profile': profile}, progress)
+
+    def enumerate(self, url: str, max_items: Optional[int] = None) -> Future:
+        """
+        Queue the enumeration of a playlist (see RemotePlaylistEnumerator).
+
+        The future resolves to {'success': True, 'entries': [...]} with the
+        flat entries, or {'success': False, 'error': ...}.
+        """
+        return self._submit({'kind': PLAYLIST_TASK, 'input': url, 'maxItems': max_items})
+
+    def _submit(self, payload: Dict[str, Any], progress: Optional[Callable[[Dict[str, Any]], None]] = None) -> Future:
+        task_id = str(uuid.uuid4())
+        future = Future()
+        with self._lock:
+            self._waiting[task_id] = {
+                'future': future,
+                'progress': progress,
+                'last': None,
+                'deadline': time.monotonic() + self.result_timeout,
+                'input': payload['input'],
+                'isSearch': payload.get('isSearch', False),
+                'kind': payload.get('kind'),
+            }
+        try:
+            self.broker.submit(task_id, payload)
+        except Exception as e:
+            with self._lock:
+                self._waiting.pop(task_id, None)
+            error = f"Could not queue the task: {e}"
+            future.set_result(self._error(payload['input'], payload.get('isSearch', False), error))
+        return future
+
+    def convert_single(
+        self,
+        input_text: str,
+        output_dir: Optional[str] = None,
+        ffmpeg_path: Optional[str] = None,
+        is_search: bool = False,
+        progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+        profile: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Drop-in for converter.convert_single (output_dir and ffmpeg_path are the workers')"""
+        return self.submit(input_text, is_search, progress, profile).result()
+
+    def submit_batch(
+        self,
+        urls: list,
+        search_queries: list,
+        profile: Optional[str] = None,
+        submit: Optional[Callable[..., Future]] = None
+    ) -> List[Future]:
+        """
+        Queue the items of a convert_batch() call (URLs first, then search queries)
+
+        Args:
+            urls: List of YouTube URLs
+            search_queries: List of search queries
+            profile: Encoding profile name; None for the workers' default
+            submit: Called as submit(fn, *args, **kwargs) to admit each item,
+                returning a Future (e.g. a fairness.FairExecutor bound to the
+                client); an item is queued on the broker once admitted and
+                holds its thread until a worker finished it. None queues
+                every item on the broker at once
+        """
+        items = [(url, False) for url in urls] + [(query, True) for query in search_queries]
+        if submit is None:
+            return [self.submit(text, is_search, profile=profile) for text, is_search in items]
+        return [submit(self.convert_single, text, is_search=is_search, profile=profile) for text, is_search in items]
+
+    def _poll_loop(self) -> None:
+        while not self._stop.wait(self.poll_interval):
+            with self._lock:
+                task_ids = list(self._waiting)
+            if not task_ids:
+                continue
+            try:
+                states = self.broker.poll(task_ids)
+            except Exception as e:
+                logger.warning(f"Polling the broker failed: {e}")
+                continue
+            finished = []
+            now = time.monotonic()
+            for task_id in task_ids:
+                with self._lock:
+                    waiting = self._waiting.get(task_id)
+                if waiting is None:
+                    continue
+                state = states.get(task_id)
+                if state is not None and state['status'] == DONE:
+                    finished.append(task_id)
+                    self._resolve(task_id, state['result'] or {})
+                elif state is None or now > waiting['deadline']:
+                    finished.append(task_id)
+                    error = "Conversion task vanished from the broker" if state is None else (
+                        f"No worker finished the conversion within {int(self.result_timeout)} seconds"
+                    )
+                    self._resolve(task_id, {'success': False, 'error': error})
+                elif state['progress'] is not None and state['progress'] != waiting['last']:
+                    waiting['last'] = state['progress']
+                    if waiting['progress'] is not None:
+                        waiting['progress'](state['progress'])
+            if finished:
+                try:
+                    self.broker.forget(finished)
+                except Exception as e:
+                    logger.warning(f"Could not drop finished tasks from the broker: {e}")
+
+    def _resolve(self, task_id: str, result: Dict[str, Any]) -> None:
+        with self._lock:
+            waiting = self._waiting.pop(task_id)
+        if waiting['kind'] == PLAYLIST_TASK:
+            # Playlist entries have no file to register
+            waiting['future'].set_result(result)
+            return
+        if result.get('success'):
+            result = self._register(result)
+        elif 'originalInput' not in result:
+            result = self._error(waiting['input'], waiting['isSearch'], result.get('error') or "Conversion failed")
+        waiting['future'].set_result(result)
+
+    def _register(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        """Index the file a worker produced; the location fields are not part of the result"""
+        result = dict(result)
+        path = os.path.join(self.output_dir, result.pop('path'))
+        metadata = result.pop('metadata', None)
+        created_at = result.pop('createdAt', None)
+        if not os.path.exists(path):
+            return {
+                **self._error(result['originalInput'], result['wasSearch'], f"Converted file not found: {path}"),
+                'title': result['title'],
+            }
+        self.file_index.add(result['id'], path, size=result['size'], created_at=created_at, metadata=metadata)
+        return result
+
+    @staticmethod
+    def _error(input_text: str, is_search: bool, error: str) -> Dict[str, Any]:
+        return {
+            'id': str(uuid.uuid4()),
+            'filename': '',
+            'title': input_text,
+            'size': None,
+            'duration': None,
+            'success': False,
+            'error': error,
+            'wasSearch': is_search,
+            'originalInput': input_text,
+        }
+
+    def stats(self) -> Dict[str, int]:
+        """Broker queue counters plus the tasks this node is waiting for"""
+        with self._lock:
+            waiting = len(self._waiting)
+        return {**self.broker.stats(), 'waiting': waiting}
+
+    def stop(self) -> None:
+        """Stop polling; calls still waiting fail"""
+        self._stop.set()
+        self._poller.join()
+        with self._lock:
+            waiting, self._waiting = self._waiting, {}
+        for task in waiting.values():
+            task['future'].set_result(self._error(task['input'], task['isSearch'], "Server shutting down"))
+        self.broker.close()
+
+
+class RemotePlaylistEnumerator:
+    """
+    Drop-in for playlists.PlaylistEnumerator on API nodes in worker mode.
+
+    The playlist is listed by a worker, so API nodes never run yt-dlp for
+    it. Broker progress events are lossy, so the worker returns all flat
+    entries (up to max_items) with the task result: unlike the local
+    enumerator, the first entry is only queued once the whole listing is
+    known.
+    """
+
+    def __init__(self, remote: RemoteConverter):
+        self.remote = remote
+
+    def entries(self, url: str, max_items: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Yield the flat entries of a playlist, as PlaylistEnumerator.entries()
+
+        Raises:
+            PlaylistError: If the worker could not list the playlist
+        """
+        result = self.remote.enumerate(url, max_items).result()
+        if not result.get('success'):
+            raise PlaylistError(result.get('error') or "Playlist enumeration failed")
+        yield from result.get('entries') or []
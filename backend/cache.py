@@ -0,0 +1,258 @@
+import json
+import os
+import re
+import shutil
+import threading
+import time
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+# watch?v=ID, youtu.be/ID, /shorts/ID, /embed/ID, /live/ID, /v/ID
+_VIDEO_ID_PATTERN = re.compile(
+    r"(?:youtube\.com/(?:watch\?(?:.*&)?v=|shorts/|embed/|live/|v/)|youtu\.be/)([A-Za-z0-9_-]{11})(?![A-Za-z0-9_-])"
+)
+
+
+def extract_video_id(url: str) -> Optional[str]:
+    """
+    Get the canonical 11-character YouTube video ID from a URL.
+
+    Args:
+        url: YouTube URL in any of the common forms
+
+    Returns:
+        The video ID, or None if the URL does not point at a single video
+    """
+    match = _VIDEO_ID_PATTERN.search(url)
+    return match.group(1) if match else None
+
+
+def _link_or_copy(source: str, destination: str) -> None:
+    """Hardlink source to destination, copying when hardlinks are not supported"""
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copyfile(source, destination)
+
+
+class ConversionCache:
+    """
+    Content-addressed store of encoded audio files.
+
+    Every encoded file is kept once per (video_id, audio_format, bitrate)
+    under cache_dir. Conversions that hit the cache get a hardlink to the
+    cached file in the output directory, so handing out a new file_id costs
+    one link() call instead of a download plus a transcode.
+
+    The mtime of a cached file is its last-use time, used only for the
+    cache's own LRU and max_age_seconds eviction. FileCleanupService expires
+    the copies in the output directory by their createdAt in the file index,
+    so touching an entry does not extend the TTL of files already handed out.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = 2 * 1024 ** 3, max_age_seconds: Optional[float] = None):
+        """
+        Initialize the cache
+
+        Args:
+            cache_dir: Directory holding cached files and their metadata
+            max_bytes: Evict least recently used entries above this total size
+            max_age_seconds: Evict entries not used for this long (None to disable)
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        # (st_dev, st_ino) of every cached file -> key and back, for release()
+        self._inodes: Dict[Tuple[int, int], str] = {}
+        self._inode_of: Dict[str, Tuple[int, int]] = {}
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load()
+
+    @staticmethod
+    def make_key(video_id: str, audio_format: str, bitrate: str) -> str:
+        """Build the cache key (also used as the file stem) for a set of audio settings"""
+        return f"{video_id}.{audio_format}.{bitrate}"
+
+    def _paths(self, key: str, ext: str) -> Tuple[str, str]:
+        return os.path.join(self.cache_dir, f"{key}.{ext}"), os.path.join(self.cache_dir, f"{key}.json")
+
+    def _load(self) -> None:
+        """Rebuild the in-memory index from the metadata files on disk"""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.cache_dir, name), encoding="utf-8") as f:
+                    entry = json.load(f)
+                st = os.stat(entry['path'])
+                entry['lastUsed'] = st.st_mtime
+                entries.append((entry, (st.st_dev, st.st_ino)))
+            except (OSError, ValueError, KeyError):
+                logger.warning(f"Ignoring broken cache entry: {name}")
+        for entry, inode in sorted(entries, key=lambda e: e[0]['lastUsed']):
+            self._entries[entry['key']] = entry
+            self._inodes[inode] = entry['key']
+            self._inode_of[entry['key']] = inode
+            self._total_bytes += entry['size']
+        if entries:
+            logger.info(f"Conversion cache loaded: {len(entries)} entries, {self._total_bytes / 1024 ** 2:.1f} MB")
+
+    def get(self, video_id: str, audio_format: str, bitrate: str) -> Optional[Dict[str, Any]]:
+        """Look up an entry and mark it as used, counting the hit or miss"""
+        key = self.make_key(video_id, audio_format, bitrate)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or not os.path.exists(entry['path']):
+                if entry is not None:
+                    self._drop(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            entry['lastUsed'] = time.time()
+            self.hits += 1
+            return dict(entry)
+
+    def put(self, video_id: str, audio_format: str, bitrate: str, source_path: str, metadata: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Add an encoded file to the cache.
+
+        Args:
+            video_id: Canonical YouTube video ID
+            audio_format: Output container/codec, e.g. "mp3"
+            bitrate: Encoder bitrate/quality setting
+            source_path: Freshly encoded file (it is hardlinked, not moved)
+            metadata: Extra fields to keep with the entry (title, duration, ...)
+
+        Returns:
+            The cache entry, or None if the file could not be cached
+        """
+        key = self.make_key(video_id, audio_format, bitrate)
+        ext = os.path.splitext(source_path)[1].lstrip(".") or audio_format
+        path, meta_path = self._paths(key, ext)
+        with self._lock:
+            if key in self._entries:
+                return dict(self._entries[key])
+            try:
+                if os.path.exists(path):
+                    os.remove(path)
+                _link_or_copy(source_path, path)
+                st = os.stat(path)
+                entry = {
+                    **metadata,
+                    'key': key,
+                    'videoId': video_id,
+                    'format': audio_format,
+                    'bitrate': bitrate,
+                    'path': path,
+                    'size': st.st_size,
+                    'lastUsed': time.time(),
+                }
+                with open(meta_path, "w", encoding="utf-8") as f:
+                    json.dump(entry, f)
+            except OSError as e:
+                logger.error(f"Could not cache {source_path}: {e}")
+                return None
+            self._entries[key] = entry
+            self._inodes[(st.st_dev, st.st_ino)] = key
+            self._inode_of[key] = (st.st_dev, st.st_ino)
+            self._total_bytes += entry['size']
+            self._evict_over_size()
+            return dict(entry)
+
+    def materialize(self, entry: Dict[str, Any], destination: str) -> None:
+        """
+        Make a cached file available at destination as a cheap reference.
+
+        Raises:
+            OSError: If the cached file disappeared or the link failed
+        """
+        _link_or_copy(entry['path'], destination)
+        # Shared inode: refreshes the cache entry and the new output file alike
+        os.utime(destination)
+
+    def evict(self) -> int:
+        """Drop expired entries and enforce the size limit, returning how many were evicted"""
+        with self._lock:
+            evicted = 0
+            if self.max_age_seconds is not None:
+                cutoff = time.time() - self.max_age_seconds
+                while self._entries:
+                    key, entry = next(iter(self._entries.items()))
+                    if entry['lastUsed'] >= cutoff:
+                        break
+                    self._drop(key)
+                    evicted += 1
+            self.evictions += evicted
+            return evicted + self._evict_over_size()
+
+    def release(self, inode: Tuple[int, int]) -> int:
+        """
+        Evict the entry stored in inode if the cache now holds its only link.
+
+        Called after an output file sharing the entry's inode was deleted to
+        free disk space: as long as other output files link to it, dropping
+        the entry would release nothing.
+
+        Args:
+            inode: (st_dev, st_ino) of the deleted output file
+
+        Returns:
+            Bytes of disk space released (0 if the entry was kept or there is none)
+        """
+        with self._lock:
+            key = self._inodes.get(inode)
+            if key is None:
+                return 0
+            entry = self._entries[key]
+            try:
+                if os.stat(entry['path']).st_nlink > 1:
+                    return 0
+            except FileNotFoundError:
+                self._drop(key)
+                return 0
+            self._drop(key)
+            self.evictions += 1
+            return entry['size']
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters and size of the cache"""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._total_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+    def _evict_over_size(self) -> int:
+        evicted = 0
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            self._drop(next(iter(self._entries)))
+            evicted += 1
+        self.evictions += evicted
+        return evicted
+
+    def _drop(self, key: str) -> None:
+        entry = self._entries.pop(key)
+        self._total_bytes -= entry['size']
+        self._inodes.pop(self._inode_of.pop(key, None), None)
+        for path in (entry['path'], self._paths(key, "json")[1]):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.error(f"Error evicting cache file {path}: {e}")
+        logger.debug(f"Evicted cache entry {key}")
@@ -1,77 +1,210 @@
 import os
+import shutil
 import time
 import logging
-from pathlib import Path
+from typing import Any, Dict, Optional
 from apscheduler.schedulers.background import BackgroundScheduler
 
+from cache import ConversionCache
+from storage import FILE_ID_LENGTH, FileIndex
+
 logger = logging.getLogger(__name__)
 
+# Consecutive watermark deletions that release no space (other hardlinks of
+# the same file remain) after which a run gives up instead of emptying the index
+MAX_UNRELEASED_DELETIONS = 100
+
 
 class FileCleanupService:
-    """Service to automatically clean up old converted files"""
+    """
+    Service to automatically clean up old converted files.
+
+    Expiry is driven by the FileIndex: every run pops only the files whose
+    TTL has passed from the index's expiry heap, so a run costs O(expired)
+    instead of a stat() of every file in the output directory, and can
+    therefore run every few seconds. Unindexed leftovers (partial downloads
+    of a killed process) are swept once at startup.
+    """
     
-    def __init__(self, output_dir: str, ttl_hours: int = 24):
+    def __init__(
+        self,
+        output_dir: str,
+        ttl_hours: int = 24,
+        cache: Optional[ConversionCache] = None,
+        file_index: Optional[FileIndex] = None,
+        interval_seconds: int = 60,
+        high_watermark: Optional[float] = None,
+        low_watermark: Optional[float] = None
+    ):
         """
         Initialize cleanup service
         
         Args:
             output_dir: Directory containing converted files
             ttl_hours: Time-to-live in hours for files
+            cache: Optional ConversionCache to evict from on every run
+            file_index: FileIndex of the output directory (an in-memory index
+                seeded from disk is created when omitted)
+            interval_seconds: Seconds between cleanup runs
+            high_watermark: Disk usage percentage of the output volume above
+                which the oldest files are deleted before their TTL (None to disable)
+            low_watermark: Usage percentage to free down to once the high
+                watermark is crossed (default: high_watermark - 5)
         """
         self.output_dir = output_dir
         self.ttl_seconds = ttl_hours * 3600
+        self.cache = cache
+        self.file_index = file_index if file_index is not None else FileIndex(":memory:", output_dir)
+        self.interval_seconds = interval_seconds
+        self.high_watermark = high_watermark
+        self.low_watermark = low_watermark if low_watermark is not None else (
+            max(0.0, high_watermark - 5) if high_watermark is not None else None
+        )
         self.scheduler = BackgroundScheduler()
+        # Files deleted since startup, by cause
+        self.deletions = {'expired': 0, 'watermark': 0, 'orphan': 0}
+    
+    def _delete(self, record: Dict[str, Any], reason: str, kind: str, release_cache: bool = False) -> int:
+        """
+        Delete an indexed file, returning the bytes of disk space released.
+
+        A file hardlinked to a conversion cache entry releases nothing on its
+        own; with release_cache, the entry is evicted too once the cache holds
+        its only remaining link.
+        """
+        try:
+            st = os.stat(record['path'])
+            os.remove(record['path'])
+        except FileNotFoundError:
+            return 0
+        except OSError as e:
+            logger.error(f"Error deleting file {record['path']}: {e}")
+            return 0
+        self.deletions[kind] += 1
+        age = time.time() - record['createdAt']
+        logger.info(f"Deleted {reason} file: {os.path.basename(record['path'])} (age: {age/3600:.2f} hours)")
+        if st.st_nlink == 1:
+            return st.st_size
+        if release_cache and self.cache is not None:
+            return self.cache.release((st.st_dev, st.st_ino))
+        return 0
         
     def cleanup_old_files(self):
-        """Remove files older than TTL"""
+        """Remove files older than TTL, then enforce the disk watermark and cache limits"""
+        try:
+            expired = self.file_index.pop_expired(time.time() - self.ttl_seconds)
+            for record in expired:
+                self._delete(record, "old", 'expired')
+            if expired:
+                logger.info(f"Cleanup complete: {len(expired)} files deleted")
+        except Exception as e:
+            logger.error(f"Error during cleanup: {e}")
+        
+        if self.high_watermark is not None:
+            try:
+                self.enforce_disk_watermark()
+            except Exception as e:
+                logger.error(f"Error enforcing disk watermark: {e}")
+        
+        if self.cache is not None:
+            try:
+                evicted = self.cache.evict()
+                if evicted > 0:
+                    logger.info(f"Cache cleanup complete: {evicted} entries evicted")
+            except Exception as e:
+                logger.error(f"Error during cache eviction: {e}")
+    
+    def enforce_disk_watermark(self) -> int:
+        """
+        Delete the oldest files while the output volume is above the high watermark.
+
+        Frees space down to the low watermark. A file sharing its inode with
+        a conversion cache entry evicts that entry along with it, unless
+        other output files still link to the entry. The run stops after
+        MAX_UNRELEASED_DELETIONS deletions in a row that released nothing,
+        so files whose space cannot be freed do not drain the whole index.
+
+        Returns:
+            Number of files deleted
+        """
+        usage = shutil.disk_usage(self.output_dir)
+        if usage.used * 100.0 / usage.total < self.high_watermark:
+            return 0
+        
+        to_free = usage.used - usage.total * self.low_watermark / 100.0
+        freed = 0
+        deleted = 0
+        unreleased = 0
+        while freed < to_free and unreleased < MAX_UNRELEASED_DELETIONS:
+            record = self.file_index.pop_oldest()
+            if record is None:
+                break
+            released = self._delete(record, "oldest (disk watermark)", 'watermark', release_cache=True)
+            freed += released
+            unreleased = 0 if released else unreleased + 1
+            deleted += 1
+        
+        logger.warning(
+            f"Disk usage above {self.high_watermark}%: deleted {deleted} files early, "
+            f"freed {freed / 1024 ** 2:.1f} MB"
+        )
+        return deleted
+    
+    def sweep_orphans(self) -> int:
+        """
+        Walk the output directory once and delete expired files missing from the index.
+
+        Returns:
+            Number of files deleted
+        """
         if not os.path.exists(self.output_dir):
-            return
+            return 0
         
-        current_time = time.time()
+        cutoff = time.time() - self.ttl_seconds
         deleted_count = 0
-        
-        try:
-            for filename in os.listdir(self.output_dir):
-                filepath = os.path.join(self.output_dir, filename)
-                
-                # Skip directories
-                if not os.path.isfile(filepath):
+        for directory, subdirs, filenames in os.walk(self.output_dir):
+            # Files live in shard subdirectories; skip hidden ones (cache, index)
+            subdirs[:] = [d for d in subdirs if not d.startswith(".")]
+            for filename in filenames:
+                if self.file_index.get(filename[:FILE_ID_LENGTH]) is not None:
                     continue
-                
-                # Check file age
-                file_age = current_time - os.path.getmtime(filepath)
-                
-                if file_age > self.ttl_seconds:
-                    try:
+                filepath = os.path.join(directory, filename)
+                try:
+                    if os.path.getmtime(filepath) < cutoff:
                         os.remove(filepath)
                         deleted_count += 1
-                        logger.info(f"Deleted old file: {filename} (age: {file_age/3600:.2f} hours)")
-                    except Exception as e:
-                        logger.error(f"Error deleting file {filename}: {e}")
-            
-            if deleted_count > 0:
-                logger.info(f"Cleanup complete: {deleted_count} files deleted")
-            else:
-                logger.debug("Cleanup complete: no files to delete")
-                
-        except Exception as e:
-            logger.error(f"Error during cleanup: {e}")
+                        self.deletions['orphan'] += 1
+                except OSError as e:
+                    logger.error(f"Error deleting orphaned file {filename}: {e}")
+        
+        if deleted_count > 0:
+            logger.info(f"Orphan sweep complete: {deleted_count} unindexed files deleted")
+        return deleted_count
     
     def start(self):
         """Start the cleanup scheduler"""
-        # Run cleanup immediately on start
+        # Reconcile the disk with the index and run cleanup immediately on start
+        try:
+            self.sweep_orphans()
+        except Exception as e:
+            logger.error(f"Error during orphan sweep: {e}")
         self.cleanup_old_files()
         
-        # Schedule cleanup to run every hour
         self.scheduler.add_job(
             self.cleanup_old_files,
             'interval',
-            hours=1,
-            id='cleanup_job'
+            seconds=self.interval_seconds,
+            id='cleanup_job',
+            max_instances=1,
+            coalesce=True
         )
         
         self.scheduler.start()
-        logger.info(f"Cleanup service started (TTL: {self.ttl_seconds/3600} hours, runs every hour)")
+        watermark = f", disk high watermark: {self.high_watermark}%" if self.high_watermark is not None else ""
+        logger.info(
+            f"Cleanup service started (TTL: {self.ttl_seconds/3600} hours, "
+            f"runs every {self.interval_seconds} seconds{watermark})"
+        )
     
     def stop(self):
         """Stop the cleanup scheduler"""
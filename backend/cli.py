@@ -0,0 +1,447 @@
+"""
+Bulk conversion from the command line.
+
+Reads YouTube URLs, playlist/channel URLs and search queries (one per line,
+blank lines and # comments ignored) from a file or stdin and converts them
+with the backend converter on N parallel workers. Converted files are
+moved into the output directory as "<title>.<ext>".
+
+Every finished item is appended to a journal (JSON lines) in the output
+directory. Running the same command again skips the items the journal
+records as completed, so an interrupted or crashed run resumes where it
+stopped; failed items are retried. Usage:
+
+    python cli.py inputs.txt -o library -j 8
+    cat inputs.txt | python cli.py - -o library --profile opus
+"""
+import argparse
+import json
+import os
+import shutil
+import signal
+import sys
+import tempfile
+import threading
+import time
+import logging
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Dict, Iterable, Iterator, Optional, TextIO
+
+from dotenv import load_dotenv
+
+import converter
+from engines import create_engine
+from playlists import PlaylistError, PlaylistExpander
+from profiles import PROFILES
+from search import SearchCache, SearchResolver, create_search_backend
+from segmented import SegmentedTranscoder
+from storage import FILE_ID_LENGTH, shard_dir
+from tagging import Tagger, TaggingStage, ThumbnailCache
+from upstream import RetryPolicy
+
+logger = logging.getLogger(__name__)
+
+
+# Default journal file name inside the output directory
+JOURNAL_NAME = ".ytmp3-journal.jsonl"
+
+# Exit status of a run stopped with Ctrl+C (128 + SIGINT, as shells report it)
+EXIT_INTERRUPTED = 130
+
+# Seconds between checks for an interruption while waiting for items
+POLL_SECONDS = 0.5
+
+
+def failure(text: str, error: str) -> Dict[str, Any]:
+    """Result of an item that failed before the converter produced one"""
+    return {'id': None, 'success': False, 'error': error, 'originalInput': text}
+
+
+def read_inputs(lines: Iterable[str]) -> Iterator[str]:
+    """Non-empty, non-comment input lines, stripped and without duplicates"""
+    seen = set()
+    for line in lines:
+        text = line.strip()
+        if text and not text.startswith("#") and text not in seen:
+            seen.add(text)
+            yield text
+
+
+class Journal:
+    """
+    Append-only JSON-lines log of finished items, keyed by input text.
+
+    Every record is flushed and fsynced before the item counts as done, so
+    after a crash the journal lists at least every item whose file was
+    placed. A partially written last line (the process died while
+    appending) is ignored when the journal is read back.
+    """
+
+    def __init__(self, path: str):
+        """
+        Open (or create) the journal
+
+        Args:
+            path: Journal file
+        """
+        self.path = path
+        self.completed: Dict[str, Dict[str, Any]] = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    if entry.get('status') == 'completed':
+                        self.completed[entry['input']] = entry
+                    else:
+                        self.completed.pop(entry.get('input'), None)
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def is_completed(self, text: str) -> bool:
+        """Whether text was converted by an earlier run and its file is still there"""
+        entry = self.completed.get(text)
+        return entry is not None and os.path.exists(entry.get('file') or "")
+
+    def record(self, entry: Dict[str, Any]) -> None:
+        """Append one finished item"""
+        line = json.dumps(entry, ensure_ascii=False, separators=(",", ":"))
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            if entry['status'] == 'completed':
+                self.completed[entry['input']] = entry
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+class Throughput:
+    """Counters of a run and the one-line summary printed while it runs"""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.completed = 0
+        self.failed = 0
+        self.skipped = 0
+        self.bytes = 0
+        self.total: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def add(self, success: bool, size: Optional[int] = None) -> None:
+        with self._lock:
+            if success:
+                self.completed += 1
+                self.bytes += size or 0
+            else:
+                self.failed += 1
+
+    def summary(self) -> str:
+        with self._lock:
+            elapsed = max(time.monotonic() - self.started, 1e-6)
+            finished = self.completed + self.failed
+            per_minute = finished * 60 / elapsed
+            done = finished + self.skipped
+            line = (
+                f"{done}/{self.total if self.total is not None else '?'} done, "
+                f"{self.failed} failed, {self.skipped} skipped | "
+                f"{per_minute:.1f} items/min | {self.bytes / elapsed / 1024 ** 2:.2f} MB/s"
+            )
+            if self.total is not None and per_minute > 0 and done < self.total:
+                line += f" | ETA {(self.total - done) / per_minute:.1f} min"
+            return line
+
+
+class BatchRun:
+    """
+    One CLI run: converts inputs with bounded parallelism and journals results.
+
+    At most max_in_flight items are submitted at a time, so a list of
+    thousands of lines (or an endless stdin) is read as the run progresses.
+    With a tagging stage, an item is finished (moved and journaled) only
+    once its tags are written, on the tagging thread, so workers move on to
+    the next download meanwhile.
+    """
+
+    def __init__(
+        self,
+        output_dir: str,
+        ffmpeg_path: str,
+        journal: Journal,
+        workers: int = 4,
+        profile: Optional[str] = None,
+        expander: Optional[PlaylistExpander] = None
+    ):
+        """
+        Initialize the run
+
+        Args:
+            output_dir: Directory the converted files are moved into
+            ffmpeg_path: Path to ffmpeg binary directory
+            journal: Journal of finished items
+            workers: Items converted at the same time
+            profile: Encoding profile name; None for the default
+            expander: Expands playlist and channel URLs (None converts them as-is,
+                which fails)
+        """
+        self.output_dir = output_dir
+        self.ffmpeg_path = ffmpeg_path
+        self.journal = journal
+        self.workers = max(1, workers)
+        self.max_in_flight = self.workers * 2
+        self.profile = profile
+        self.expander = expander
+        self.stats = Throughput()
+        self.stopping = threading.Event()
+        self._work_dir = tempfile.mkdtemp(prefix=".work-", dir=output_dir)
+        self._placed: Dict[str, str] = {}
+        self._names_lock = threading.Lock()
+
+    def items(self, inputs: Iterable[str]) -> Iterator[str]:
+        """Inputs with playlists replaced by their videos; completed items are counted and dropped"""
+        for text in inputs:
+            if self.expander is not None and self.expander.accepts(text):
+                try:
+                    expansion = self.expander.expand(text)
+                    entries = [entry.url for entry in expansion]
+                except PlaylistError as e:
+                    self._finish(text, failure(text, str(e)))
+                    continue
+                logger.info(f"Playlist {text}: {len(entries)} videos")
+                texts = entries
+            else:
+                texts = [text]
+            for item in texts:
+                if self.journal.is_completed(item):
+                    self.stats.skipped += 1
+                else:
+                    yield item
+
+    def run(self, inputs: Iterable[str]) -> bool:
+        """
+        Convert every input, or stop early once stopping is set.
+
+        After a stop, items that have not started are dropped and running
+        ones finish and are journaled, so the next run starts right after
+        them.
+
+        Returns:
+            True if every item completed
+        """
+        executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="cli")
+        in_flight = set()
+        try:
+            for text in self.items(inputs):
+                while len(in_flight) >= self.max_in_flight and not self.stopping.is_set():
+                    _, in_flight = wait(in_flight, timeout=POLL_SECONDS, return_when=FIRST_COMPLETED)
+                if self.stopping.is_set():
+                    break
+                in_flight.add(self._submit(executor, text))
+            executor.shutdown(wait=False, cancel_futures=self.stopping.is_set())
+            wait(in_flight)
+        finally:
+            executor.shutdown(wait=True)
+            shutil.rmtree(self._work_dir, ignore_errors=True)
+        return self.stats.failed == 0 and not self.stopping.is_set()
+
+    def _submit(self, executor: ThreadPoolExecutor, text: str) -> Future:
+        done = Future()
+
+        def converted(future: Future) -> None:
+            if future.cancelled():
+                # wait() only counts a cancelled future as done once notified
+                done.cancel()
+                done.set_running_or_notify_cancel()
+                return
+            try:
+                result = future.result()
+            except Exception as e:
+                result = failure(text, f"Unexpected error: {e}")
+            pending = converter.pending_tagging(result['id']) if result['success'] else None
+            if pending is None:
+                self._finish(text, result, done)
+            else:
+                pending.add_done_callback(lambda _: self._finish(text, result, done))
+
+        executor.submit(
+            converter.convert_single, text, self._work_dir, self.ffmpeg_path, profile=self.profile
+        ).add_done_callback(converted)
+        return done
+
+    def _finish(self, text: str, result: Dict[str, Any], done: Optional[Future] = None) -> None:
+        """Move a converted file into place and journal the item"""
+        entry = {'input': text, 'status': 'failed', 'error': result.get('error'), 'at': time.time()}
+        try:
+            if result['success']:
+                path = self._place(result)
+                entry.update(status='completed', error=None, file=path, title=result['title'], size=result['size'])
+        except OSError as e:
+            entry['error'] = f"Could not move the converted file: {e}"
+        self.journal.record(entry)
+        self.stats.add(entry['status'] == 'completed', entry.get('size'))
+        if entry['status'] != 'completed':
+            logger.warning(f"Failed: {text}: {entry['error']}")
+        if done is not None:
+            done.set_result(entry)
+
+    def _place(self, result: Dict[str, Any]) -> str:
+        """
+        Move a converted file to output_dir/<title>.<ext>, numbering name clashes.
+
+        Inputs naming the same video share one conversion (and one file id),
+        so a file id that was placed already maps to the same path.
+        """
+        file_id, filename = result['id'], result['filename']
+        with self._names_lock:
+            if file_id in self._placed:
+                return self._placed[file_id]
+            source = os.path.join(shard_dir(self._work_dir, file_id), filename)
+            stem, ext = os.path.splitext(filename[FILE_ID_LENGTH + 1:])
+            target, number = os.path.join(self.output_dir, stem + ext), 1
+            while os.path.exists(target):
+                number += 1
+                target = os.path.join(self.output_dir, f"{stem} ({number}){ext}")
+            os.replace(source, target)
+            self._placed[file_id] = target
+        try:
+            os.rmdir(os.path.dirname(source))
+        except OSError:
+            pass
+        return target
+
+
+def report(stats: Throughput, stream: TextIO, interval: float, stop: threading.Event) -> None:
+    """Print the summary every interval seconds (rewriting one line on a terminal)"""
+    tty = stream.isatty()
+    while not stop.wait(interval):
+        stream.write(("\r\x1b[K" if tty else "") + stats.summary() + ("" if tty else "\n"))
+        stream.flush()
+    if tty:
+        stream.write("\r\x1b[K")
+
+
+def configure_converter(args: argparse.Namespace) -> Optional[TaggingStage]:
+    """Apply the converter configuration of the API (environment / .env) plus the CLI options"""
+    converter.configure_limits(
+        max_downloads=args.workers,
+        max_transcodes=int(os.getenv("MAX_CONCURRENT_TRANSCODES", str(max(1, (os.cpu_count() or 2) // 2)))),
+        min_downloads=int(os.getenv("MIN_CONCURRENT_DOWNLOADS", "1"))
+    )
+    converter.configure_retries(RetryPolicy(
+        max_retries=int(os.getenv("DOWNLOAD_RETRIES", "3")),
+        base_delay=float(os.getenv("DOWNLOAD_RETRY_DELAY_SECONDS", "1")),
+        throttled_delay=float(os.getenv("DOWNLOAD_THROTTLED_DELAY_SECONDS", "5")),
+        max_delay=float(os.getenv("DOWNLOAD_RETRY_MAX_DELAY_SECONDS", "60"))
+    ))
+    converter.configure_engine(create_engine(os.getenv("YTDLP_ENGINE", "subprocess"), pool_size=args.workers))
+    segment_min_duration = float(os.getenv("SEGMENT_MIN_DURATION_SECONDS", "1200"))
+    if segment_min_duration > 0:
+        converter.configure_segmenting(SegmentedTranscoder(
+            segment_min_duration, float(os.getenv("SEGMENT_SECONDS", "120"))
+        ))
+    search_backend = os.getenv("SEARCH_BACKEND", "ytdlp")
+    if search_backend != "off":
+        converter.configure_search(SearchResolver(create_search_backend(search_backend), SearchCache()))
+
+    if args.no_tags or os.getenv("TAGGING_ENABLED", "true").lower() not in ("1", "true", "yes"):
+        return None
+    try:
+        thumbnails = None
+        if os.getenv("TAG_COVER_ART", "true").lower() in ("1", "true", "yes"):
+            thumbnails = ThumbnailCache(os.path.join(args.output_dir, ".thumbnails"))
+        stage = TaggingStage(Tagger(thumbnails), max_workers=int(os.getenv("TAG_WORKERS", "2")))
+    except ImportError:
+        logger.warning("mutagen is not installed; converted files will not be tagged")
+        return None
+    converter.configure_tagging(stage)
+    return stage
+
+
+def parse_args(argv: Optional[list] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Convert YouTube URLs, playlists and search queries listed in a file to audio files",
+        epilog="Interrupted runs resume: completed inputs recorded in the journal are skipped."
+    )
+    parser.add_argument("input", help="File with one URL or search query per line, or - for stdin")
+    parser.add_argument("-o", "--output-dir", default=os.getenv("OUTPUT_DIR", "archivos_mp3"))
+    parser.add_argument("-j", "--workers", type=int, default=int(os.getenv("CONVERSION_WORKERS", "4")),
+                        help="Items converted at the same time")
+    parser.add_argument("--profile", choices=list(PROFILES), help="Encoding profile (default: DEFAULT_AUDIO_PROFILE)")
+    parser.add_argument("--journal", help=f"Journal file (default: OUTPUT_DIR/{JOURNAL_NAME})")
+    parser.add_argument("--ffmpeg-path", default=os.getenv("FFMPEG_PATH", ""),
+                        help="Directory containing ffmpeg (default: FFMPEG_PATH, then PATH)")
+    parser.add_argument("--no-tags", action="store_true", help="Do not write tags and cover art")
+    parser.add_argument("--no-playlists", action="store_true", help="Do not expand playlist and channel URLs")
+    parser.add_argument("--interval", type=float, help="Seconds between progress lines (default: 1 on a terminal, else 30)")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Log every conversion")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[list] = None) -> int:
+    """Run the CLI; returns the exit status (0 ok, 1 some items failed, 130 interrupted)"""
+    load_dotenv()
+    args = parse_args(argv)
+    logging.basicConfig(
+        level=logging.INFO if args.verbose else logging.WARNING,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    os.makedirs(args.output_dir, exist_ok=True)
+    tagging = configure_converter(args)
+    expander = None
+    if not args.no_playlists:
+        expander = PlaylistExpander(
+            max_items=int(os.getenv("PLAYLIST_MAX_ITEMS", "200")),
+            max_duration_seconds=float(os.getenv("PLAYLIST_MAX_DURATION_HOURS", "10")) * 3600
+        )
+
+    source = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    inputs = read_inputs(source)
+    if source is not sys.stdin:
+        # A file is read up front so the summary can show the total and an ETA
+        inputs = list(inputs)
+        source.close()
+
+    journal = Journal(args.journal or os.path.join(args.output_dir, JOURNAL_NAME))
+    batch = BatchRun(args.output_dir, args.ffmpeg_path, journal, args.workers, args.profile, expander)
+    if isinstance(inputs, list) and not any(expander and expander.accepts(text) for text in inputs):
+        batch.stats.total = len(inputs)
+
+    stop = threading.Event()
+    interval = args.interval or (1.0 if sys.stderr.isatty() else 30.0)
+    reporter = threading.Thread(target=report, args=(batch.stats, sys.stderr, interval, stop), daemon=True)
+    reporter.start()
+
+    def interrupt(signum, frame):
+        # The first Ctrl+C lets running items finish, a second one aborts
+        batch.stopping.set()
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        print("\nStopping after the running items; press Ctrl+C again to abort.", file=sys.stderr)
+
+    signal.signal(signal.SIGINT, interrupt)
+    status = 0
+    try:
+        if not batch.run(inputs):
+            status = EXIT_INTERRUPTED if batch.stopping.is_set() else 1
+    except KeyboardInterrupt:
+        status = EXIT_INTERRUPTED
+    finally:
+        stop.set()
+        reporter.join()
+        journal.close()
+        if tagging is not None:
+            tagging.shutdown()
+
+    print(batch.stats.summary(), file=sys.stderr)
+    if status == EXIT_INTERRUPTED:
+        print("Interrupted; run the same command again to resume.", file=sys.stderr)
+    elif status:
+        print(f"Some items failed; see {journal.path}. Run again to retry them.", file=sys.stderr)
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
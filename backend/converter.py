@@ -1,10 +1,43 @@
+import asyncio
+import queue
 import subprocess
 import os
 import re
 import uuid
 import json
+import shutil
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
 from pathlib import Path
-from typing import Dict, Any, Optional
+from collections import deque
+from typing import Callable, Dict, Any, Optional
+
+from cache import ConversionCache, extract_video_id
+from singleflight import SingleFlight
+from storage import FILE_ID_LENGTH, FileIndex, shard_dir
+from engines import DOWNLOAD_TIMEOUT, INFO_PREFIX, DownloadEngine, DownloadError, SubprocessEngine, error_message
+from metadata import build_record, parse_info_line, result_fields
+from progress import PHASE_POSTPROCESSING, PHASE_DONE, ProgressReporter
+from streaming import GrowingFile
+from profiles import EncodingProfile, codec_args, get_profile
+from search import SearchError, SearchResolver, normalize_query, video_url
+from tagging import TaggingStage
+from playlists import is_playlist_url
+from metrics import running, stage, track
+from segmented import SegmentedTranscoder
+from upstream import SUCCESS, AdaptiveLimiter, RetryPolicy, classify_error, download_with_retries
+
+
+# Transcode subprocess timeout (seconds)
+TRANSCODE_TIMEOUT = 600
+
+# Error for playlist/channel URLs given where a single video is expected
+PLAYLIST_NOT_SUPPORTED = "Playlist and channel URLs are expanded into their videos by /api/jobs"
+
+# Seconds a streaming conversion may take to print the video info
+STREAM_START_TIMEOUT = 60
 
 
 def es_youtube_url(texto: str) -> bool:
@@ -41,59 +74,340 @@ def format_size(size_bytes: Optional[int]) -> Optional[str]:
     return f"{size_bytes:.2f} TB"
 
 
-def extract_metadata_from_ydtlp_output(output: str) -> Dict[str, Any]:
+class ConcurrencyLimits:
     """
-    Extract metadata from yt-dlp output
-    
+    Process-wide caps on concurrent work.
+
+    Downloads are network bound and transcodes are CPU bound, so each stage
+    gets its own limit. The limits are shared by every batch running in the
+    process, so two concurrent requests cannot double the load. The
+    download limit shrinks towards min_downloads while YouTube throttles
+    and grows back as downloads succeed (see upstream.AdaptiveLimiter).
+    """
+
+    def __init__(self, max_downloads: int = 4, max_transcodes: int = 2, min_downloads: int = 1):
+        self.max_downloads = max(1, max_downloads)
+        self.max_transcodes = max(1, max_transcodes)
+        self.downloads = AdaptiveLimiter(self.max_downloads, min_limit=min_downloads)
+        self.transcodes = threading.BoundedSemaphore(self.max_transcodes)
+
+
+_limits = ConcurrencyLimits()
+_retries = RetryPolicy()
+_cache: Optional[ConversionCache] = None
+_flights = SingleFlight()
+_engine: DownloadEngine = SubprocessEngine()
+_file_index: Optional[FileIndex] = None
+_resolver: Optional[SearchResolver] = None
+_tagging: Optional[TaggingStage] = None
+_segmenter: Optional[SegmentedTranscoder] = None
+
+# Streaming conversions in progress, by coalesce key and by file_id
+_stream_engine = SubprocessEngine()
+_streams: Dict[str, GrowingFile] = {}
+_streams_by_id: Dict[str, GrowingFile] = {}
+_streams_lock = threading.Lock()
+
+
+def configure_limits(max_downloads: int, max_transcodes: int, min_downloads: int = 1) -> None:
+    """Replace the process-wide download/transcode limits (min_downloads = max_downloads fixes the limit)"""
+    global _limits
+    _limits = ConcurrencyLimits(max_downloads, max_transcodes, min_downloads)
+
+
+def configure_retries(policy: RetryPolicy) -> None:
+    """Set the retry policy for downloads that failed with a throttled or transient error"""
+    global _retries
+    _retries = policy
+
+
+def upstream_stats() -> Dict[str, Any]:
+    """Adaptive download limit, attempt outcomes by kind and retry counters"""
+    return {**_limits.downloads.stats(), **_retries.stats()}
+
+
+def coalescing_stats() -> Dict[str, int]:
+    """Counters of the request coalescing in convert_single"""
+    return _flights.stats()
+
+
+def configure_engine(engine: DownloadEngine) -> None:
+    """Set the yt-dlp engine used for downloads"""
+    global _engine
+    _engine = engine
+
+
+def configure_file_index(index: Optional[FileIndex]) -> None:
+    """Set the index converted files are registered in"""
+    global _file_index
+    _file_index = index
+
+
+def configure_search(resolver: Optional[SearchResolver]) -> None:
+    """
+    Set the resolver turning search queries into video URLs before download.
+
+    With None, queries are searched by yt-dlp as part of the download
+    (ytsearch1:) and do not share work with URLs for the same video.
+    """
+    global _resolver
+    _resolver = resolver
+
+
+def search_stats() -> Optional[Dict[str, int]]:
+    """Counters of the search resolution stage, if enabled"""
+    return _resolver.stats() if _resolver is not None else None
+
+
+def configure_tagging(stage: Optional[TaggingStage]) -> None:
+    """
+    Set the stage writing tags and cover art into converted files.
+
+    With a stage, a converted file is registered in the file index and the
+    cache only after it has been tagged (see pending_tagging); the size in
+    the conversion result is that of the untagged file. Files of
+    streaming conversions are not tagged, since their first bytes are sent
+    before the tags could be written. None disables tagging.
+    """
+    global _tagging
+    _tagging = stage
+
+
+def tagging_stats() -> Optional[Dict[str, Any]]:
+    """Counters of the tagging stage, if enabled"""
+    return _tagging.stats() if _tagging is not None else None
+
+
+def pending_tagging(file_id: str) -> Optional[Future]:
+    """Future completing once a converted file is tagged and registered, or None"""
+    return _tagging.pending(file_id) if _tagging is not None else None
+
+
+def configure_segmenting(transcoder: Optional[SegmentedTranscoder]) -> None:
+    """
+    Set the transcoder encoding long MP3 conversions in parallel segments.
+
+    Segments run on the transcode slot of the conversion plus any slots
+    that are free, so they share MAX_CONCURRENT_TRANSCODES with the other
+    conversions. None encodes every file in one ffmpeg.
+    """
+    global _segmenter
+    _segmenter = transcoder
+
+
+def segmenting_stats() -> Optional[Dict[str, int]]:
+    """Counters of the segmented transcoder, if enabled"""
+    return _segmenter.stats() if _segmenter is not None else None
+
+
+def configure_cache(cache: Optional[ConversionCache]) -> None:
+    """Set the conversion cache used by convert_single (None disables caching)"""
+    global _cache
+    _cache = cache
+
+
+def _error_result(
+    file_id: str,
+    input_text: str,
+    is_search: bool,
+    error: str,
+    title: Optional[str] = None,
+    duration: Optional[str] = None,
+    error_kind: Optional[str] = None
+) -> Dict[str, Any]:
+    """Build the result dictionary for a failed conversion"""
+    return {
+        'id': file_id,
+        'filename': '',
+        'title': title or input_text,
+        'size': None,
+        'duration': duration,
+        'success': False,
+        'error': error,
+        'errorKind': error_kind,
+        'wasSearch': is_search,
+        'originalInput': input_text
+    }
+
+
+def find_executable(name: str, directory: Optional[str] = None) -> Optional[str]:
+    """
+    Resolve a tool binary in a cross-platform way.
+
     Args:
-        output: yt-dlp output string
-        
+        name: Executable name without extension (e.g. "ffmpeg"); platform
+            suffixes such as .exe are added by shutil.which
+        directory: Directory searched before PATH (e.g. FFMPEG_PATH)
+
     Returns:
-        Dictionary with extracted metadata
+        Full path of the executable, or None if it cannot be found
     """
-    metadata = {
-        'title': None,
-        'duration': None,
+    if directory:
+        found = shutil.which(name, path=directory)
+        if found:
+            return found
+    return shutil.which(name)
+
+
+def _transcode(source_path: str, output_path: str, ffmpeg_path: str, audio_args: list) -> subprocess.CompletedProcess:
+    """Encode (or remux) the audio of source_path with ffmpeg"""
+    with running("ffmpeg"):
+        return subprocess.run(
+            [
+                find_executable("ffmpeg", ffmpeg_path) or os.path.join(ffmpeg_path, "ffmpeg"),
+                "-y",
+                "-loglevel", "error",
+                "-i", source_path,
+                "-vn",
+                *audio_args,
+                output_path
+            ],
+            capture_output=True,
+            text=True,
+            timeout=TRANSCODE_TIMEOUT
+        )
+
+
+def _result_from_cache(
+    entry: Dict[str, Any],
+    file_id: str,
+    output_dir: str,
+    input_text: str,
+    is_search: bool
+) -> Optional[Dict[str, Any]]:
+    """Hand out a cached conversion under a new file_id, or None if that fails"""
+    filename = f"{file_id}_{entry['fileTitle']}.{entry['format']}"
+    filepath = os.path.join(shard_dir(output_dir, file_id), filename)
+    try:
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        _cache.materialize(entry, filepath)
+    except OSError:
+        return None
+    metadata = entry.get('metadata')
+    if _file_index is not None:
+        _file_index.add(file_id, filepath, size=entry['size'], metadata=metadata)
+    return {
+        'id': file_id,
+        'filename': filename,
+        'title': entry['title'],
+        'size': entry['size'],
+        'duration': entry['duration'],
+        'success': True,
+        'error': None,
+        'wasSearch': is_search,
+        'originalInput': input_text,
+        **result_fields(metadata)
     }
-    
-    # Try to extract title from yt-dlp output
-    title_match = re.search(r'\[download\] Destination: (.+?)\.(?:mp3|webm|m4a)', output)
-    if title_match:
-        # Extract just the filename without path
-        full_path = title_match.group(1)
-        metadata['title'] = os.path.basename(full_path)
-    
-    # Try to extract duration
-    duration_match = re.search(r'Duration: (\d{2}:\d{2}:\d{2})', output)
-    if duration_match:
-        metadata['duration'] = duration_match.group(1)
-    
-    return metadata
+
+
+def coalesce_key(input_text: str, is_search: bool = False) -> str:
+    """
+    Normalized identity of a conversion target.
+
+    URLs for the same video share a key regardless of their form; search
+    queries are compared case-insensitively with collapsed whitespace.
+    """
+    if not is_search and es_youtube_url(input_text):
+        video_id = extract_video_id(input_text)
+        return f"video:{video_id}" if video_id else f"url:{input_text.strip()}"
+    return "search:" + normalize_query(input_text)
 
 
 def convert_single(
     input_text: str,
     output_dir: str,
     ffmpeg_path: str,
-    is_search: bool = False
+    is_search: bool = False,
+    progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+    profile: Optional[str] = None
 ) -> Dict[str, Any]:
     """
-    Convert a single URL or search query to MP3.
+    Convert a single URL or search query to audio.
+
+    Search queries are first resolved to a video URL (see configure_search),
+    so they share the conversion and cache of that URL. Concurrent calls for
+    the same target (see coalesce_key) and profile are coalesced: only the
+    first one runs yt-dlp and ffmpeg, the others wait for it and get the
+    same file.
     
     Args:
         input_text: YouTube URL or search query
         output_dir: Directory to save the converted file
         ffmpeg_path: Path to ffmpeg binary directory
         is_search: Whether this input is a search query
+        progress: Optional callback receiving progress events
+            ({'phase': 'downloading', 'percent': ..., ...}) while the item runs
+        profile: Encoding profile name (see profiles.PROFILES); None for the default
         
     Returns:
         Dictionary with conversion result
+
+    Raises:
+        ValueError: If the profile does not exist
     """
-    file_id = str(uuid.uuid4())
-    
-    # Determine if it's a URL or search query
+    encoding = get_profile(profile)
     if not is_search and not es_youtube_url(input_text):
         is_search = True
+    if not is_search and is_playlist_url(input_text):
+        return _error_result(str(uuid.uuid4()), input_text, is_search, PLAYLIST_NOT_SUPPORTED)
+    
+    resolved_url = None
+    if is_search and _resolver is not None:
+        try:
+            video_id, _ = _resolver.resolve(input_text)
+        except SearchError as e:
+            return _error_result(str(uuid.uuid4()), input_text, is_search, str(e))
+        resolved_url = video_url(video_id)
+    return _convert_target(input_text, output_dir, ffmpeg_path, is_search, progress, encoding, resolved_url)
+
+
+def _convert_target(
+    input_text: str,
+    output_dir: str,
+    ffmpeg_path: str,
+    is_search: bool,
+    progress: Optional[Callable[[Dict[str, Any]], None]],
+    profile: EncodingProfile,
+    resolved_url: Optional[str] = None
+) -> Dict[str, Any]:
+    """Coalesced conversion of input_text, downloading resolved_url instead if given"""
+    if resolved_url is not None:
+        target, target_is_search = resolved_url, False
+    else:
+        target, target_is_search = input_text, is_search
+    
+    key = f"{output_dir}|{profile.name}|{coalesce_key(target, target_is_search)}"
+    result, shared = _flights.do(
+        key,
+        lambda broadcast: _convert_single(target, output_dir, ffmpeg_path, target_is_search, broadcast, profile),
+        progress
+    )
+    if shared or resolved_url is not None:
+        result = {**result, 'wasSearch': is_search, 'originalInput': input_text}
+        if not result['success'] and result['title'] == target:
+            result['title'] = input_text
+    return result
+
+
+def _convert_single(
+    input_text: str,
+    output_dir: str,
+    ffmpeg_path: str,
+    is_search: bool,
+    progress: Callable[[Dict[str, Any]], None],
+    profile: EncodingProfile
+) -> Dict[str, Any]:
+    """
+    Run the conversion of one item (the leader's side of convert_single).
+
+    The download and the transcode run as two separate steps so that each
+    one is bounded by its own concurrency limit (see ConcurrencyLimits).
+    URLs whose video was converted before are served from the conversion
+    cache without running either step. When the downloaded stream already
+    has the profile's codec, the transcode step only remuxes it.
+    """
+    file_id = str(uuid.uuid4())
+    reporter = ProgressReporter(progress)
     
     # Prepare target for yt-dlp
     if is_search:
@@ -101,93 +415,101 @@ def convert_single(
     else:
         target = input_text
     
-    # Prepare output template
-    output_template = os.path.join(output_dir, f"{file_id}_%(title)s.%(ext)s")
+    # Serve repeated videos from the cache
+    video_id = None if is_search else extract_video_id(input_text)
+    if _cache is not None and video_id:
+        entry = _cache.get(video_id, profile.extension, profile.name)
+        cached = _result_from_cache(entry, file_id, output_dir, input_text, is_search) if entry else None
+        if cached:
+            reporter.emit(PHASE_DONE, percent=100.0)
+            return cached
+    
+    # Prepare output template inside the file's shard directory
+    file_dir = shard_dir(output_dir, file_id)
+    output_template = os.path.join(file_dir, f"{file_id}_%(title)s.%(ext)s")
     
     try:
-        # Run yt-dlp
-        result = subprocess.run(
-            [
-                "yt-dlp",
-                "--js-runtimes", r"node:C:\Users\nacho\anaconda3\node.exe",
-                "--remote-components", "ejs:github",
-                "-x",
-                "--audio-format", "mp3",
-                "--postprocessor-args", "ffmpeg:-acodec mp3_mf",
-                "--ffmpeg-location", ffmpeg_path,
-                "-o", output_template,
-                "--print", "after_move:filepath",
-                "--print", "title",
-                "--print", "duration_string",
-                target
-            ],
-            capture_output=True,
-            text=True,
-            timeout=300  # 5 minutes timeout
-        )
+        # Download the source audio, retrying throttled and transient failures
+        def download():
+            with stage("download"):
+                return _engine.download(target, output_template, ffmpeg_path, reporter, profile.source_format)
         
-        if result.returncode != 0:
-            return {
-                'id': file_id,
-                'filename': '',
-                'title': input_text,
-                'size': None,
-                'duration': None,
-                'success': False,
-                'error': f"yt-dlp error: {result.stderr[:200]}",
-                'wasSearch': is_search,
-                'originalInput': input_text
-            }
+        try:
+            info = download_with_retries(download, _limits.downloads, _retries, label=input_text)
+        except DownloadError as e:
+            return _error_result(file_id, input_text, is_search, str(e), error_kind=e.kind)
         
-        # Parse yt-dlp output to get file information
-        output_lines = result.stdout.strip().split('\n')
+        title = info.get('title')
+        duration = info.get('duration_string')
+        video_id = info.get('id') or video_id
+        source_path = info.get('filepath')
         
-        # Try to get info from output lines
-        # Note: --print statements may output in different order
-        filepath = None
-        title = None
-        duration = None
+        if not source_path or not os.path.exists(source_path):
+            # Fallback: try to find the file
+            files = [f for f in os.listdir(file_dir) if f.startswith(file_id)] if os.path.isdir(file_dir) else []
+            if not files:
+                return _error_result(
+                    file_id, input_text, is_search, 'File not found after download',
+                    title=title, duration=duration
+                )
+            source_path = os.path.join(file_dir, files[0])
         
-        # Find the filepath (it will be a full path ending in .mp3)
-        for line in output_lines:
-            if line.endswith('.mp3') and os.path.exists(line):
-                filepath = line
-                break
+        # Transcode next to the source, keeping the {file_id}_{title} stem
+        filepath = os.path.splitext(source_path)[0] + "." + profile.extension
+        if filepath == source_path:
+            staged_path = source_path + ".src"
+            os.replace(source_path, staged_path)
+            source_path = staged_path
         
-        # If we have a filepath, extract title from filename
-        if filepath:
-            filename = os.path.basename(filepath)
-            # Remove file_id prefix and .mp3 extension to get title
-            # Format: {file_id}_{title}.mp3
-            title = filename[37:-4]  # Skip UUID (36 chars + underscore), remove .mp3
+        try:
+            with _limits.transcodes:
+                reporter.emit(PHASE_POSTPROCESSING)
+                audio_args = codec_args(profile, info.get('acodec'))
+                with stage("transcode"):
+                    transcode = None
+                    if _segmenter is not None and _segmenter.accepts(profile.extension, audio_args, info.get('duration')):
+                        transcode = _segmenter.transcode(
+                            source_path, filepath,
+                            find_executable("ffmpeg", ffmpeg_path) or os.path.join(ffmpeg_path, "ffmpeg"),
+                            audio_args, _limits.transcodes
+                        )
+                    if transcode is None:
+                        transcode = _transcode(source_path, filepath, ffmpeg_path, audio_args)
+        finally:
+            if os.path.exists(source_path):
+                os.remove(source_path)
         
-        # Try to get duration from output (should be a number or time format)
-        for line in output_lines:
-            if line and not line.endswith('.mp3') and line != title:
-                # This might be duration
-                duration = line
-                break
+        if transcode.returncode != 0 or not os.path.exists(filepath):
+            return _error_result(
+                file_id, input_text, is_search, f"ffmpeg error: {transcode.stderr[:200]}",
+                title=title, duration=duration
+            )
         
-        if not filepath or not os.path.exists(filepath):
-            # Fallback: try to find the file
-            files = [f for f in os.listdir(output_dir) if f.startswith(file_id)]
-            if files:
-                filepath = os.path.join(output_dir, files[0])
-            else:
-                return {
-                    'id': file_id,
-                    'filename': '',
+        filename = os.path.basename(filepath)
+        # Format: {file_id}_{title}.{extension}
+        file_title = os.path.splitext(filename)[0][FILE_ID_LENGTH + 1:]
+        title = title or file_title
+        file_size = get_file_size(filepath)
+        metadata = build_record({**info, 'id': video_id}, profile.name, file_size)
+        
+        def register():
+            if _file_index is not None:
+                _file_index.add(file_id, filepath, metadata=metadata)
+            
+            if _cache is not None and video_id:
+                _cache.put(video_id, profile.extension, profile.name, filepath, {
                     'title': title,
-                    'size': None,
+                    'fileTitle': file_title,
                     'duration': duration,
-                    'success': False,
-                    'error': 'File not found after conversion',
-                    'wasSearch': is_search,
-                    'originalInput': input_text
-                }
+                    'metadata': metadata,
+                })
         
-        filename = os.path.basename(filepath)
-        file_size = get_file_size(filepath)
+        # Tagging runs on its own pool, so this worker is free for the next item
+        if _tagging is not None:
+            _tagging.submit(file_id, filepath, {**metadata, 'title': title}, register)
+        else:
+            register()
+        reporter.emit(PHASE_DONE, percent=100.0)
         
         return {
             'id': file_id,
@@ -198,73 +520,366 @@ def convert_single(
             'success': True,
             'error': None,
             'wasSearch': is_search,
-            'originalInput': input_text
+            'originalInput': input_text,
+            **result_fields(metadata)
         }
         
-    except subprocess.TimeoutExpired:
-        return {
-            'id': file_id,
-            'filename': '',
-            'title': input_text,
-            'size': None,
-            'duration': None,
-            'success': False,
-            'error': 'Conversion timeout (exceeded 5 minutes)',
-            'wasSearch': is_search,
-            'originalInput': input_text
-        }
+    except subprocess.TimeoutExpired as e:
+        phase = "download" if e.cmd and e.cmd[0] == "yt-dlp" else "transcode"
+        return _error_result(
+            file_id, input_text, is_search,
+            f"Conversion timeout ({phase} exceeded {int(e.timeout)} seconds)"
+        )
     except Exception as e:
-        return {
-            'id': file_id,
-            'filename': '',
-            'title': input_text,
-            'size': None,
-            'duration': None,
-            'success': False,
-            'error': f"Unexpected error: {str(e)}",
-            'wasSearch': is_search,
-            'originalInput': input_text
-        }
+        return _error_result(file_id, input_text, is_search, f"Unexpected error: {str(e)}")
+
+
+def _safe_filename(title: str) -> str:
+    """Make a title usable as a file name on every platform"""
+    name = re.sub(r'[<>:"/\\|?*\x00-\x1f]', "_", title).strip(" .")
+    return name[:200] or "audio"
+
+
+def get_stream(file_id: str) -> Optional[GrowingFile]:
+    """The streaming conversion in progress for file_id, if any"""
+    with _streams_lock:
+        return _streams_by_id.get(file_id)
+
+
+def start_stream(
+    input_text: str,
+    output_dir: str,
+    ffmpeg_path: str,
+    is_search: bool = False,
+    profile: Optional[str] = None
+) -> GrowingFile:
+    """
+    Start a streaming conversion, or join the one running for the same target.
+
+    yt-dlp writes the audio stream to stdout, which is piped straight into
+    ffmpeg; the encoder output is appended to a GrowingFile that clients
+    read while it is written. Once the encode finishes the file is
+    registered in the index and the conversion cache like any other
+    conversion. Cached videos return an already completed GrowingFile.
+
+    Args:
+        input_text: YouTube URL or search query
+        output_dir: Directory to save the converted file
+        ffmpeg_path: Path to ffmpeg binary directory
+        is_search: Whether this input is a search query
+        profile: Encoding profile name; None for the default
+
+    Returns:
+        The output file, as soon as the title is known and encoding started
+
+    Raises:
+        ValueError: If the profile does not exist or cannot be streamed, or
+            input_text is a playlist
+        DownloadError: If the search or yt-dlp failed before producing any audio
+    """
+    encoding = get_profile(profile)
+    if encoding.stream_format is None:
+        raise ValueError(f"Encoding profile '{encoding.name}' cannot be streamed")
+    if not is_search and not es_youtube_url(input_text):
+        is_search = True
+    if not is_search and is_playlist_url(input_text):
+        raise ValueError(PLAYLIST_NOT_SUPPORTED)
+    if is_search and _resolver is not None:
+        try:
+            video_id, _ = _resolver.resolve(input_text)
+        except SearchError as e:
+            raise DownloadError(str(e))
+        input_text, is_search = video_url(video_id), False
+
+    key = f"{output_dir}|{encoding.name}|{coalesce_key(input_text, is_search)}"
+    with _streams_lock:
+        stream = _streams.get(key)
+    if stream is not None:
+        return stream
+    stream, _ = _flights.do(
+        f"stream|{key}",
+        lambda broadcast: _start_stream(key, input_text, output_dir, ffmpeg_path, is_search, encoding)
+    )
+    return stream
+
+
+def _start_stream(
+    key: str,
+    input_text: str,
+    output_dir: str,
+    ffmpeg_path: str,
+    is_search: bool,
+    profile: EncodingProfile
+) -> GrowingFile:
+    """Leader's side of start_stream: spawn the pipeline once the video info is known"""
+    with _streams_lock:
+        stream = _streams.get(key)
+    if stream is not None:
+        return stream
+
+    file_id = str(uuid.uuid4())
+    video_id = None if is_search else extract_video_id(input_text)
+    if _cache is not None and video_id:
+        entry = _cache.get(video_id, profile.extension, profile.name)
+        cached = _result_from_cache(entry, file_id, output_dir, input_text, is_search) if entry else None
+        if cached:
+            path = os.path.join(shard_dir(output_dir, file_id), cached['filename'])
+            return GrowingFile(path, file_id, cached['filename'][FILE_ID_LENGTH + 1:], completed=True)
+
+    target = f"ytsearch1:{input_text}" if is_search else input_text
+    # The pipeline downloads and transcodes at once, so it holds both slots
+    _limits.downloads.acquire()
+    _limits.transcodes.acquire()
+    started = time.monotonic()
+
+    def release():
+        _limits.transcodes.release()
+        _limits.downloads.release()
+
+    try:
+        downloader = subprocess.Popen(
+            _stream_engine.stream_command(target, ffmpeg_path, profile.source_format),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE
+        )
+    except OSError as e:
+        release()
+        raise DownloadError(f"Could not start the conversion: {e}")
+    track(downloader, "yt-dlp")
+
+    # Drain both stderr pipes; the first info line of yt-dlp is handed over
+    info_lines: "queue.Queue[Optional[str]]" = queue.Queue()
+    errors = {'yt-dlp': deque(maxlen=20), 'ffmpeg': deque(maxlen=20)}
+
+    def drain(name, pipe):
+        for raw in pipe:
+            line = raw.decode("utf-8", "replace").rstrip("\r\n")
+            if name == 'yt-dlp' and line.startswith(INFO_PREFIX):
+                info_lines.put(line)
+            elif line:
+                errors[name].append(line)
+        if name == 'yt-dlp':
+            info_lines.put(None)
+
+    drains = [threading.Thread(target=drain, args=('yt-dlp', downloader.stderr), daemon=True)]
+    drains[0].start()
+
+    def abort(message, kind=None):
+        if downloader.poll() is None:
+            downloader.kill()
+        downloader.wait()
+        drains[0].join()
+        downloader.stdout.close()
+        release()
+        raise DownloadError(message, kind=kind)
+
+    try:
+        line = info_lines.get(timeout=STREAM_START_TIMEOUT)
+    except queue.Empty:
+        line = None
+    info = parse_info_line(line, INFO_PREFIX) if line else None
+    if info is None:
+        message = error_message('\n'.join(errors['yt-dlp']))
+        kind = classify_error(message)
+        _limits.downloads.record(kind, started)
+        abort(message, kind)
+    _limits.downloads.record(SUCCESS, started)
+    if video_id:
+        info['id'] = video_id
+
+    filename = f"{file_id}_{_safe_filename(info.get('title') or '')}.{profile.extension}"
+    filepath = os.path.join(shard_dir(output_dir, file_id), filename)
+    try:
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        stream = GrowingFile(filepath, file_id, filename[FILE_ID_LENGTH + 1:])
+    except Exception as e:
+        abort(f"Could not start the conversion: {e}")
+
+    # The encoder starts only now that the source codec is known, so it can
+    # remux instead of re-encode; yt-dlp blocks on the full pipe meanwhile
+    try:
+        encoder = subprocess.Popen(
+            [
+                find_executable("ffmpeg", ffmpeg_path) or os.path.join(ffmpeg_path, "ffmpeg"),
+                "-loglevel", "error",
+                "-i", "pipe:0",
+                "-vn",
+                *codec_args(profile, info.get('acodec')),
+                "-f", profile.stream_format,
+                "pipe:1"
+            ],
+            stdin=downloader.stdout,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE
+        )
+    except OSError as e:
+        stream.finish(str(e))
+        os.remove(filepath)
+        abort(f"Could not start the conversion: {e}")
+    track(encoder, "ffmpeg")
+    # ffmpeg owns the read end of the pipe now
+    downloader.stdout.close()
+    drains.append(threading.Thread(target=drain, args=('ffmpeg', encoder.stderr), daemon=True))
+    drains[1].start()
+
+    with _streams_lock:
+        _streams[key] = stream
+        _streams_by_id[file_id] = stream
+
+    threading.Thread(
+        target=_pump_stream,
+        args=(stream, key, downloader, encoder, drains, errors, info, profile),
+        name=f"stream-{file_id[:8]}",
+        daemon=True
+    ).start()
+    return stream
+
+
+def _pump_stream(
+    stream: GrowingFile,
+    key: str,
+    downloader: subprocess.Popen,
+    encoder: subprocess.Popen,
+    drains: list,
+    errors: Dict[str, deque],
+    info: Dict[str, Any],
+    profile: EncodingProfile
+) -> None:
+    """Copy the encoder output into the GrowingFile, then register or discard the result"""
+    def kill():
+        downloader.kill()
+        encoder.kill()
+
+    killer = threading.Timer(DOWNLOAD_TIMEOUT + TRANSCODE_TIMEOUT, kill)
+    killer.start()
+    error = None
+    try:
+        with stage("stream"):
+            while True:
+                chunk = encoder.stdout.read1(64 * 1024)
+                if not chunk:
+                    break
+                stream.write(chunk)
+            encoder.wait()
+            downloader.wait()
+        for thread in drains:
+            thread.join()
+        if not killer.is_alive():
+            error = f"Conversion timeout (exceeded {DOWNLOAD_TIMEOUT + TRANSCODE_TIMEOUT} seconds)"
+        elif downloader.returncode != 0:
+            error = f"yt-dlp error: {' '.join(errors['yt-dlp'])[:200]}"
+        elif encoder.returncode != 0 or stream.size == 0:
+            error = f"ffmpeg error: {' '.join(errors['ffmpeg'])[:200]}"
+    except Exception as e:
+        error = f"Unexpected error: {str(e)}"
+    finally:
+        killer.cancel()
+        for process in (downloader, encoder):
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+        encoder.stdout.close()
+
+    try:
+        if error is None:
+            metadata = build_record(info, profile.name, stream.size)
+            if _file_index is not None:
+                _file_index.add(stream.file_id, stream.path, size=stream.size, metadata=metadata)
+            if _cache is not None and info.get('id'):
+                file_title = os.path.splitext(stream.display_name)[0]
+                _cache.put(info['id'], profile.extension, profile.name, stream.path, {
+                    'title': info.get('title') or file_title,
+                    'fileTitle': file_title,
+                    'duration': info.get('duration_string'),
+                    'metadata': metadata,
+                })
+    finally:
+        stream.finish(error)
+        if error is not None and os.path.exists(stream.path):
+            os.remove(stream.path)
+        with _streams_lock:
+            _streams.pop(key, None)
+            _streams_by_id.pop(stream.file_id, None)
+        _limits.transcodes.release()
+        _limits.downloads.release()
 
 
 def convert_batch(
     urls: list,
     search_queries: list,
     output_dir: str,
-    ffmpeg_path: str
+    ffmpeg_path: str,
+    max_workers: int = 4,
+    profile: Optional[str] = None,
+    submit: Optional[Callable[..., Future]] = None
 ) -> list:
     """
-    Convert multiple URLs and search queries to MP3.
+    Convert multiple URLs and search queries to audio concurrently.
+
+    Search queries are resolved first, all at once (see SearchResolver), so
+    they do not occupy conversion workers while searching and share the
+    conversions of URLs for the same video. Items then run on a bounded
+    thread pool, or on the executor behind submit. Results keep the input
+    order (URLs first, then search queries) and a failing item never
+    aborts the batch.
     
     Args:
         urls: List of YouTube URLs
         search_queries: List of search queries
         output_dir: Directory to save converted files
         ffmpeg_path: Path to ffmpeg binary directory
+        max_workers: Maximum number of items converted at the same time
+        profile: Encoding profile name; None for the default
+        submit: Called as submit(fn, *args) to run each item, returning a
+            Future (e.g. a fairness.FairExecutor bound to the client); None
+            runs the batch on a pool of max_workers threads of its own
         
     Returns:
         List of conversion results
     """
-    results = []
+    encoding = get_profile(profile)
+    items = [(url, not es_youtube_url(url)) for url in urls] + [(query, True) for query in search_queries]
+    if not items:
+        return []
+    
+    resolved = {}
+    queries = list(dict.fromkeys(text for text, is_search in items if is_search))
+    if _resolver is not None and queries:
+        resolved = dict(zip(queries, _resolver.resolve_all(queries)))
     
-    # Process URLs
-    for url in urls:
-        result = convert_single(url, output_dir, ffmpeg_path, is_search=False)
-        results.append(result)
+    def convert_item(text: str, is_search: bool) -> Dict[str, Any]:
+        if not is_search or text not in resolved:
+            return convert_single(text, output_dir, ffmpeg_path, is_search=is_search, profile=profile)
+        outcome = resolved[text]
+        if isinstance(outcome, SearchError):
+            return _error_result(str(uuid.uuid4()), text, is_search, str(outcome))
+        return _convert_target(text, output_dir, ffmpeg_path, is_search, None, encoding, video_url(outcome[0]))
     
-    # Process search queries
-    for query in search_queries:
-        result = convert_single(query, output_dir, ffmpeg_path, is_search=True)
-        results.append(result)
+    def collect(futures: list) -> list:
+        results = []
+        for future, (text, is_search) in zip(futures, items):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                results.append(_error_result(str(uuid.uuid4()), text, is_search, f"Unexpected error: {str(e)}"))
+        return results
     
-    return results
+    if submit is not None:
+        return collect([submit(convert_item, text, is_search) for text, is_search in items])
+    
+    workers = max(1, min(max_workers, len(items)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="convert") as executor:
+        return collect([executor.submit(convert_item, text, is_search) for text, is_search in items])
 
 
 def check_ytdlp_available() -> tuple[bool, Optional[str]]:
     """Check if yt-dlp is available and get version"""
+    ytdlp_exe = find_executable("yt-dlp")
+    if ytdlp_exe is None:
+        return False, None
     try:
         result = subprocess.run(
-            ["yt-dlp", "--version"],
+            [ytdlp_exe, "--version"],
             capture_output=True,
             text=True,
             timeout=5
@@ -277,9 +892,11 @@ def check_ytdlp_available() -> tuple[bool, Optional[str]]:
 
 
 def check_ffmpeg_available(ffmpeg_path: str) -> tuple[bool, Optional[str]]:
-    """Check if ffmpeg is available and get version"""
+    """Check if ffmpeg is available (in ffmpeg_path or on PATH) and get version"""
+    ffmpeg_exe = find_executable("ffmpeg", ffmpeg_path)
+    if ffmpeg_exe is None:
+        return False, None
     try:
-        ffmpeg_exe = os.path.join(ffmpeg_path, "ffmpeg.exe")
         result = subprocess.run(
             [ffmpeg_exe, "-version"],
             capture_output=True,
@@ -296,3 +913,26 @@ def check_ffmpeg_available(ffmpeg_path: str) -> tuple[bool, Optional[str]]:
         return False, None
     except:
         return False, None
+
+
+# Dedicated pool for blocking converter calls made from async code. Keeping
+# it separate from the event loop's default executor (used by Starlette for
+# file I/O) means long conversions can never starve downloads.
+_blocking_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="converter-io")
+
+
+async def run_blocking(func, *args, **kwargs):
+    """Run a blocking converter function without blocking the event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_blocking_executor, partial(func, *args, **kwargs))
+
+
+async def convert_single_async(*args, **kwargs) -> Dict[str, Any]:
+    """Async wrapper around convert_single"""
+    return await run_blocking(convert_single, *args, **kwargs)
+
+
+async def convert_batch_async(*args, **kwargs) -> list:
+    """Async wrapper around convert_batch"""
+    return await run_blocking(convert_batch, *args, **kwargs)
+
@@ -0,0 +1,302 @@
+import queue
+import subprocess
+import threading
+import logging
+from typing import Any, Callable, Dict, Optional
+
+from metrics import track
+from metadata import INFO_FIELDS, info_template, parse_info_line
+from progress import PROGRESS_TEMPLATE, ProgressReporter
+
+logger = logging.getLogger(__name__)
+
+
+# Download subprocess timeout (seconds)
+DOWNLOAD_TIMEOUT = 300
+
+# JavaScript runtime yt-dlp uses for YouTube extraction
+NODE_PATH = r"C:\Users\nacho\anaconda3\node.exe"
+
+# Extraction options of every yt-dlp CLI call (downloads, searches, playlists),
+# so they all see YouTube the same way
+EXTRACTOR_ARGS = ("--js-runtimes", f"node:{NODE_PATH}", "--remote-components", "ejs:github")
+
+# Marks the JSON info line yt-dlp prints (see metadata.info_template): on
+# stdout after a download, on stderr before streaming media to stdout
+INFO_PREFIX = "[ytmp3-info]"
+
+# Format selection used when the caller does not ask for a specific source
+DEFAULT_FORMAT = "bestaudio/best"
+
+
+class DownloadError(Exception):
+    """
+    Raised when yt-dlp could not download the requested audio.
+
+    kind is the classification of the failure (see upstream.classify_error)
+    once it has been classified, else None.
+    """
+
+    def __init__(self, message: str, kind: Optional[str] = None):
+        super().__init__(message)
+        self.kind = kind
+
+
+def _run_streaming(
+    cmd: list,
+    timeout: float,
+    on_line: Optional[Callable[[str], bool]] = None
+) -> subprocess.CompletedProcess:
+    """
+    Run a command and hand every stdout line to on_line while it runs.
+
+    Lines for which on_line returns True are consumed; every other line is
+    kept in the returned stdout. stderr is drained on a separate thread so a
+    chatty process can never fill the pipe and deadlock.
+
+    Raises:
+        subprocess.TimeoutExpired: If the process runs longer than timeout
+    """
+    process = subprocess.Popen(
+        cmd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+        bufsize=1
+    )
+    track(process, "yt-dlp")
+    stderr_chunks = []
+    stderr_reader = threading.Thread(target=lambda: stderr_chunks.append(process.stderr.read()), daemon=True)
+    stderr_reader.start()
+    killer = threading.Timer(timeout, process.kill)
+    killer.start()
+    
+    stdout_lines = []
+    try:
+        for line in process.stdout:
+            if on_line is None or not on_line(line):
+                stdout_lines.append(line)
+        process.wait()
+    finally:
+        timed_out = not killer.is_alive()
+        killer.cancel()
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        stderr_reader.join()
+        process.stdout.close()
+        process.stderr.close()
+    
+    if timed_out:
+        raise subprocess.TimeoutExpired(cmd, timeout)
+    return subprocess.CompletedProcess(cmd, process.returncode, ''.join(stdout_lines), ''.join(stderr_chunks))
+
+
+def error_message(stderr: str) -> str:
+    """Error of a failed yt-dlp run: its ERROR lines (warnings come first), else all of stderr"""
+    errors = [line for line in stderr.splitlines() if line.startswith("ERROR:")]
+    return f"yt-dlp error: {(' '.join(errors) or stderr)[:200]}"
+
+
+class DownloadEngine:
+    """Interface for the component that runs yt-dlp"""
+
+    name = "base"
+
+    def download(
+        self,
+        target: str,
+        output_template: str,
+        ffmpeg_path: str,
+        reporter: Optional[ProgressReporter] = None,
+        format_selector: str = DEFAULT_FORMAT
+    ) -> Dict[str, Any]:
+        """
+        Download the best audio stream for target without transcoding it.
+
+        Args:
+            target: URL or ytsearch1: query
+            output_template: yt-dlp output template for the downloaded file
+            ffmpeg_path: Path to ffmpeg binary directory
+            reporter: Optional receiver of download progress
+            format_selector: yt-dlp format selection (-f)
+
+        Returns:
+            Dictionary with the metadata.INFO_FIELDS of the video and the
+            downloaded stream (None when unknown) and 'filepath'
+
+        Raises:
+            DownloadError: If yt-dlp failed
+            subprocess.TimeoutExpired: If the download took too long
+        """
+        raise NotImplementedError
+
+
+class SubprocessEngine(DownloadEngine):
+    """Runs the yt-dlp CLI once per download"""
+
+    name = "subprocess"
+
+    @staticmethod
+    def _base_command(ffmpeg_path: str, format_selector: str = DEFAULT_FORMAT) -> list:
+        return [
+            "yt-dlp",
+            *EXTRACTOR_ARGS,
+            "-f", format_selector,
+            "--ffmpeg-location", ffmpeg_path,
+            # watch?v=...&list=... is the video, not its playlist (see playlists.py)
+            "--no-playlist",
+        ]
+
+    def stream_command(self, target: str, ffmpeg_path: str, format_selector: str = DEFAULT_FORMAT) -> list:
+        """
+        Command writing the best audio stream of target to stdout.
+
+        The video info is printed to stderr (yt-dlp moves all messages there
+        when the output is "-") as one INFO_PREFIX JSON line before any media
+        is written.
+        """
+        return self._base_command(ffmpeg_path, format_selector) + [
+            "-o", "-",
+            "--print", "video:" + info_template(INFO_PREFIX),
+            "--no-simulate",
+            "--",
+            target,
+        ]
+
+    def download(self, target, output_template, ffmpeg_path, reporter=None, format_selector=DEFAULT_FORMAT):
+        cmd = self._base_command(ffmpeg_path, format_selector) + [
+            "-o", output_template,
+            "--print", "after_move:" + info_template(INFO_PREFIX, "filepath"),
+        ]
+        if reporter is not None:
+            # --print implies --quiet, so progress has to be re-enabled explicitly
+            cmd += ["--progress", "--newline", "--progress-template", PROGRESS_TEMPLATE]
+        cmd.append(target)
+        result = _run_streaming(cmd, DOWNLOAD_TIMEOUT, reporter.feed if reporter else None)
+        
+        if result.returncode != 0:
+            raise DownloadError(error_message(result.stderr))
+        
+        info = dict.fromkeys(INFO_FIELDS + ('filepath',))
+        for line in result.stdout.split('\n'):
+            parsed = parse_info_line(line.strip(), INFO_PREFIX)
+            if parsed is not None:
+                info.update(parsed)
+        return info
+
+
+class _YtDlpLogger:
+    """Routes in-process yt-dlp messages to the logging module instead of stderr"""
+
+    def debug(self, msg: str) -> None:
+        pass
+
+    def info(self, msg: str) -> None:
+        pass
+
+    def warning(self, msg: str) -> None:
+        logger.debug(f"yt-dlp: {msg}")
+
+    def error(self, msg: str) -> None:
+        logger.warning(f"yt-dlp: {msg}")
+
+
+class InProcessEngine(DownloadEngine):
+    """
+    Drives yt_dlp.YoutubeDL inside the API process.
+
+    YoutubeDL instances are expensive to create (extractor classes, option
+    parsing) but cheap to reuse, so they are kept in a pool and lent to one
+    thread at a time. Results come from the structured info dict and
+    progress from a progress hook instead of parsing CLI output.
+
+    Unlike the subprocess engine a running download cannot be killed, so
+    the download timeout is enforced through yt-dlp's socket timeout only.
+    """
+
+    name = "inprocess"
+
+    def __init__(self, pool_size: int = 4, socket_timeout: float = 30):
+        import yt_dlp
+        self._yt_dlp = yt_dlp
+        self.pool_size = max(1, pool_size)
+        self.socket_timeout = socket_timeout
+        self._pool: "queue.Queue" = queue.Queue()
+        self._created = 0
+        self._create_lock = threading.Lock()
+        self._local = threading.local()
+
+    def _new_instance(self):
+        return self._yt_dlp.YoutubeDL({
+            'format': DEFAULT_FORMAT,
+            'quiet': True,
+            'no_warnings': True,
+            'noprogress': True,
+            'noplaylist': True,
+            'socket_timeout': self.socket_timeout,
+            'js_runtimes': {'node': {'path': NODE_PATH}},
+            'remote_components': ['ejs:github'],
+            'progress_hooks': [self._progress_hook],
+            'logger': _YtDlpLogger(),
+        })
+
+    def _acquire(self):
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            pass
+        with self._create_lock:
+            if self._created < self.pool_size:
+                self._created += 1
+                return self._new_instance()
+        return self._pool.get()
+
+    def _progress_hook(self, d: Dict[str, Any]) -> None:
+        reporter = getattr(self._local, 'reporter', None)
+        if reporter is not None:
+            reporter.update(
+                d.get('status'),
+                d.get('downloaded_bytes'),
+                d.get('total_bytes') or d.get('total_bytes_estimate'),
+                d.get('speed'),
+                d.get('eta')
+            )
+
+    def download(self, target, output_template, ffmpeg_path, reporter=None, format_selector=DEFAULT_FORMAT):
+        ydl = self._acquire()
+        self._local.reporter = reporter
+        try:
+            ydl.params['outtmpl'] = {'default': output_template}
+            ydl.params['ffmpeg_location'] = ffmpeg_path
+            if ydl.params.get('format') != format_selector:
+                # The selector is compiled when YoutubeDL is created
+                ydl.params['format'] = format_selector
+                ydl.format_selector = ydl.build_format_selector(format_selector)
+            info = ydl.extract_info(target, download=True)
+        except self._yt_dlp.utils.DownloadError as e:
+            raise DownloadError(f"yt-dlp error: {str(e)[:200]}")
+        finally:
+            self._local.reporter = None
+            self._pool.put(ydl)
+        
+        # Search targets come back as a playlist with a single entry
+        if info and info.get('_type') == 'playlist':
+            entries = [entry for entry in info.get('entries') or [] if entry]
+            info = entries[0] if entries else None
+        if not info:
+            raise DownloadError("yt-dlp error: no video found")
+        
+        downloads = info.get('requested_downloads') or [{}]
+        result = {field: downloads[0].get(field) or info.get(field) for field in INFO_FIELDS}
+        result['filepath'] = downloads[0].get('filepath') or info.get('filepath')
+        return {key: None if value in ('none', 'NA') else value for key, value in result.items()}
+
+
+def create_engine(name: str, pool_size: int = 4) -> DownloadEngine:
+    """Create the download engine selected by configuration ('subprocess' or 'inprocess')"""
+    if name == SubprocessEngine.name:
+        return SubprocessEngine()
+    if name == InProcessEngine.name:
+        return InProcessEngine(pool_size=pool_size)
+    raise ValueError(f"Unknown yt-dlp engine: {name}")
@@ -0,0 +1,265 @@
+import queue
+import threading
+import time
+import logging
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from metrics import observe_queue_wait
+
+logger = logging.getLogger(__name__)
+
+
+# Lanes: requests of a single item go to the fast lane, which workers serve
+# before the bulk lane, so they do not wait behind the items of big batches
+FAST = "fast"
+BULK = "bulk"
+LANES = (FAST, BULK)
+
+# Recent queue waits kept per client and per lane for the percentiles in stats()
+WAIT_SAMPLES = 1000
+
+# Idle clients whose wait statistics are kept
+MAX_TRACKED_CLIENTS = 256
+
+
+class Ticket(NamedTuple):
+    """A work item handed out by FairQueue.get(); pass it to done() when finished"""
+    item: Any
+    client: str
+    lane: str
+    waited: float
+
+
+def _percentile(samples: List[float], share: float) -> Optional[float]:
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return round(ordered[min(len(ordered) - 1, int(share * len(ordered)))], 3)
+
+
+def parse_weights(spec: str) -> Dict[str, float]:
+    """
+    Parse client weights given as "client=weight,client=weight".
+
+    Raises:
+        ValueError: If an entry has no "=" or its weight is not a positive number
+    """
+    weights = {}
+    for entry in filter(None, (part.strip() for part in spec.split(","))):
+        client, separator, weight = entry.rpartition("=")
+        if not separator or not client or float(weight) <= 0:
+            raise ValueError(f"Invalid client weight '{entry}' (expected client=weight)")
+        weights[client.strip()] = float(weight)
+    return weights
+
+
+class FairQueue:
+    """
+    Work queue shared fairly between clients (weighted fair queuing).
+
+    Every client has a FIFO of its own in each lane. An item gets a virtual
+    start tag when it is queued: the later of the lane's virtual clock and
+    the tag of the client's previous item, plus 1 / weight of the client.
+    get() hands out the item with the smallest tag, in the fast lane
+    first, and advances the lane's clock to it. A client queueing 300
+    items thus gets tags 1..300, and a client arriving while they run
+    starts at the current clock, so its items are interleaved with the
+    batch instead of waiting behind it; a client of weight 2 gets twice
+    the share of one of weight 1. A client that was idle cannot save up
+    credit, since its tags never start behind the clock.
+
+    Clients with max_in_flight items handed out and not yet done() are
+    skipped, so one client cannot occupy every worker even while it is
+    the only one queueing.
+    """
+
+    def __init__(self, max_in_flight: int = 0, weights: Optional[Dict[str, float]] = None, default_weight: float = 1.0):
+        """
+        Initialize an empty queue
+
+        Args:
+            max_in_flight: Items of one client handed out at the same time (0: no limit)
+            weights: Weight by client (see clients in stats()); others get default_weight
+            default_weight: Weight of clients not listed in weights
+        """
+        self.max_in_flight = max(0, max_in_flight)
+        self.weights = dict(weights or {})
+        self.default_weight = default_weight
+        self._cond = threading.Condition()
+        self._queues: Dict[str, Dict[str, deque]] = {lane: {} for lane in LANES}
+        self._clock = {lane: 0.0 for lane in LANES}
+        self._last_tag: Dict[Tuple[str, str], float] = {}
+        self._in_flight: Dict[str, int] = {}
+        self._queued = 0
+        self._sequence = 0
+        self._lane_waits = {lane: deque(maxlen=WAIT_SAMPLES) for lane in LANES}
+        self._client_waits: "OrderedDict[str, deque]" = OrderedDict()
+        self._served: Dict[str, int] = {}
+
+    def put(self, client: str, item: Any, lane: str = BULK) -> None:
+        """Queue an item of client in lane"""
+        with self._cond:
+            weight = self.weights.get(client, self.default_weight)
+            tag = max(self._clock[lane], self._last_tag.get((lane, client), 0.0)) + 1 / weight
+            self._last_tag[(lane, client)] = tag
+            self._sequence += 1
+            self._queues[lane].setdefault(client, deque()).append((tag, self._sequence, item, time.monotonic()))
+            self._queued += 1
+            # Fast-lane-only workers cannot take a bulk item, so wake them all
+            self._cond.notify_all()
+
+    def qsize(self) -> int:
+        """Items queued and not yet handed out"""
+        return self._queued
+
+    def _eligible(self, client: str) -> bool:
+        return not self.max_in_flight or self._in_flight.get(client, 0) < self.max_in_flight
+
+    def _pop(self, lanes: Tuple[str, ...]) -> Optional[Ticket]:
+        for lane in lanes:
+            clients = self._queues[lane]
+            best = None
+            for client, items in clients.items():
+                if self._eligible(client) and (best is None or items[0][:2] < clients[best][0][:2]):
+                    best = client
+            if best is None:
+                continue
+            tag, _, item, queued_at = clients[best].popleft()
+            if not clients[best]:
+                # An idle client's tags restart from the clock
+                del clients[best]
+                del self._last_tag[(lane, best)]
+            self._clock[lane] = tag
+            self._queued -= 1
+            self._in_flight[best] = self._in_flight.get(best, 0) + 1
+            return Ticket(item, best, lane, time.monotonic() - queued_at)
+        return None
+
+    def get(self, timeout: Optional[float] = None, lanes: Tuple[str, ...] = LANES) -> Ticket:
+        """
+        Take the next item of lanes, in the order lanes are given.
+
+        Raises:
+            queue.Empty: If no item could be handed out within timeout seconds
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while True:
+                ticket = self._pop(lanes)
+                if ticket is not None:
+                    break
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise queue.Empty
+                self._cond.wait(remaining)
+            self._lane_waits[ticket.lane].append(ticket.waited)
+            waits = self._client_waits.pop(ticket.client, None) or deque(maxlen=WAIT_SAMPLES)
+            waits.append(ticket.waited)
+            self._client_waits[ticket.client] = waits
+            while len(self._client_waits) > MAX_TRACKED_CLIENTS:
+                client, _ = self._client_waits.popitem(last=False)
+                self._served.pop(client, None)
+        observe_queue_wait(ticket.lane, ticket.waited)
+        return ticket
+
+    def done(self, ticket: Ticket) -> None:
+        """Mark a handed out item finished, freeing its client's in-flight slot"""
+        with self._cond:
+            left = self._in_flight.get(ticket.client, 0) - 1
+            if left > 0:
+                self._in_flight[ticket.client] = left
+            else:
+                self._in_flight.pop(ticket.client, None)
+            if ticket.client in self._client_waits:
+                self._served[ticket.client] = self._served.get(ticket.client, 0) + 1
+            # A capped client may be eligible again, for any waiting worker
+            self._cond.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        """Queued items and queue waits (seconds) by lane and by client"""
+        with self._cond:
+            lanes = {
+                lane: {
+                    'queued': sum(len(items) for items in self._queues[lane].values()),
+                    'waitP50': _percentile(list(self._lane_waits[lane]), 0.5),
+                    'waitP99': _percentile(list(self._lane_waits[lane]), 0.99),
+                }
+                for lane in LANES
+            }
+            clients = {}
+            for client in set(self._client_waits) | set(self._in_flight) | {
+                c for lane in LANES for c in self._queues[lane]
+            }:
+                waits = list(self._client_waits.get(client, ()))
+                clients[client] = {
+                    'queued': sum(len(self._queues[lane].get(client, ())) for lane in LANES),
+                    'inFlight': self._in_flight.get(client, 0),
+                    'served': self._served.get(client, 0),
+                    'weight': self.weights.get(client, self.default_weight),
+                    'waitP50': _percentile(waits, 0.5),
+                    'waitP99': _percentile(waits, 0.99),
+                    'waitMax': round(max(waits), 3) if waits else None,
+                }
+            return {'queued': self._queued, 'maxInFlight': self.max_in_flight, 'lanes': lanes, 'clients': clients}
+
+
+class FairExecutor:
+    """
+    Thread pool running the callables of many clients from a FairQueue.
+
+    workers threads serve both lanes, fast lane first; fast_lane_workers
+    more threads serve only the fast lane, so a single-item request starts
+    at once even while every other worker is busy with a long conversion.
+    """
+
+    def __init__(self, fair_queue: FairQueue, workers: int = 4, fast_lane_workers: int = 1, name: str = "fair"):
+        """
+        Initialize the executor and start its threads
+
+        Args:
+            fair_queue: Queue the work is taken from
+            workers: Threads serving both lanes
+            fast_lane_workers: Extra threads serving only the fast lane
+            name: Prefix of the thread names
+        """
+        self.queue = fair_queue
+        self._stopping = threading.Event()
+        self._threads = [
+            threading.Thread(target=self._worker, args=(LANES,), name=f"{name}-{n}", daemon=True)
+            for n in range(max(1, workers))
+        ] + [
+            threading.Thread(target=self._worker, args=((FAST,),), name=f"{name}-fast-{n}", daemon=True)
+            for n in range(max(0, fast_lane_workers))
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, client: str, fn: Callable[..., Any], *args, lane: str = BULK, **kwargs) -> Future:
+        """Queue fn(*args, **kwargs) as work of client in lane"""
+        future: Future = Future()
+        self.queue.put(client, (future, fn, args, kwargs), lane)
+        return future
+
+    def _worker(self, lanes: Tuple[str, ...]) -> None:
+        while not self._stopping.is_set():
+            try:
+                ticket = self.queue.get(timeout=0.5, lanes=lanes)
+            except queue.Empty:
+                continue
+            future, fn, args, kwargs = ticket.item
+            try:
+                if future.set_running_or_notify_cancel():
+                    try:
+                        future.set_result(fn(*args, **kwargs))
+                    except BaseException as e:
+                        future.set_exception(e)
+            finally:
+                self.queue.done(ticket)
+
+    def shutdown(self, timeout: float = 5.0) -> None:
+        """Stop the threads after their current item; queued work is dropped"""
+        self._stopping.set()
+        for thread in self._threads:
+            thread.join(timeout)
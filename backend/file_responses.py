@@ -0,0 +1,274 @@
+import os
+import uuid
+from email.utils import formatdate, parsedate_to_datetime
+from typing import List, Mapping, Optional, Tuple, Union
+from urllib.parse import quote
+
+import anyio
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+from metrics import count_served, stage
+
+
+# More ranges than this in one request are ignored and the whole file is sent
+MAX_RANGES = 16
+
+# A response body is a sequence of literal bytes and inclusive file byte ranges
+Segment = Union[bytes, Tuple[int, int]]
+
+
+class RangeNotSatisfiable(Exception):
+    """None of the requested byte ranges overlaps the file"""
+
+
+def parse_range_header(value: str, size: int, max_ranges: int = MAX_RANGES) -> Optional[List[Tuple[int, int]]]:
+    """
+    Parse an HTTP Range header (RFC 9110 section 14.2).
+
+    Args:
+        value: Header value, e.g. "bytes=0-499, -500"
+        size: Size of the file in bytes
+        max_ranges: Ignore headers asking for more ranges than this
+
+    Returns:
+        Sorted, non-overlapping inclusive (start, end) pairs, or None if the
+        header is malformed or should be ignored (whole file is sent)
+
+    Raises:
+        RangeNotSatisfiable: If the header is valid but no range overlaps the file
+    """
+    unit, _, spec = value.partition("=")
+    if unit.strip().lower() != "bytes":
+        return None
+
+    ranges = []
+    parts = [part.strip() for part in spec.split(",") if part.strip()]
+    if not parts or len(parts) > max_ranges:
+        return None
+    for part in parts:
+        first, sep, last = part.partition("-")
+        first, last = first.strip(), last.strip()
+        if not sep or not (first.isdigit() or first == "") or not (last.isdigit() or last == ""):
+            return None
+        if not first:
+            # Suffix range: the last N bytes
+            if not last:
+                return None
+            length = int(last)
+            if length == 0 or size == 0:
+                continue
+            ranges.append((max(0, size - length), size - 1))
+        else:
+            start = int(first)
+            if last and int(last) < start:
+                return None
+            if start >= size:
+                continue
+            end = int(last) if last else size - 1
+            ranges.append((start, min(end, size - 1)))
+
+    if not ranges:
+        raise RangeNotSatisfiable()
+
+    # Coalesce overlapping and adjacent ranges
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _http_date(value: str) -> Optional[float]:
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def etag_matches(header: str, etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against an ETag"""
+    if header.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+def is_not_modified(headers: Mapping[str, str], etag: str, last_modified: float) -> bool:
+    """
+    Evaluate If-None-Match / If-Modified-Since for a GET or HEAD request.
+
+    If-Modified-Since is only considered without If-None-Match (RFC 9110 13.2.2).
+    """
+    if_none_match = headers.get("if-none-match")
+    if if_none_match is not None:
+        return etag_matches(if_none_match, etag)
+    if_modified_since = headers.get("if-modified-since")
+    if if_modified_since is not None:
+        since = _http_date(if_modified_since)
+        return since is not None and int(last_modified) <= since
+    return False
+
+
+def if_range_matches(value: str, etag: str, last_modified: float) -> bool:
+    """
+    Evaluate an If-Range header: the range applies only if the representation is unchanged.
+
+    Entity tags use strong comparison (weak tags never match); dates must
+    equal Last-Modified exactly.
+    """
+    value = value.strip()
+    if value.startswith('"') or value.startswith("W/"):
+        return value == etag and not etag.startswith("W/")
+    since = _http_date(value)
+    return since is not None and int(last_modified) == int(since)
+
+
+def content_disposition(filename: str, inline: bool = False) -> str:
+    """Content-Disposition header value, adding an RFC 5987 filename* for non-ASCII names"""
+    disposition = "inline" if inline else "attachment"
+    if filename.isascii() and '"' not in filename and "\\" not in filename:
+        return f'{disposition}; filename="{filename}"'
+    fallback = filename.encode("ascii", "replace").decode().replace('"', "'").replace("\\", "_")
+    return f"{disposition}; filename=\"{fallback}\"; filename*=utf-8''{quote(filename)}"
+
+
+def file_etag(stat_result: os.stat_result, created_at: float) -> str:
+    """
+    Strong ETag of a converted file.
+
+    Converted files never change after they are indexed, so inode, size and
+    index creation time identify the content. mtime is deliberately left
+    out: cache hits touch it on every hardlink of the same encode.
+    """
+    return f'"{stat_result.st_ino:x}-{stat_result.st_size:x}-{int(created_at * 1000):x}"'
+
+
+class FileSegmentsResponse(Response):
+    """
+    Streams literal byte strings and byte ranges of one file.
+
+    Used for full files, single ranges (206) and multipart/byteranges bodies.
+    The content length is known up front, so the body is sent without
+    chunked encoding. HEAD requests get the headers only.
+    """
+
+    chunk_size = 64 * 1024
+
+    def __init__(
+        self,
+        path: str,
+        segments: List[Segment],
+        status_code: int = 200,
+        headers: Optional[Mapping[str, str]] = None,
+        media_type: Optional[str] = None
+    ):
+        self.path = path
+        self.segments = segments
+        self.status_code = status_code
+        self.media_type = media_type
+        self.background = None
+        self.init_headers(headers)
+        length = sum(len(s) if isinstance(s, bytes) else s[1] - s[0] + 1 for s in segments)
+        self.headers["content-length"] = str(length)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        # Open before sending headers so a vanished file fails cleanly
+        file = await anyio.open_file(self.path, mode="rb")
+        sent = 0
+        try:
+            with stage("serve"):
+                await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+                if scope["method"].upper() != "HEAD":
+                    for segment in self.segments:
+                        if isinstance(segment, bytes):
+                            await send({"type": "http.response.body", "body": segment, "more_body": True})
+                            continue
+                        start, end = segment
+                        await file.seek(start)
+                        remaining = end - start + 1
+                        while remaining > 0:
+                            chunk = await file.read(min(self.chunk_size, remaining))
+                            if not chunk:
+                                break
+                            remaining -= len(chunk)
+                            sent += len(chunk)
+                            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+        finally:
+            count_served("file", sent)
+            await file.aclose()
+
+
+def file_response(
+    headers: Mapping[str, str],
+    path: str,
+    size: int,
+    etag: str,
+    last_modified: float,
+    media_type: str,
+    filename: str,
+    inline: bool = False
+) -> Response:
+    """
+    Build the response for a GET/HEAD of a file, honouring conditional and range headers.
+
+    Args:
+        headers: Request headers
+        path: File on disk
+        size: File size in bytes
+        etag: Strong entity tag of the file (quoted)
+        last_modified: Unix timestamp sent as Last-Modified
+        media_type: Content type of the file
+        filename: Name offered to the client
+        inline: Content-Disposition inline (play in the browser) instead of attachment
+
+    Returns:
+        304, 416, 206 (single or multipart/byteranges) or 200 response
+    """
+    validators = {
+        "accept-ranges": "bytes",
+        "etag": etag,
+        "last-modified": formatdate(last_modified, usegmt=True),
+    }
+    if is_not_modified(headers, etag, last_modified):
+        return Response(status_code=304, headers=validators)
+
+    response_headers = {**validators, "content-disposition": content_disposition(filename, inline)}
+    ranges = None
+    range_header = headers.get("range")
+    if_range = headers.get("if-range")
+    if range_header is not None and (if_range is None or if_range_matches(if_range, etag, last_modified)):
+        try:
+            ranges = parse_range_header(range_header, size)
+        except RangeNotSatisfiable:
+            return Response(status_code=416, headers={**validators, "content-range": f"bytes */{size}"})
+
+    if not ranges:
+        return FileSegmentsResponse(path, [(0, size - 1)] if size else [], 200, response_headers, media_type)
+
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        response_headers["content-range"] = f"bytes {start}-{end}/{size}"
+        return FileSegmentsResponse(path, [ranges[0]], 206, response_headers, media_type)
+
+    boundary = uuid.uuid4().hex
+    segments: List[Segment] = []
+    for start, end in ranges:
+        delimiter = f"\r\n--{boundary}" if segments else f"--{boundary}"
+        segments.append(
+            f"{delimiter}\r\nContent-Type: {media_type}\r\n"
+            f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n".encode("latin-1")
+        )
+        segments.append((start, end))
+    segments.append(f"\r\n--{boundary}--\r\n".encode("latin-1"))
+    return FileSegmentsResponse(path, segments, 206, response_headers, f"multipart/byteranges; boundary={boundary}")
+
@@ -0,0 +1,84 @@
+import threading
+import time
+import logging
+from typing import Any, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+# A probe returns (available, version) like converter.check_ytdlp_available
+Probe = Callable[[], Tuple[bool, Optional[str]]]
+
+
+class ToolProbes:
+    """
+    Cached availability checks of external tools (yt-dlp, ffmpeg).
+
+    Every probe spawns a process, so probes run once at startup and are then
+    refreshed by a background thread every ttl_seconds. Health endpoints
+    only read the cached results and never fork.
+    """
+
+    def __init__(self, probes: Dict[str, Probe], ttl_seconds: float = 300):
+        """
+        Initialize the probes
+
+        Args:
+            probes: Tool name -> function returning (available, version)
+            ttl_seconds: Seconds between background refreshes
+        """
+        self.probes = probes
+        self.ttl_seconds = ttl_seconds
+        self._results: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def refresh(self) -> None:
+        """Run every probe now and store the results"""
+        for name, probe in self.probes.items():
+            try:
+                available, version = probe()
+            except Exception as e:
+                logger.error(f"Probe for {name} failed: {e}")
+                available, version = False, None
+            with self._lock:
+                previous = self._results.get(name)
+                self._results[name] = {'available': available, 'version': version, 'checkedAt': time.time()}
+            if previous is not None and previous['available'] != available:
+                logger.warning(f"{name} is now {'available' if available else 'unavailable'}")
+
+    def get(self, name: str) -> Tuple[bool, Optional[str]]:
+        """Cached (available, version) of a tool"""
+        with self._lock:
+            result = self._results.get(name)
+        if result is None:
+            return False, None
+        return result['available'], result['version']
+
+    def all_available(self) -> bool:
+        """True if every tool was available at its last check"""
+        return all(self.get(name)[0] for name in self.probes)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Copy of every cached result"""
+        with self._lock:
+            return {name: dict(result) for name, result in self._results.items()}
+
+    def start(self) -> None:
+        """Probe synchronously once, then keep refreshing in the background"""
+        self.refresh()
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="tool-probes", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the background refresh"""
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stopping.wait(self.ttl_seconds):
+            self.refresh()
@@ -0,0 +1,617 @@
+import json
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional
+
+from fairness import BULK, FAST, FairQueue
+from playlists import PlaylistError, PlaylistExpander
+
+logger = logging.getLogger(__name__)
+
+
+# Item and job states
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+
+# Item kinds: one video, or a playlist/channel whose entries are added as items
+VIDEO = "video"
+PLAYLIST = "playlist"
+
+# Client of the items re-queued after a restart (the store does not keep clients)
+RESTORED_CLIENT = "restored"
+
+
+class QueueFullError(Exception):
+    """Raised when the scheduler cannot accept more work"""
+
+
+def new_job(items: List[tuple], job_id: Optional[str] = None, profile: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Build a job record.
+
+    Args:
+        items: List of (input_text, is_search) or (input_text, is_search, kind) tuples
+        job_id: Optional explicit job id
+        profile: Encoding profile for every item (None for the default)
+
+    Returns:
+        Job dictionary as stored by a JobStore
+    """
+    now = time.time()
+    return {
+        'id': job_id or str(uuid.uuid4()),
+        'status': QUEUED,
+        'profile': profile,
+        'createdAt': now,
+        'updatedAt': now,
+        'items': [
+            {
+                'index': index,
+                'input': text,
+                'wasSearch': is_search,
+                'status': QUEUED,
+                'result': None,
+                'kind': kind[0] if kind else VIDEO,
+                'parent': None,
+            }
+            for index, (text, is_search, *kind) in enumerate(items)
+        ],
+    }
+
+
+def job_status(items: List[Dict[str, Any]]) -> str:
+    """Derive the overall job status from its items"""
+    states = {item['status'] for item in items}
+    if states <= {COMPLETED, FAILED}:
+        return COMPLETED
+    if states == {QUEUED}:
+        return QUEUED
+    return RUNNING
+
+
+class JobStore:
+    """Interface for job state storage"""
+
+    def create(self, job: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def update_item(self, job_id: str, index: int, status: str, result: Optional[Dict[str, Any]] = None) -> Optional[str]:
+        """Update one item and return the resulting job status (None if the job does not exist)"""
+        raise NotImplementedError
+
+    def add_item(self, job_id: str, text: str, is_search: bool, parent: Optional[int] = None) -> Optional[int]:
+        """Append a queued video item to a job and return its index (None if the job does not exist)"""
+        raise NotImplementedError
+
+    def unfinished_items(self) -> List[tuple]:
+        """Return (job_id, index, input, is_search, profile, kind) for every item not yet finished"""
+        raise NotImplementedError
+
+    def prune(self, max_age_seconds: float) -> int:
+        """Delete finished jobs older than max_age_seconds, returning how many were removed"""
+        raise NotImplementedError
+
+
+class MemoryJobStore(JobStore):
+    """Job store that keeps everything in process memory"""
+
+    def __init__(self):
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def create(self, job: Dict[str, Any]) -> None:
+        with self._lock:
+            self._jobs[job['id']] = job
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            return {**job, 'items': [dict(item) for item in job['items']]}
+
+    def update_item(self, job_id: str, index: int, status: str, result: Optional[Dict[str, Any]] = None) -> Optional[str]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            item = job['items'][index]
+            item['status'] = status
+            if result is not None:
+                item['result'] = result
+            job['status'] = job_status(job['items'])
+            job['updatedAt'] = time.time()
+            return job['status']
+
+    def add_item(self, job_id: str, text: str, is_search: bool, parent: Optional[int] = None) -> Optional[int]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            index = len(job['items'])
+            job['items'].append({
+                'index': index,
+                'input': text,
+                'wasSearch': is_search,
+                'status': QUEUED,
+                'result': None,
+                'kind': VIDEO,
+                'parent': parent,
+            })
+            job['status'] = job_status(job['items'])
+            job['updatedAt'] = time.time()
+            return index
+
+    def unfinished_items(self) -> List[tuple]:
+        with self._lock:
+            return [
+                (job['id'], item['index'], item['input'], item['wasSearch'], job.get('profile'), item['kind'])
+                for job in self._jobs.values()
+                for item in job['items']
+                if item['status'] in (QUEUED, RUNNING)
+            ]
+
+    def prune(self, max_age_seconds: float) -> int:
+        cutoff = time.time() - max_age_seconds
+        with self._lock:
+            expired = [
+                job_id for job_id, job in self._jobs.items()
+                if job['status'] == COMPLETED and job['updatedAt'] < cutoff
+            ]
+            for job_id in expired:
+                del self._jobs[job_id]
+        return len(expired)
+
+
+class SQLiteJobStore(JobStore):
+    """Job store persisted in a SQLite database, so jobs survive restarts"""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                profile TEXT
+            );
+            CREATE TABLE IF NOT EXISTS job_items (
+                job_id TEXT NOT NULL REFERENCES jobs(id) ON DELETE CASCADE,
+                idx INTEGER NOT NULL,
+                input TEXT NOT NULL,
+                was_search INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                result TEXT,
+                kind TEXT NOT NULL DEFAULT 'video',
+                parent INTEGER,
+                PRIMARY KEY (job_id, idx)
+            );
+            CREATE INDEX IF NOT EXISTS job_items_status ON job_items(status);
+            """
+        )
+        # Databases created before encoding profiles existed lack the column
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        if "profile" not in columns:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN profile TEXT")
+        # ...and before playlist expansion
+        item_columns = {row[1] for row in self._conn.execute("PRAGMA table_info(job_items)")}
+        if "kind" not in item_columns:
+            self._conn.execute("ALTER TABLE job_items ADD COLUMN kind TEXT NOT NULL DEFAULT 'video'")
+            self._conn.execute("ALTER TABLE job_items ADD COLUMN parent INTEGER")
+        self._conn.commit()
+
+    def create(self, job: Dict[str, Any]) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO jobs (id, status, created_at, updated_at, profile) VALUES (?, ?, ?, ?, ?)",
+                (job['id'], job['status'], job['createdAt'], job['updatedAt'], job.get('profile'))
+            )
+            self._conn.executemany(
+                "INSERT INTO job_items (job_id, idx, input, was_search, status, result, kind, parent)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (job['id'], item['index'], item['input'], int(item['wasSearch']), item['status'],
+                     json.dumps(item['result']) if item['result'] is not None else None,
+                     item['kind'], item['parent'])
+                    for item in job['items']
+                ]
+            )
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, status, created_at, updated_at, profile FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            item_rows = self._conn.execute(
+                "SELECT idx, input, was_search, status, result, kind, parent"
+                " FROM job_items WHERE job_id = ? ORDER BY idx",
+                (job_id,)
+            ).fetchall()
+        return {
+            'id': row[0],
+            'status': row[1],
+            'createdAt': row[2],
+            'updatedAt': row[3],
+            'profile': row[4],
+            'items': [
+                {
+                    'index': idx,
+                    'input': text,
+                    'wasSearch': bool(was_search),
+                    'status': status,
+                    'result': json.loads(result) if result else None,
+                    'kind': kind,
+                    'parent': parent,
+                }
+                for idx, text, was_search, status, result, kind, parent in item_rows
+            ],
+        }
+
+    def update_item(self, job_id: str, index: int, status: str, result: Optional[Dict[str, Any]] = None) -> Optional[str]:
+        with self._lock, self._conn:
+            if result is not None:
+                self._conn.execute(
+                    "UPDATE job_items SET status = ?, result = ? WHERE job_id = ? AND idx = ?",
+                    (status, json.dumps(result), job_id, index)
+                )
+            else:
+                self._conn.execute(
+                    "UPDATE job_items SET status = ? WHERE job_id = ? AND idx = ?",
+                    (status, job_id, index)
+                )
+            return self._refresh_status(job_id)
+
+    def _refresh_status(self, job_id: str) -> Optional[str]:
+        """Recompute and store the status of a job from its items (caller holds the lock)"""
+        states = [
+            {'status': s} for (s,) in self._conn.execute(
+                "SELECT DISTINCT status FROM job_items WHERE job_id = ?", (job_id,)
+            )
+        ]
+        if not states:
+            return None
+        new_status = job_status(states)
+        self._conn.execute(
+            "UPDATE jobs SET status = ?, updated_at = ? WHERE id = ?",
+            (new_status, time.time(), job_id)
+        )
+        return new_status
+
+    def add_item(self, job_id: str, text: str, is_search: bool, parent: Optional[int] = None) -> Optional[int]:
+        with self._lock, self._conn:
+            if self._conn.execute("SELECT 1 FROM jobs WHERE id = ?", (job_id,)).fetchone() is None:
+                return None
+            (index,) = self._conn.execute(
+                "SELECT COALESCE(MAX(idx), -1) + 1 FROM job_items WHERE job_id = ?", (job_id,)
+            ).fetchone()
+            self._conn.execute(
+                "INSERT INTO job_items (job_id, idx, input, was_search, status, kind, parent)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job_id, index, text, int(is_search), QUEUED, VIDEO, parent)
+            )
+            self._refresh_status(job_id)
+            return index
+
+    def unfinished_items(self) -> List[tuple]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT i.job_id, i.idx, i.input, i.was_search, j.profile, i.kind"
+                " FROM job_items i JOIN jobs j ON j.id = i.job_id"
+                " WHERE i.status IN (?, ?) ORDER BY i.rowid",
+                (QUEUED, RUNNING)
+            ).fetchall()
+        return [
+            (job_id, idx, text, bool(was_search), profile, kind)
+            for job_id, idx, text, was_search, profile, kind in rows
+        ]
+
+    def prune(self, max_age_seconds: float) -> int:
+        cutoff = time.time() - max_age_seconds
+        with self._lock, self._conn:
+            expired = [
+                job_id for (job_id,) in self._conn.execute(
+                    "SELECT id FROM jobs WHERE status = ? AND updated_at < ?", (COMPLETED, cutoff)
+                )
+            ]
+            self._conn.executemany("DELETE FROM job_items WHERE job_id = ?", [(j,) for j in expired])
+            self._conn.executemany("DELETE FROM jobs WHERE id = ?", [(j,) for j in expired])
+        return len(expired)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def create_job_store(kind: str, db_path: str) -> JobStore:
+    """Create the job store selected by configuration ('memory' or 'sqlite')"""
+    if kind == "sqlite":
+        return SQLiteJobStore(db_path)
+    if kind == "memory":
+        return MemoryJobStore()
+    raise ValueError(f"Unknown job store: {kind}")
+
+
+class JobScheduler:
+    """
+    Bounded in-process scheduler for conversion jobs.
+
+    Jobs are split into items that go into a fixed-size queue drained by a
+    pool of worker threads. A job is only admitted if all of its items fit,
+    otherwise submit() raises QueueFullError so the API can answer 429.
+    The queue is a FairQueue: workers take the items of the clients in
+    turn (weighted), and jobs of a single video go to the fast lane, so a
+    client's big job does not hold back the jobs of others.
+
+    Playlist items (see PlaylistExpander) are enumerated on a pool of their
+    own instead: each entry is appended to the job as a new item and queued
+    as soon as yt-dlp reports it. At most playlist_window entries of one
+    playlist are queued or converting at a time, and the enumeration waits
+    (leaving yt-dlp blocked on its pipe) until one of them finishes, so a
+    long playlist occupies memory and queue slots for its in-flight entries
+    only. The playlist item finishes when the enumeration does, with a
+    summary of the expansion as its result.
+    """
+
+    def __init__(
+        self,
+        store: JobStore,
+        convert_fn: Callable[..., Dict[str, Any]],
+        workers: int = 4,
+        max_queue: int = 100,
+        job_ttl_seconds: float = 24 * 3600,
+        on_event: Optional[Callable[[str, Dict[str, Any]], None]] = None,
+        expander: Optional[PlaylistExpander] = None,
+        playlist_window: Optional[int] = None,
+        playlist_workers: int = 2,
+        fair_queue: Optional[FairQueue] = None
+    ):
+        """
+        Initialize the scheduler
+
+        Args:
+            store: Where job state is kept
+            convert_fn: Called as convert_fn(input_text, is_search=..., progress=..., profile=...)
+                for each item
+            workers: Number of worker threads
+            max_queue: Maximum number of queued (not yet running) items
+            job_ttl_seconds: Finished jobs older than this are pruned from the store
+            on_event: Optional callback receiving (job_id, event) for item status
+                changes, added playlist entries and progress updates; called
+                from worker threads
+            expander: Expands playlist and channel URLs (None converts them as
+                single items)
+            playlist_window: Entries of one playlist queued or converting at
+                the same time (default: twice the number of workers)
+            playlist_workers: Playlists enumerated at the same time
+            fair_queue: Queue of the items, with the client weights and
+                in-flight cap (default: equal weights, no cap)
+        """
+        self.store = store
+        self.convert_fn = convert_fn
+        self.workers = max(1, workers)
+        self.max_queue = max(1, max_queue)
+        self.job_ttl_seconds = job_ttl_seconds
+        self.on_event = on_event
+        self.expander = expander
+        self.playlist_window = max(1, playlist_window or 2 * self.workers)
+        self.playlist_workers = max(1, playlist_workers)
+        self._expansions: Optional[ThreadPoolExecutor] = None
+        self._queue = fair_queue or FairQueue()
+        self._admission = threading.Lock()
+        self._threads: List[threading.Thread] = []
+        self._stopping = threading.Event()
+        self._active = 0
+        self._active_lock = threading.Lock()
+        self._last_prune = 0.0
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of items waiting for a worker"""
+        return self._queue.qsize()
+
+    def queue_stats(self) -> Dict[str, Any]:
+        """Queued items and queue waits by lane and by client (see FairQueue.stats)"""
+        return self._queue.stats()
+
+    @property
+    def active_workers(self) -> int:
+        """Number of workers currently converting an item"""
+        return self._active
+
+    def start(self) -> None:
+        """Start worker threads and re-queue work left over from a previous run"""
+        self._stopping.clear()
+        self._expansions = ThreadPoolExecutor(max_workers=self.playlist_workers, thread_name_prefix="playlist")
+        for job_id, index, text, is_search, profile, kind in self.store.unfinished_items():
+            if kind == PLAYLIST:
+                # Entries found before the restart are queued items of their own;
+                # enumerating again would add them a second time
+                self.store.update_item(job_id, index, FAILED, {
+                    'success': False,
+                    'error': "Playlist expansion was interrupted by a restart",
+                    'originalInput': text,
+                })
+                continue
+            self.store.update_item(job_id, index, QUEUED)
+            self._queue.put(RESTORED_CLIENT, (job_id, index, text, is_search, profile, None))
+        if self.queue_depth:
+            logger.info(f"Re-queued {self.queue_depth} unfinished job items")
+
+        for n in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"job-worker-{n}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Job scheduler started ({self.workers} workers, queue size {self.max_queue})")
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Stop worker threads; items still queued stay unfinished in the store"""
+        self._stopping.set()
+        if self._expansions is not None:
+            self._expansions.shutdown(wait=False, cancel_futures=True)
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        logger.info("Job scheduler stopped")
+
+    def submit(self, items: List[tuple], profile: Optional[str] = None, client: str = "") -> Dict[str, Any]:
+        """
+        Create a job and queue its items
+
+        Args:
+            items: List of (input_text, is_search) tuples; URLs accepted by the
+                expander are expanded into their entries
+            profile: Encoding profile for every item (None for the default)
+            client: Who submitted the job, for fair queuing
+
+        Returns:
+            The new job record
+
+        Raises:
+            ValueError: If the job has more items than the whole queue can hold
+            QueueFullError: If the queue cannot take all items of the job right now
+        """
+        if len(items) > self.max_queue:
+            raise ValueError(f"Job has {len(items)} items, the queue holds at most {self.max_queue}")
+        
+        self._maybe_prune()
+        with self._admission:
+            if self.queue_depth + len(items) > self.max_queue:
+                raise QueueFullError(
+                    f"Queue full ({self.queue_depth}/{self.max_queue} items waiting)"
+                )
+            job = new_job([(text, is_search, self._kind(text, is_search)) for text, is_search in items], profile=profile)
+            self.store.create(job)
+            lane = FAST if len(items) == 1 else BULK
+            for item in job['items']:
+                if item['kind'] == PLAYLIST:
+                    self._expansions.submit(self._expand, job['id'], item['index'], item['input'], profile, client)
+                else:
+                    self._queue.put(
+                        client, (job['id'], item['index'], item['input'], item['wasSearch'], profile, None), lane
+                    )
+        return job
+
+    def _kind(self, text: str, is_search: bool) -> str:
+        if not is_search and self.expander is not None and self.expander.accepts(text):
+            return PLAYLIST
+        return VIDEO
+
+    def _expand(self, job_id: str, index: int, url: str, profile: Optional[str], client: str) -> None:
+        """Enumerate a playlist item, queueing every entry as soon as it is known"""
+        self._update(job_id, index, RUNNING)
+        window = threading.Semaphore(self.playlist_window)
+        expansion = self.expander.expand(url)
+        error = None
+        try:
+            for entry in expansion:
+                if not self._wait_for_room(window):
+                    # Stopping: the item stays unfinished and fails on the next start()
+                    return
+                child = self.store.add_item(job_id, entry.url, False, parent=index)
+                if child is None:
+                    return
+                if self.on_event is not None:
+                    self._emit(job_id, {
+                        'type': 'added', 'index': child, 'input': entry.url, 'parent': index, 'title': entry.title
+                    })
+                self._queue.put(client, (job_id, child, entry.url, False, profile, window.release), BULK)
+        except PlaylistError as e:
+            error = str(e)
+        except Exception as e:
+            logger.error(f"Job {job_id} playlist {url} crashed: {e}")
+            error = f"Unexpected error: {str(e)}"
+        
+        summary = expansion.summary(error)
+        logger.info(
+            f"Job {job_id}: playlist {url} expanded to {summary['entries']} entries"
+            + (f" (stopped at {summary['truncated']})" if summary['truncated'] else "")
+            + (f", failed: {error}" if error else "")
+        )
+        self._update(job_id, index, FAILED if error else COMPLETED, summary)
+
+    def _wait_for_room(self, window: threading.Semaphore) -> bool:
+        """Block until the playlist's window and the queue have room; False when stopping"""
+        while not window.acquire(timeout=0.5):
+            if self._stopping.is_set():
+                return False
+        while self.queue_depth >= self.max_queue:
+            if self._stopping.wait(0.2):
+                window.release()
+                return False
+        return True
+
+    def _worker(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                ticket = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            job_id, index, text, is_search, profile, on_done = ticket.item
+
+            with self._active_lock:
+                self._active += 1
+            try:
+                self._update(job_id, index, RUNNING)
+                try:
+                    result = self.convert_fn(
+                        text,
+                        is_search=is_search,
+                        progress=partial(self._progress, job_id, index),
+                        profile=profile
+                    )
+                except Exception as e:
+                    logger.error(f"Job {job_id} item {index} crashed: {e}")
+                    result = None
+                status = COMPLETED if result and result.get('success') else FAILED
+                self._update(job_id, index, status, result)
+            finally:
+                with self._active_lock:
+                    self._active -= 1
+                if on_done is not None:
+                    on_done()
+                self._queue.done(ticket)
+
+    def _update(self, job_id: str, index: int, status: str, result: Optional[Dict[str, Any]] = None) -> None:
+        job_state = self.store.update_item(job_id, index, status, result)
+        if self.on_event is None:
+            return
+        self._emit(job_id, {'type': 'item', 'index': index, 'status': status, 'result': result})
+        if job_state == COMPLETED:
+            self._emit(job_id, {'type': 'job', 'status': COMPLETED})
+
+    def _progress(self, job_id: str, index: int, event: Dict[str, Any]) -> None:
+        if self.on_event is not None:
+            self._emit(job_id, {'type': 'progress', 'index': index, **event})
+
+    def _emit(self, job_id: str, event: Dict[str, Any]) -> None:
+        try:
+            self.on_event(job_id, event)
+        except Exception as e:
+            logger.debug(f"Job event callback failed: {e}")
+
+    def _maybe_prune(self) -> None:
+        now = time.time()
+        if now - self._last_prune < 60:
+            return
+        self._last_prune = now
+        removed = self.store.prune(self.job_ttl_seconds)
+        if removed:
+            logger.info(f"Pruned {removed} expired jobs")
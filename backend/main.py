@@ -1,19 +1,70 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from functools import partial
+import asyncio
+import hashlib
+import json
 import os
+import shutil
 import logging
-from pathlib import Path
+from typing import Optional
 from dotenv import load_dotenv
 
-from models import ConvertRequest, ConvertResponse, ConversionResult, HealthResponse
+from archive import stream_zip, unique_names
+from broker import RemoteConverter, RemotePlaylistEnumerator, create_broker, default_broker_url
+from metrics import Metrics, configure_metrics, metered
+from file_responses import content_disposition, file_etag, file_response
+from streaming import GrowingFile
+from profiles import PROFILES, get_profile, media_type_for, set_default_profile
+from models import (
+    ConvertRequest,
+    ConvertResponse,
+    ConversionResult,
+    FileInfoResponse,
+    HealthResponse,
+    ReadinessResponse,
+    JobItem,
+    JobResponse,
+    JobSubmitResponse,
+    set_request_limits
+)
 from converter import (
-    convert_batch,
+    convert_single,
+    convert_batch_async,
+    coalescing_stats,
+    configure_cache,
+    configure_engine,
+    configure_file_index,
+    configure_limits,
+    configure_retries,
+    configure_search,
+    configure_segmenting,
+    configure_tagging,
+    pending_tagging,
+    search_stats,
+    segmenting_stats,
+    tagging_stats,
+    upstream_stats,
     check_ytdlp_available,
     check_ffmpeg_available,
-    format_size
+    get_stream,
+    run_blocking,
+    start_stream
 )
+from cache import ConversionCache
+from engines import DownloadError, create_engine
+from search import SearchCache, SearchResolver, create_search_backend
+from segmented import SegmentedTranscoder
+from storage import FileIndex
+from tagging import Tagger, TaggingStage, ThumbnailCache
+from upstream import THROTTLED, RetryPolicy
 from cleanup import FileCleanupService
+from health import ToolProbes
+from fairness import BULK, FAST, FairExecutor, FairQueue, parse_weights
+from jobs import PLAYLIST, VIDEO, JobScheduler, QueueFullError, create_job_store
+from playlists import PlaylistExpander
+from progress import ProgressBroker
 
 # Load environment variables
 load_dotenv()
@@ -37,12 +88,231 @@ OUTPUT_DIR = os.getenv("OUTPUT_DIR", "archivos_mp3")
 FFMPEG_PATH = os.getenv("FFMPEG_PATH", r"C:\ffmpeg-2026-01-07-git-af6a1dd0b2-essentials_build\bin")
 CORS_ORIGINS = os.getenv("CORS_ORIGINS", "http://localhost:5173,http://localhost:5174").split(",")
 FILE_TTL_HOURS = int(os.getenv("FILE_TTL_HOURS", "24"))
+CLEANUP_INTERVAL_SECONDS = int(os.getenv("CLEANUP_INTERVAL_SECONDS", "60"))
+DISK_HIGH_WATERMARK = float(os.getenv("DISK_HIGH_WATERMARK", "0")) or None
+DISK_LOW_WATERMARK = float(os.getenv("DISK_LOW_WATERMARK", "0")) or None
+CONVERSION_WORKERS = int(os.getenv("CONVERSION_WORKERS", "4"))
+MAX_CONCURRENT_DOWNLOADS = int(os.getenv("MAX_CONCURRENT_DOWNLOADS", str(CONVERSION_WORKERS)))
+MAX_CONCURRENT_TRANSCODES = int(os.getenv("MAX_CONCURRENT_TRANSCODES", str(max(1, (os.cpu_count() or 2) // 2))))
+MIN_CONCURRENT_DOWNLOADS = int(os.getenv("MIN_CONCURRENT_DOWNLOADS", "1"))
+SEGMENT_MIN_DURATION_SECONDS = float(os.getenv("SEGMENT_MIN_DURATION_SECONDS", "1200"))
+SEGMENT_SECONDS = float(os.getenv("SEGMENT_SECONDS", "120"))
+DOWNLOAD_RETRIES = int(os.getenv("DOWNLOAD_RETRIES", "3"))
+DOWNLOAD_RETRY_DELAY_SECONDS = float(os.getenv("DOWNLOAD_RETRY_DELAY_SECONDS", "1"))
+DOWNLOAD_THROTTLED_DELAY_SECONDS = float(os.getenv("DOWNLOAD_THROTTLED_DELAY_SECONDS", "5"))
+DOWNLOAD_RETRY_MAX_DELAY_SECONDS = float(os.getenv("DOWNLOAD_RETRY_MAX_DELAY_SECONDS", "60"))
+YTDLP_ENGINE = os.getenv("YTDLP_ENGINE", "subprocess")
+JOB_STORE = os.getenv("JOB_STORE", "memory")
+JOB_DB_PATH = os.getenv("JOB_DB_PATH", "jobs.sqlite3")
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "200"))
+MAX_ZIP_FILES = int(os.getenv("MAX_ZIP_FILES", "200"))
+TOOL_PROBE_TTL_SECONDS = int(os.getenv("TOOL_PROBE_TTL_SECONDS", "300"))
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "ytdlp")
+SEARCH_CONCURRENCY = int(os.getenv("SEARCH_CONCURRENCY", "8"))
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "1000"))
+SEARCH_CACHE_TTL_HOURS = float(os.getenv("SEARCH_CACHE_TTL_HOURS", "6"))
+DEFAULT_AUDIO_PROFILE = os.getenv("DEFAULT_AUDIO_PROFILE", "mp3-v0")
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+PLAYLIST_MAX_ITEMS = int(os.getenv("PLAYLIST_MAX_ITEMS", "200"))
+PLAYLIST_MAX_DURATION_HOURS = float(os.getenv("PLAYLIST_MAX_DURATION_HOURS", "10"))
+PLAYLIST_WINDOW = int(os.getenv("PLAYLIST_WINDOW", str(CONVERSION_WORKERS * 2)))
+PLAYLIST_CONCURRENCY = int(os.getenv("PLAYLIST_CONCURRENCY", "2"))
+TAGGING_ENABLED = os.getenv("TAGGING_ENABLED", "true").lower() in ("1", "true", "yes")
+TAG_WORKERS = int(os.getenv("TAG_WORKERS", "2"))
+TAG_COVER_ART = os.getenv("TAG_COVER_ART", "true").lower() in ("1", "true", "yes")
+THUMBNAIL_CACHE_DIR = os.getenv("THUMBNAIL_CACHE_DIR", os.path.join(OUTPUT_DIR, ".thumbnails"))
+THUMBNAIL_CACHE_SIZE = int(os.getenv("THUMBNAIL_CACHE_SIZE", "1000"))
+FILE_INDEX_PATH = os.getenv("FILE_INDEX_PATH", os.path.join(OUTPUT_DIR, ".index", "files.sqlite3"))
+CACHE_ENABLED = os.getenv("CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+CACHE_DIR = os.getenv("CACHE_DIR", os.path.join(OUTPUT_DIR, ".cache"))
+CACHE_MAX_MB = int(os.getenv("CACHE_MAX_MB", "2048"))
+CACHE_TTL_HOURS = int(os.getenv("CACHE_TTL_HOURS", str(FILE_TTL_HOURS * 7)))
+BROKER = os.getenv("BROKER", "local")
+BROKER_URL = os.getenv("BROKER_URL") or default_broker_url(BROKER, OUTPUT_DIR)
+BROKER_RESULT_TIMEOUT_SECONDS = float(os.getenv("BROKER_RESULT_TIMEOUT_SECONDS", "3600"))
+MAX_REQUEST_ITEMS = int(os.getenv("MAX_REQUEST_ITEMS", "500"))
+MAX_INPUT_LENGTH = int(os.getenv("MAX_INPUT_LENGTH", "2048"))
+CLIENT_MAX_IN_FLIGHT = int(os.getenv("CLIENT_MAX_IN_FLIGHT", "0"))
+CLIENT_WEIGHTS = parse_weights(os.getenv("CLIENT_WEIGHTS", ""))
+FAST_LANE_WORKERS = int(os.getenv("FAST_LANE_WORKERS", "1"))
 
 # Ensure output directory exists
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
+# Apply process-wide download/transcode limits, download retries, encoding profile and the yt-dlp engine
+set_default_profile(DEFAULT_AUDIO_PROFILE)
+configure_limits(MAX_CONCURRENT_DOWNLOADS, MAX_CONCURRENT_TRANSCODES, MIN_CONCURRENT_DOWNLOADS)
+configure_retries(RetryPolicy(
+    max_retries=DOWNLOAD_RETRIES,
+    base_delay=DOWNLOAD_RETRY_DELAY_SECONDS,
+    throttled_delay=DOWNLOAD_THROTTLED_DELAY_SECONDS,
+    max_delay=DOWNLOAD_RETRY_MAX_DELAY_SECONDS
+))
+configure_engine(create_engine(YTDLP_ENGINE, pool_size=MAX_CONCURRENT_DOWNLOADS))
+
+# Encode long MP3 conversions in parallel segments (SEGMENT_MIN_DURATION_SECONDS=0 disables)
+segmented_transcoder = None
+if SEGMENT_MIN_DURATION_SECONDS > 0:
+    segmented_transcoder = SegmentedTranscoder(SEGMENT_MIN_DURATION_SECONDS, SEGMENT_SECONDS)
+configure_segmenting(segmented_transcoder)
+
+# Initialize the index of converted files
+file_index = FileIndex(FILE_INDEX_PATH, OUTPUT_DIR)
+configure_file_index(file_index)
+
+# Initialize conversion cache
+conversion_cache = None
+if CACHE_ENABLED:
+    conversion_cache = ConversionCache(
+        CACHE_DIR,
+        max_bytes=CACHE_MAX_MB * 1024 * 1024,
+        max_age_seconds=CACHE_TTL_HOURS * 3600
+    )
+configure_cache(conversion_cache)
+
+# Resolve search queries to videos ahead of downloads ("off" leaves searching to yt-dlp);
+# in worker mode the workers resolve them, so API nodes never run searches
+search_resolver = None
+if SEARCH_BACKEND != "off" and BROKER == "local":
+    search_resolver = SearchResolver(
+        create_search_backend(SEARCH_BACKEND),
+        SearchCache(max_entries=SEARCH_CACHE_SIZE, ttl_seconds=SEARCH_CACHE_TTL_HOURS * 3600),
+        max_workers=SEARCH_CONCURRENCY
+    )
+configure_search(search_resolver)
+
+# Tag converted files (and embed cover art) on a worker pool behind the transcodes
+tagging_stage = None
+if TAGGING_ENABLED:
+    try:
+        thumbnails = ThumbnailCache(THUMBNAIL_CACHE_DIR, max_entries=THUMBNAIL_CACHE_SIZE) if TAG_COVER_ART else None
+        tagging_stage = TaggingStage(Tagger(thumbnails), max_workers=TAG_WORKERS)
+    except ImportError:
+        logger.warning("mutagen is not installed; converted files will not be tagged")
+configure_tagging(tagging_stage)
+
 # Initialize cleanup service
-cleanup_service = FileCleanupService(OUTPUT_DIR, FILE_TTL_HOURS)
+cleanup_service = FileCleanupService(
+    OUTPUT_DIR,
+    FILE_TTL_HOURS,
+    cache=conversion_cache,
+    file_index=file_index,
+    interval_seconds=CLEANUP_INTERVAL_SECONDS,
+    high_watermark=DISK_HIGH_WATERMARK,
+    low_watermark=DISK_LOW_WATERMARK
+)
+
+# In worker mode conversions are queued on a broker and run by worker
+# processes (python -m backend.worker); this node admits and serves them
+remote_converter = None
+if BROKER != "local":
+    remote_converter = RemoteConverter(
+        create_broker(BROKER, BROKER_URL),
+        OUTPUT_DIR,
+        file_index,
+        result_timeout=BROKER_RESULT_TIMEOUT_SECONDS
+    )
+
+# Items of /api/convert requests run on one pool shared fairly between clients
+# (weighted fair queuing, fast lane for single-item requests)
+set_request_limits(MAX_REQUEST_ITEMS, MAX_INPUT_LENGTH)
+convert_queue = FairQueue(CLIENT_MAX_IN_FLIGHT, CLIENT_WEIGHTS)
+convert_executor = FairExecutor(convert_queue, CONVERSION_WORKERS, FAST_LANE_WORKERS, name="convert")
+
+
+def client_id(request: Request) -> str:
+    """Who a request counts against for fair queuing: its API key (hashed) or its address"""
+    api_key = request.headers.get("X-API-Key")
+    if api_key:
+        return "key:" + hashlib.sha256(api_key.encode()).hexdigest()[:12]
+    return request.client.host if request.client else "unknown"
+
+
+# Initialize job scheduler and the broker fanning its events out to SSE clients
+progress_broker = ProgressBroker()
+job_scheduler = JobScheduler(
+    store=create_job_store(JOB_STORE, JOB_DB_PATH),
+    convert_fn=(
+        remote_converter.convert_single if remote_converter
+        else partial(convert_single, output_dir=OUTPUT_DIR, ffmpeg_path=FFMPEG_PATH)
+    ),
+    workers=CONVERSION_WORKERS,
+    max_queue=JOB_QUEUE_SIZE,
+    job_ttl_seconds=FILE_TTL_HOURS * 3600,
+    on_event=progress_broker.publish,
+    expander=PlaylistExpander(
+        # In worker mode playlists are listed by the workers too
+        enumerator=RemotePlaylistEnumerator(remote_converter) if remote_converter else None,
+        max_items=PLAYLIST_MAX_ITEMS,
+        max_duration_seconds=PLAYLIST_MAX_DURATION_HOURS * 3600
+    ),
+    playlist_window=PLAYLIST_WINDOW,
+    playlist_workers=PLAYLIST_CONCURRENCY,
+    fair_queue=FairQueue(CLIENT_MAX_IN_FLIGHT, CLIENT_WEIGHTS)
+)
+
+
+def cache_counters(counter: str) -> dict:
+    """One counter ('hits', 'misses') of every enabled cache, by cache name"""
+    caches = {
+        'conversion': conversion_cache.stats() if conversion_cache else None,
+        'search': search_stats(),
+        'thumbnail': (tagging_stats() or {}).get('thumbnails'),
+    }
+    return {name: counts[counter] for name, counts in caches.items() if counts is not None}
+
+
+# Prometheus metrics: stage timings are recorded as the pipeline runs, the
+# rest is read from the services below whenever /metrics is scraped
+metrics = None
+if METRICS_ENABLED:
+    try:
+        metrics = Metrics()
+    except ImportError:
+        logger.warning("prometheus_client is not installed; /metrics is disabled")
+if metrics is not None:
+    metrics.gauge("ytmp3_job_queue_depth", "Job items waiting for a conversion worker",
+                  lambda: job_scheduler.queue_depth)
+    metrics.gauge("ytmp3_job_active_workers", "Conversion workers currently converting an item",
+                  lambda: job_scheduler.active_workers)
+    metrics.gauge("ytmp3_tagging_pending", "Converted files queued or being tagged",
+                  lambda: tagging_stage.stats()['pending'] if tagging_stage else None)
+    metrics.counter("ytmp3_cache_hits", "Cache lookups answered from the cache",
+                    partial(cache_counters, 'hits'), label="cache")
+    metrics.counter("ytmp3_cache_misses", "Cache lookups that missed",
+                    partial(cache_counters, 'misses'), label="cache")
+    metrics.counter("ytmp3_cache_evictions", "Conversion cache entries evicted",
+                    lambda: conversion_cache.stats()['evictions'] if conversion_cache else None)
+    metrics.gauge("ytmp3_cache_bytes", "Size of the conversion cache (may share inodes with output files)",
+                  lambda: conversion_cache.stats()['bytes'] if conversion_cache else None)
+    metrics.counter("ytmp3_coalesced_requests", "Conversions that joined an identical one in flight",
+                    lambda: coalescing_stats()['coalesced'])
+    metrics.gauge("ytmp3_output_bytes", "Size of the converted files in OUTPUT_DIR",
+                  lambda: file_index.total_bytes)
+    metrics.gauge("ytmp3_output_files", "Number of converted files in OUTPUT_DIR",
+                  lambda: len(file_index))
+    metrics.counter("ytmp3_cleanup_deletions", "Files deleted by the cleanup service",
+                    lambda: dict(cleanup_service.deletions), label="reason")
+    metrics.gauge("ytmp3_download_concurrency_limit", "Downloads currently allowed at once (adapts to throttling)",
+                  lambda: upstream_stats()['limit'])
+    metrics.counter("ytmp3_download_attempts", "Download attempts by outcome",
+                    lambda: upstream_stats()['outcomes'], label="outcome")
+    metrics.counter("ytmp3_download_retries", "Download attempts retried after a throttled or transient error",
+                    lambda: upstream_stats()['retries'])
+    metrics.counter("ytmp3_segmented_segments", "Segments of MP3 conversions encoded in parallel",
+                    lambda: (segmenting_stats() or {}).get('segments'))
+    metrics.gauge("ytmp3_broker_tasks", "Broker tasks by state (worker mode)",
+                  lambda: remote_converter.stats() if remote_converter else None, label="state")
+configure_metrics(metrics)
+
+# Tool availability is probed at startup and refreshed in the background
+tool_probes = ToolProbes(
+    {
+        'yt-dlp': check_ytdlp_available,
+        'ffmpeg': partial(check_ffmpeg_available, FFMPEG_PATH),
+    },
+    ttl_seconds=TOOL_PROBE_TTL_SECONDS
+)
 
 # Configure CORS
 app.add_middleware(
@@ -51,6 +321,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["GET", "POST", "OPTIONS"],
     allow_headers=["Content-Type", "Authorization"],
+    expose_headers=["X-File-Id"],
 )
 
 
@@ -62,16 +333,53 @@ async def startup_event():
     logger.info(f"FFMPEG path: {FFMPEG_PATH}")
     logger.info(f"CORS origins: {CORS_ORIGINS}")
     logger.info(f"File TTL: {FILE_TTL_HOURS} hours")
+    logger.info(
+        f"Workers: {CONVERSION_WORKERS} "
+        f"(downloads: {MIN_CONCURRENT_DOWNLOADS}-{MAX_CONCURRENT_DOWNLOADS}, transcodes: {MAX_CONCURRENT_TRANSCODES})"
+    )
+    logger.info(
+        f"Fair queuing: {len(CLIENT_WEIGHTS)} weighted clients, {FAST_LANE_WORKERS} fast-lane workers, "
+        f"in-flight cap per client: {CLIENT_MAX_IN_FLIGHT or 'none'}"
+    )
+    logger.info(f"Download retries: {DOWNLOAD_RETRIES} (backoff from {DOWNLOAD_RETRY_DELAY_SECONDS}s)")
+    if segmented_transcoder:
+        logger.info(
+            f"Segmented MP3 encoding: sources from {SEGMENT_MIN_DURATION_SECONDS:g}s in {SEGMENT_SECONDS:g}s segments"
+        )
+    logger.info(f"yt-dlp engine: {YTDLP_ENGINE}")
+    logger.info(f"Search backend: {SEARCH_BACKEND}")
+    if tagging_stage:
+        logger.info(f"Tagging: {TAG_WORKERS} workers (cover art: {'on' if TAG_COVER_ART else 'off'})")
+    
+    if remote_converter:
+        logger.info(f"Worker mode: conversions queued on {BROKER} broker ({BROKER_URL})")
+    logger.info(f"Job store: {JOB_STORE} (queue size: {JOB_QUEUE_SIZE})")
+    logger.info(
+        f"Playlists: up to {PLAYLIST_MAX_ITEMS} videos / {PLAYLIST_MAX_DURATION_HOURS} hours "
+        f"({PLAYLIST_WINDOW} in flight per playlist)"
+    )
+    logger.info(f"File index: {FILE_INDEX_PATH} ({len(file_index)} files)")
+    if conversion_cache:
+        logger.info(f"Conversion cache: {CACHE_DIR} (max {CACHE_MAX_MB} MB, TTL {CACHE_TTL_HOURS} hours)")
     
-    # Start cleanup service
+    # Probe tools, start cleanup service and job scheduler
+    await run_blocking(tool_probes.start)
     cleanup_service.start()
+    job_scheduler.start()
 
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Stop background services on app shutdown"""
     logger.info("Shutting down YouTube to MP3 Converter API")
+    job_scheduler.stop()
+    convert_executor.shutdown()
+    if remote_converter:
+        remote_converter.stop()
+    if tagging_stage:
+        tagging_stage.shutdown()
     cleanup_service.stop()
+    tool_probes.stop()
 
 
 @app.get("/")
@@ -82,8 +390,18 @@ async def root():
         "version": "1.0.0",
         "endpoints": {
             "health": "/api/health",
+            "liveness": "/api/health/live",
+            "readiness": "/api/health/ready",
+            "stats": "/api/stats",
+            "metrics": "/metrics",
             "convert": "/api/convert",
-            "download": "/api/download/{file_id}"
+            "jobs": "/api/jobs",
+            "job": "/api/jobs/{job_id}",
+            "job_events": "/api/jobs/{job_id}/events",
+            "job_download": "/api/jobs/{job_id}/download",
+            "download": "/api/download/{file_id}",
+            "stream": "/api/stream?url={url} or ?query={query}",
+            "download_batch": "/api/download/batch?ids={id},{id},..."
         }
     }
 
@@ -92,9 +410,12 @@ async def root():
 async def health_check():
     """
     Check API health and availability of required tools (yt-dlp, ffmpeg)
+
+    Tool checks are cached (see TOOL_PROBE_TTL_SECONDS), so this never
+    spawns a process.
     """
-    ytdlp_available, ytdlp_version = check_ytdlp_available()
-    ffmpeg_available, ffmpeg_version = check_ffmpeg_available(FFMPEG_PATH)
+    ytdlp_available, ytdlp_version = tool_probes.get('yt-dlp')
+    ffmpeg_available, ffmpeg_version = tool_probes.get('ffmpeg')
     
     status = "healthy" if (ytdlp_available and ffmpeg_available) else "degraded"
     
@@ -107,11 +428,93 @@ async def health_check():
     )
 
 
+@app.get("/api/health/live")
+async def liveness_check():
+    """
+    Liveness probe: the process is up and the event loop is responsive
+    """
+    return {"status": "alive"}
+
+
+@app.get("/api/health/ready", response_model=ReadinessResponse)
+async def readiness_check():
+    """
+    Readiness probe: tools are available and the job queue has room.
+
+    Answers 503 when the instance should not receive new work.
+    """
+    ytdlp_available = tool_probes.get('yt-dlp')[0]
+    ffmpeg_available = tool_probes.get('ffmpeg')[0]
+    queue_depth = job_scheduler.queue_depth
+    ready = ytdlp_available and ffmpeg_available and queue_depth < job_scheduler.max_queue
+    
+    response = ReadinessResponse(
+        status="ready" if ready else "not_ready",
+        ytdlp_available=ytdlp_available,
+        ffmpeg_available=ffmpeg_available,
+        queue_depth=queue_depth,
+        queue_capacity=job_scheduler.max_queue,
+        active_workers=job_scheduler.active_workers,
+        disk_free_bytes=shutil.disk_usage(OUTPUT_DIR).free
+    )
+    return JSONResponse(status_code=200 if ready else 503, content=response.model_dump())
+
+
+@app.get("/api/stats")
+async def stats():
+    """
+    Internal counters: request coalescing, download limit and retries, search resolution,
+    segmented encoding, tagging, conversion cache, broker and fair queuing
+    """
+    return {
+        "coalescing": coalescing_stats(),
+        "upstream": upstream_stats(),
+        "search": search_stats(),
+        "segmented": segmenting_stats(),
+        "tagging": tagging_stats(),
+        "cache": conversion_cache.stats() if conversion_cache else None,
+        "broker": await run_blocking(remote_converter.stats) if remote_converter else None,
+        "fairness": {"convert": convert_queue.stats(), "jobs": job_scheduler.queue_stats()}
+    }
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """
+    Prometheus metrics: stage durations, queue depth, subprocesses, caches, bytes served and on disk
+    """
+    if metrics is None:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    content, content_type = metrics.render()
+    return Response(content=content, media_type=content_type)
+
+
+@app.get("/api/profiles")
+async def list_profiles():
+    """
+    Encoding profiles accepted by the convert, jobs and stream endpoints
+    """
+    default = get_profile().name
+    return [
+        {
+            "name": profile.name,
+            "extension": profile.extension,
+            "description": profile.description,
+            "streamable": profile.stream_format is not None,
+            "default": profile.name == default
+        }
+        for profile in PROFILES.values()
+    ]
+
+
 @app.post("/api/convert", response_model=ConvertResponse)
-async def convert_videos(request: ConvertRequest):
+async def convert_videos(request: ConvertRequest, http_request: Request):
     """
     Convert YouTube videos to MP3.
     Accepts both direct URLs and search queries.
+
+    Items wait in a queue shared fairly between clients (see /api/stats,
+    "fairness"); requests of a single item take the fast lane.
     """
     # Validate request
     if not request.urls and not request.searchQueries:
@@ -123,14 +526,23 @@ async def convert_videos(request: ConvertRequest):
     total_inputs = len(request.urls) + len(request.searchQueries)
     logger.info(f"Processing conversion request: {len(request.urls)} URLs, {len(request.searchQueries)} searches")
     
+    submit = partial(convert_executor.submit, client_id(http_request), lane=FAST if total_inputs == 1 else BULK)
     try:
-        # Convert all inputs
-        results_data = convert_batch(
-            urls=request.urls,
-            search_queries=request.searchQueries,
-            output_dir=OUTPUT_DIR,
-            ffmpeg_path=FFMPEG_PATH
-        )
+        if remote_converter:
+            # Queue the inputs for the workers as they are admitted and wait for all of them
+            futures = remote_converter.submit_batch(request.urls, request.searchQueries, request.profile, submit=submit)
+            results_data = await asyncio.gather(*map(asyncio.wrap_future, futures))
+        else:
+            # Convert all inputs off the event loop
+            results_data = await convert_batch_async(
+                urls=request.urls,
+                search_queries=request.searchQueries,
+                output_dir=OUTPUT_DIR,
+                ffmpeg_path=FFMPEG_PATH,
+                max_workers=CONVERSION_WORKERS,
+                profile=request.profile,
+                submit=submit
+            )
         
         # Convert to response models
         results = [ConversionResult(**result) for result in results_data]
@@ -162,43 +574,313 @@ async def convert_videos(request: ConvertRequest):
         )
 
 
-@app.get("/api/download/{file_id}")
-async def download_file(file_id: str):
+@app.post("/api/jobs", response_model=JobSubmitResponse, status_code=202)
+async def submit_job(request: ConvertRequest, http_request: Request):
+    """
+    Queue a conversion job and return immediately.
+    Poll /api/jobs/{job_id} for per-item progress and results.
+
+    Playlist and channel URLs are enumerated in the background; their videos
+    are appended to the job as items while the enumeration runs.
+    """
+    if not request.urls and not request.searchQueries:
+        raise HTTPException(
+            status_code=400,
+            detail="At least one URL or search query must be provided"
+        )
+    
+    items = [(url, False) for url in request.urls] + [(query, True) for query in request.searchQueries]
+    
+    try:
+        job = await run_blocking(job_scheduler.submit, items, profile=request.profile, client=client_id(http_request))
+    except ValueError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except QueueFullError as e:
+        logger.warning(f"Rejected job with {len(items)} items: {e}")
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "30"})
+    
+    if search_resolver is not None:
+        # Resolve the searches now; workers find them in the query cache
+        search_resolver.prefetch(request.searchQueries)
+    logger.info(f"Queued job {job['id']}: {len(request.urls)} URLs, {len(request.searchQueries)} searches")
+    
+    return JobSubmitResponse(
+        id=job['id'],
+        status=job['status'],
+        total=len(items),
+        statusUrl=f"/api/jobs/{job['id']}"
+    )
+
+
+def build_job_response(job: dict) -> JobResponse:
+    """Convert a stored job record into the API response model"""
+    items = [
+        JobItem(**{**item, 'result': None, 'playlist': item['result']}) if item['kind'] == PLAYLIST
+        else JobItem(**item)
+        for item in job['items']
+    ]
+    summary = {"total": len(items)}
+    for state in ("queued", "running", "completed", "failed"):
+        summary[state] = sum(1 for item in items if item.status == state)
+    
+    return JobResponse(
+        id=job['id'],
+        status=job['status'],
+        createdAt=job['createdAt'],
+        updatedAt=job['updatedAt'],
+        items=items,
+        summary=summary
+    )
+
+
+@app.get("/api/jobs/{job_id}", response_model=JobResponse)
+async def get_job(job_id: str):
+    """
+    Get the status of a conversion job, including the result of every finished item.
+    """
+    job = await run_blocking(job_scheduler.store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    return build_job_response(job)
+
+
+def sse_event(event: str, data: str) -> str:
+    """Format one Server-Sent Events message"""
+    return f"event: {event}\ndata: {data}\n\n"
+
+
+@app.get("/api/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """
+    Stream live job updates as Server-Sent Events.
+
+    The stream starts with a `snapshot` event holding the full job state,
+    followed by `progress` (download percentage, speed, ETA, phase),
+    `added` (a playlist entry was appended as a new item) and `item` (item
+    finished) events, and ends with a `job` event once every item has
+    finished.
+    """
+    # Subscribe before reading the snapshot so no update falls in between
+    events = progress_broker.subscribe(job_id)
+    job = await run_blocking(job_scheduler.store.get, job_id)
+    if job is None:
+        progress_broker.unsubscribe(job_id, events)
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    async def stream():
+        try:
+            yield sse_event("snapshot", build_job_response(job).model_dump_json())
+            if job['status'] == "completed":
+                yield sse_event("job", json.dumps({"type": "job", "status": "completed"}))
+                return
+            
+            while True:
+                try:
+                    event = await asyncio.wait_for(events.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    # Keep proxies from closing an idle connection
+                    yield ": keep-alive\n\n"
+                    continue
+                yield sse_event(event['type'], json.dumps(event))
+                if event['type'] == "job":
+                    return
+        finally:
+            progress_broker.unsubscribe(job_id, events)
+    
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+async def indexed_record(file_id: str) -> Optional[dict]:
+    """File index record of a file, waiting for it first if it is still being tagged"""
+    record = file_index.get(file_id)
+    if record is None:
+        pending = pending_tagging(file_id)
+        if pending is not None:
+            await asyncio.wrap_future(pending)
+        # Also when tagging finished between the lookup and pending_tagging()
+        record = file_index.get(file_id)
+    return record
+
+
+async def zip_response(file_ids: list, archive_name: str) -> StreamingResponse:
+    """Stream the indexed files with the given ids as one ZIP archive"""
+    records = []
+    for file_id in file_ids:
+        record = await indexed_record(file_id)
+        if record is not None:
+            records.append(record)
+    if not records:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Files not found or have been deleted. Files are automatically removed after {FILE_TTL_HOURS} hours."
+        )
+    
+    names = unique_names(record['displayName'] for record in records)
+    logger.info(f"Serving ZIP archive of {len(records)} files")
+    return StreamingResponse(
+        metered(stream_zip(zip(names, (record['path'] for record in records))), "zip"),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{archive_name}"'}
+    )
+
+
+@app.get("/api/jobs/{job_id}/download")
+async def download_job(job_id: str):
+    """
+    Download every successfully converted file of a job as one ZIP archive.
+    """
+    job = await run_blocking(job_scheduler.store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    file_ids = [
+        item['result']['id'] for item in job['items']
+        if item['kind'] == VIDEO and item['result'] is not None and item['result']['success']
+    ]
+    return await zip_response(file_ids, f"ytmp3-{job_id[:8]}.zip")
+
+
+@app.get("/api/download/batch")
+async def download_batch(ids: str = Query(..., description="Comma-separated file ids")):
+    """
+    Download several converted files as one ZIP archive.
+
+    The archive is built while it is sent (stored entries, bounded buffer),
+    so it never sits in memory or on disk as a whole.
     """
-    Download a converted MP3 file by its ID.
+    file_ids = list(dict.fromkeys(file_id.strip() for file_id in ids.split(",") if file_id.strip()))
+    if not file_ids:
+        raise HTTPException(status_code=400, detail="No file ids given")
+    if len(file_ids) > MAX_ZIP_FILES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {MAX_ZIP_FILES} files can be downloaded as one archive"
+        )
+    
+    return await zip_response(file_ids, "ytmp3.zip")
+
+
+def growing_file_response(stream: GrowingFile, inline: bool) -> StreamingResponse:
+    """Chunked response following a file that is still being encoded"""
+    return StreamingResponse(
+        stream.chunks(),
+        media_type=media_type_for(stream.display_name),
+        headers={
+            "Content-Disposition": content_disposition(stream.display_name, inline),
+            "Cache-Control": "no-store",
+            "X-File-Id": stream.file_id
+        }
+    )
+
+
+@app.get("/api/stream")
+async def stream_audio(
+    request: Request,
+    url: Optional[str] = None,
+    query: Optional[str] = None,
+    inline: bool = True,
+    profile: Optional[str] = None
+):
+    """
+    Convert a URL or search query and stream the audio while it is being encoded.
+
+    yt-dlp's audio output is piped into ffmpeg and the encoded audio is sent
+    as it is produced, so playback starts long before the conversion finishes.
+    The file is kept like any other conversion; its id is returned in the
+    X-File-Id header. Concurrent requests for the same target share one
+    conversion and each reads it from the first byte.
+    """
+    if bool(url) == bool(query):
+        raise HTTPException(status_code=400, detail="Provide exactly one of url or query")
+    
+    try:
+        stream = await run_blocking(
+            start_stream, url or query, OUTPUT_DIR, FFMPEG_PATH, is_search=bool(query), profile=profile
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except DownloadError as e:
+        if e.kind == THROTTLED:
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
+        raise HTTPException(status_code=502, detail=str(e))
+    
+    logger.info(f"Streaming file: {stream.file_id}_{stream.display_name}")
+    if stream.done and stream.error is None:
+        # Cached or already finished: serve the complete file (ranges, validators)
+        response = await download_file(stream.file_id, request, inline)
+        response.headers["X-File-Id"] = stream.file_id
+        return response
+    return growing_file_response(stream, inline)
+
+
+@app.get("/api/files/{file_id}", response_model=FileInfoResponse)
+async def get_file_info(file_id: str):
+    """
+    Metadata of a converted file (video, uploader, duration, formats), from the file index
+    """
+    record = await indexed_record(file_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="File not found or has been deleted")
+    return FileInfoResponse(
+        id=record['id'],
+        filename=record['displayName'],
+        size=record['size'],
+        createdAt=record['createdAt'],
+        expiresAt=record['createdAt'] + FILE_TTL_HOURS * 3600,
+        **(record['metadata'] or {})
+    )
+
+
+@app.api_route("/api/download/{file_id}", methods=["GET", "HEAD"])
+async def download_file(file_id: str, request: Request, inline: bool = False):
+    """
+    Download a converted audio file by its ID.
     The file_id is part of the filename returned by the convert endpoint.
+
+    Supports Range requests (single and multi-range), conditional requests
+    (If-None-Match, If-Modified-Since, If-Range) and ?inline=1 to play the
+    file in the browser instead of downloading it.
     """
-    # Find file with this ID
+    # Find file with this ID in the index
     try:
-        files = [f for f in os.listdir(OUTPUT_DIR) if f.startswith(file_id)]
+        record = await indexed_record(file_id)
         
-        if not files:
+        if record is None:
+            # Still being written by a streaming conversion: follow it
+            stream = get_stream(file_id)
+            if stream is not None:
+                return growing_file_response(stream, inline)
             raise HTTPException(
                 status_code=404,
                 detail=f"File not found or has been deleted. Files are automatically removed after {FILE_TTL_HOURS} hours."
             )
         
-        # Get the first matching file
-        filename = files[0]
-        filepath = os.path.join(OUTPUT_DIR, filename)
+        filepath = record['path']
         
         # Verify file exists
-        if not os.path.isfile(filepath):
+        try:
+            stat_result = os.stat(filepath)
+        except FileNotFoundError:
+            await run_blocking(file_index.remove, file_id)
             raise HTTPException(status_code=404, detail="File not found")
         
-        # Prepare display filename (remove UUID prefix)
-        display_filename = filename.replace(f"{file_id}_", "", 1)
-        
-        logger.info(f"Serving file: {filename}")
+        logger.info(f"Serving file: {os.path.basename(filepath)}")
         
-        # Return file
-        return FileResponse(
-            path=filepath,
-            media_type="audio/mpeg",
-            filename=display_filename,
-            headers={
-                "Content-Disposition": f'attachment; filename="{display_filename}"'
-            }
+        # Display filename without the UUID prefix
+        return file_response(
+            request.headers,
+            filepath,
+            size=stat_result.st_size,
+            etag=file_etag(stat_result, record['createdAt']),
+            last_modified=record['createdAt'],
+            media_type=media_type_for(filepath),
+            filename=record['displayName'],
+            inline=inline
         )
         
     except HTTPException:
@@ -0,0 +1,85 @@
+import json
+from typing import Any, Dict, Optional
+
+
+# yt-dlp info fields every download engine reports (see info_template)
+INFO_FIELDS = (
+    "id", "title", "uploader", "duration", "duration_string",
+    "thumbnail", "format_id", "ext", "acodec", "abr",
+    "artist", "album", "release_year", "upload_date", "webpage_url",
+)
+
+# Keys of a metadata record returned in ConversionResult (records also keep the
+# title and the tag fields artist, album, year and sourceUrl)
+RECORD_FIELDS = (
+    "videoId", "uploader", "durationSeconds", "thumbnail",
+    "sourceFormat", "sourceCodec", "sourceBitrate", "bitrate", "profile",
+)
+
+
+def info_template(prefix: str, *extra_fields: str) -> str:
+    """
+    yt-dlp --print template emitting prefix and INFO_FIELDS as one JSON object line.
+
+    yt-dlp's %(.{a,b})j selects the listed fields of the info dict and
+    serializes them as JSON, so titles containing any character survive.
+    """
+    return f"{prefix}%(.{{{','.join(INFO_FIELDS + extra_fields)}}})j"
+
+
+def parse_info_line(line: str, prefix: str) -> Optional[Dict[str, Any]]:
+    """Decode a line printed with info_template, or None if it is not one"""
+    if not line.startswith(prefix):
+        return None
+    try:
+        info = json.loads(line[len(prefix):])
+    except ValueError:
+        return None
+    if not isinstance(info, dict):
+        return None
+    # yt-dlp reports missing values as "none"/"NA" in some fields
+    return {key: value for key, value in info.items() if value not in (None, "none", "NA")}
+
+
+def build_record(info: Dict[str, Any], profile: str, size: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Compact metadata record of a converted file.
+
+    Built once from the yt-dlp info when the file is produced and stored
+    with it in the file index and the conversion cache, so later requests
+    never have to probe the file or ask yt-dlp again. Unknown values are
+    left out.
+
+    Args:
+        info: yt-dlp info fields (INFO_FIELDS)
+        profile: Encoding profile the file was produced with
+        size: Output file size, used for the average output bitrate
+    """
+    duration = info.get("duration")
+    abr = info.get("abr")
+    year = info.get("release_year") or str(info.get("upload_date") or "")[:4]
+    record = {
+        "videoId": info.get("id"),
+        "title": info.get("title"),
+        "uploader": info.get("uploader"),
+        "durationSeconds": round(float(duration), 3) if isinstance(duration, (int, float)) else None,
+        "thumbnail": info.get("thumbnail"),
+        "sourceFormat": info.get("format_id"),
+        "sourceCodec": info.get("acodec"),
+        "sourceBitrate": round(float(abr), 1) if isinstance(abr, (int, float)) else None,
+        "bitrate": None,
+        "profile": profile,
+        "artist": info.get("artist"),
+        "album": info.get("album"),
+        "year": str(year) if year else None,
+        "sourceUrl": info.get("webpage_url"),
+    }
+    if size and record["durationSeconds"]:
+        record["bitrate"] = round(size * 8 / record["durationSeconds"] / 1000, 1)
+    return {key: value for key, value in record.items() if value is not None}
+
+
+def result_fields(record: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """ConversionResult fields of a metadata record (None for every unknown value)"""
+    record = record or {}
+    return {key: record.get(key) for key in RECORD_FIELDS}
@@ -0,0 +1,215 @@
+import functools
+import threading
+import weakref
+import logging
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+# Histogram buckets (seconds) of the stage durations: cache hits and file
+# serving take milliseconds, transcodes of long videos several minutes
+STAGE_BUCKETS = (0.005, 0.025, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+# Shared context manager returned while metrics are disabled
+_NOOP = nullcontext()
+
+
+class Metrics:
+    """
+    Prometheus metrics of the service.
+
+    Stage durations, bytes served and running subprocesses are recorded by
+    the module-level helpers (stage, timed, count_served, running, track)
+    as the pipeline runs. Everything else (queue depth, cache and cleanup
+    counters, bytes on disk) is read from the owning component when
+    /metrics is scraped, through callbacks registered with gauge() and
+    counter(), so those components need no knowledge of Prometheus.
+    """
+
+    def __init__(self):
+        """
+        Create the registry and the recorded metrics
+
+        Raises:
+            ImportError: If prometheus_client is not installed
+        """
+        import prometheus_client
+        from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+        self._prometheus = prometheus_client
+        self._families = {'gauge': GaugeMetricFamily, 'counter': CounterMetricFamily}
+        self.registry = prometheus_client.CollectorRegistry()
+        self.stage_seconds = prometheus_client.Histogram(
+            "ytmp3_stage_duration_seconds",
+            "Duration of pipeline stages (search, download, transcode, tagging, stream, serve)",
+            ["stage"],
+            buckets=STAGE_BUCKETS,
+            registry=self.registry
+        )
+        self.served_bytes = prometheus_client.Counter(
+            "ytmp3_served_bytes",
+            "Bytes of audio sent to clients (file downloads, streams, ZIP archives)",
+            ["kind"],
+            registry=self.registry
+        )
+        self.queue_wait_seconds = prometheus_client.Histogram(
+            "ytmp3_queue_wait_seconds",
+            "Time conversion items waited in the fair queue before a worker took them",
+            ["lane"],
+            buckets=STAGE_BUCKETS,
+            registry=self.registry
+        )
+        # Labelled children by stage name, saving labels() its lock and validation per call
+        self._stages: Dict[str, Any] = {}
+        self._callbacks = []
+        self._running: Dict[str, int] = defaultdict(int)
+        self._tracked: Dict[str, "weakref.WeakSet"] = defaultdict(weakref.WeakSet)
+        self._lock = threading.Lock()
+        self.registry.register(self)
+        self.gauge(
+            "ytmp3_active_subprocesses", "yt-dlp and ffmpeg processes currently running",
+            self.active_subprocesses, label="tool"
+        )
+
+    def gauge(self, name: str, documentation: str, read: Callable[[], Any], label: Optional[str] = None) -> None:
+        """
+        Expose a value read at scrape time as a gauge.
+
+        Args:
+            name: Metric name
+            documentation: Help text
+            read: Returns the value, or a {label value: value} dict if label is given
+            label: Name of the label distinguishing the values of a dict
+        """
+        self._callbacks.append(('gauge', name, documentation, read, label))
+
+    def counter(self, name: str, documentation: str, read: Callable[[], Any], label: Optional[str] = None) -> None:
+        """Expose a monotonically increasing value read at scrape time (see gauge())"""
+        self._callbacks.append(('counter', name, documentation, read, label))
+
+    def collect(self):
+        """Collector protocol of prometheus_client: the callback metrics"""
+        for kind, name, documentation, read, label in self._callbacks:
+            try:
+                value = read()
+            except Exception as e:
+                logger.debug(f"Reading metric {name} failed: {e}")
+                continue
+            if value is None:
+                continue
+            family = self._families[kind](name, documentation, labels=[label] if label else None)
+            if label:
+                for label_value, number in value.items():
+                    family.add_metric([str(label_value)], number)
+            else:
+                family.add_metric([], value)
+            yield family
+
+    def describe(self):
+        # Callback values are read only when scraped, never at registration
+        return []
+
+    def stage_histogram(self, name: str):
+        histogram = self._stages.get(name)
+        if histogram is None:
+            histogram = self._stages[name] = self.stage_seconds.labels(name)
+        return histogram
+
+    def active_subprocesses(self) -> Dict[str, int]:
+        with self._lock:
+            counts = dict(self._running)
+            for tool, processes in self._tracked.items():
+                counts[tool] = counts.get(tool, 0) + sum(1 for p in list(processes) if p.poll() is None)
+        return counts
+
+    def render(self) -> Tuple[bytes, str]:
+        """Text exposition of every metric and its content type"""
+        return self._prometheus.generate_latest(self.registry), self._prometheus.CONTENT_TYPE_LATEST
+
+
+_metrics: Optional[Metrics] = None
+
+
+def configure_metrics(metrics: Optional[Metrics]) -> None:
+    """Set the metrics the helpers below record into (None disables them)"""
+    global _metrics
+    _metrics = metrics
+
+
+def get_metrics() -> Optional[Metrics]:
+    return _metrics
+
+
+def stage(name: str):
+    """
+    Context manager timing one run of a pipeline stage.
+
+    While metrics are disabled this returns a shared no-op context manager,
+    so instrumented code pays one global lookup per call.
+    """
+    if _metrics is None:
+        return _NOOP
+    return _metrics.stage_histogram(name).time()
+
+
+def timed(name: str) -> Callable:
+    """Decorator timing every call of a function as the given stage (see stage())"""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _metrics is None:
+                return func(*args, **kwargs)
+            with _metrics.stage_histogram(name).time():
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def count_served(kind: str, size: int) -> None:
+    """Add bytes sent to a client ('file', 'stream' or 'zip')"""
+    if _metrics is not None and size:
+        _metrics.served_bytes.labels(kind).inc(size)
+
+
+def observe_queue_wait(lane: str, seconds: float) -> None:
+    """Record how long an item waited in the fair queue ('fast' or 'bulk' lane)"""
+    if _metrics is not None:
+        _metrics.queue_wait_seconds.labels(lane).observe(seconds)
+
+
+def metered(chunks: Iterator[bytes], kind: str) -> Iterator[bytes]:
+    """Pass chunks through, counting them as served once the iteration ends"""
+    sent = 0
+    try:
+        for chunk in chunks:
+            sent += len(chunk)
+            yield chunk
+    finally:
+        count_served(kind, sent)
+
+
+@contextmanager
+def _running(tool: str):
+    with _metrics._lock:
+        _metrics._running[tool] += 1
+    try:
+        yield
+    finally:
+        with _metrics._lock:
+            _metrics._running[tool] -= 1
+
+
+def running(tool: str):
+    """Context manager counting a blocking subprocess run (subprocess.run) as active"""
+    if _metrics is None:
+        return _NOOP
+    return _running(tool)
+
+
+def track(process: Any, tool: str) -> None:
+    """Count a Popen as an active subprocess until it exits"""
+    if _metrics is not None:
+        with _metrics._lock:
+            _metrics._tracked[tool].add(process)
@@ -1,11 +1,49 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, field_validator, model_validator
 from typing import List, Optional
 
+from profiles import PROFILES
+
+
+# Largest request accepted by /api/convert and /api/jobs: inputs per request
+# and characters per URL or search query (see set_request_limits)
+MAX_REQUEST_ITEMS = 500
+MAX_INPUT_LENGTH = 2048
+
+
+def set_request_limits(max_items: int, max_input_length: int) -> None:
+    """Set the request size limits ConvertRequest validates"""
+    global MAX_REQUEST_ITEMS, MAX_INPUT_LENGTH
+    MAX_REQUEST_ITEMS = max_items
+    MAX_INPUT_LENGTH = max_input_length
+
 
 class ConvertRequest(BaseModel):
     """Request model for conversion endpoint"""
     urls: List[str] = Field(default_factory=list, description="List of YouTube URLs to convert")
     searchQueries: List[str] = Field(default_factory=list, description="List of search queries to find and convert")
+    profile: Optional[str] = Field(None, description="Encoding profile (see /api/profiles); server default if omitted")
+
+    @field_validator("profile")
+    @classmethod
+    def check_profile(cls, value: Optional[str]) -> Optional[str]:
+        if value is not None and value not in PROFILES:
+            raise ValueError(f"Unknown encoding profile '{value}'. Available: {', '.join(PROFILES)}")
+        return value
+
+    @field_validator("urls", "searchQueries")
+    @classmethod
+    def check_input_length(cls, values: List[str]) -> List[str]:
+        for value in values:
+            if len(value) > MAX_INPUT_LENGTH:
+                raise ValueError(f"Input of {len(value)} characters, at most {MAX_INPUT_LENGTH} are accepted")
+        return values
+
+    @model_validator(mode="after")
+    def check_size(self) -> "ConvertRequest":
+        total = len(self.urls) + len(self.searchQueries)
+        if total > MAX_REQUEST_ITEMS:
+            raise ValueError(f"Request has {total} inputs, at most {MAX_REQUEST_ITEMS} are accepted")
+        return self
 
 
 class ConversionResult(BaseModel):
@@ -17,8 +55,43 @@ class ConversionResult(BaseModel):
     duration: Optional[str] = Field(None, description="Duration in human-readable format")
     success: bool = Field(..., description="Whether conversion was successful")
     error: Optional[str] = Field(None, description="Error message if conversion failed")
+    errorKind: Optional[str] = Field(
+        None, description="Class of a download failure: throttled, geo_blocked, unavailable, transient or unknown"
+    )
     wasSearch: bool = Field(False, description="Whether this was from a search query")
     originalInput: str = Field(..., description="Original URL or search query")
+    videoId: Optional[str] = Field(None, description="YouTube video ID")
+    uploader: Optional[str] = Field(None, description="Channel that uploaded the video")
+    durationSeconds: Optional[float] = Field(None, description="Duration in seconds")
+    thumbnail: Optional[str] = Field(None, description="Thumbnail URL")
+    sourceFormat: Optional[str] = Field(None, description="yt-dlp format ID of the downloaded stream")
+    sourceCodec: Optional[str] = Field(None, description="Audio codec of the downloaded stream")
+    sourceBitrate: Optional[float] = Field(None, description="Bitrate of the downloaded stream in kbit/s")
+    bitrate: Optional[float] = Field(None, description="Average bitrate of the converted file in kbit/s")
+    profile: Optional[str] = Field(None, description="Encoding profile the file was produced with")
+
+
+class FileInfoResponse(BaseModel):
+    """Stored information about a converted file"""
+    id: str
+    filename: str = Field(..., description="Name offered on download")
+    size: Optional[int] = Field(None, description="File size in bytes")
+    createdAt: float = Field(..., description="Unix timestamp of the conversion")
+    expiresAt: float = Field(..., description="Unix timestamp after which the file is deleted")
+    videoId: Optional[str] = None
+    title: Optional[str] = None
+    uploader: Optional[str] = None
+    durationSeconds: Optional[float] = None
+    thumbnail: Optional[str] = None
+    sourceFormat: Optional[str] = None
+    sourceCodec: Optional[str] = None
+    sourceBitrate: Optional[float] = None
+    bitrate: Optional[float] = None
+    profile: Optional[str] = None
+    artist: Optional[str] = None
+    album: Optional[str] = None
+    year: Optional[str] = None
+    sourceUrl: Optional[str] = None
 
 
 class ConvertResponse(BaseModel):
@@ -34,3 +107,56 @@ class HealthResponse(BaseModel):
     ytdlp_version: Optional[str] = None
     ffmpeg_available: bool
     ffmpeg_version: Optional[str] = None
+
+
+class ReadinessResponse(BaseModel):
+    """Response model for the readiness check endpoint"""
+    status: str
+    ytdlp_available: bool
+    ffmpeg_available: bool
+    queue_depth: int = Field(..., description="Job items waiting for a worker")
+    queue_capacity: int = Field(..., description="Maximum number of queued job items")
+    active_workers: int = Field(..., description="Workers currently converting an item")
+    disk_free_bytes: int = Field(..., description="Free space on the output volume")
+
+
+class PlaylistResult(BaseModel):
+    """Outcome of expanding a playlist or channel URL into its videos"""
+    success: bool = Field(..., description="Whether the playlist could be enumerated")
+    error: Optional[str] = Field(None, description="Error message if enumeration failed")
+    title: Optional[str] = Field(None, description="Title of the playlist or channel")
+    originalInput: str = Field(..., description="Playlist or channel URL")
+    entries: int = Field(0, description="Number of videos added to the job")
+    skipped: int = Field(0, description="Entries that are not videos")
+    durationSeconds: float = Field(0, description="Total duration of the added videos")
+    truncated: Optional[str] = Field(None, description="Limit that stopped the expansion: maxItems or maxDuration")
+
+
+class JobItem(BaseModel):
+    """Status of a single item of a conversion job"""
+    index: int = Field(..., description="Position of the item in the job (playlist entries follow the request's items)")
+    input: str = Field(..., description="Original URL or search query")
+    wasSearch: bool = Field(False, description="Whether this item is a search query")
+    status: str = Field(..., description="queued, running, completed or failed")
+    kind: str = Field("video", description="video, or playlist for a playlist/channel URL being expanded")
+    parent: Optional[int] = Field(None, description="Index of the playlist item this video was found in")
+    result: Optional[ConversionResult] = Field(None, description="Conversion result once the item has finished")
+    playlist: Optional[PlaylistResult] = Field(None, description="Expansion result of a playlist item")
+
+
+class JobSubmitResponse(BaseModel):
+    """Response returned when a conversion job is accepted"""
+    id: str = Field(..., description="Job identifier")
+    status: str
+    total: int = Field(..., description="Number of items in the job (playlists add their entries later)")
+    statusUrl: str = Field(..., description="URL to poll for job status")
+
+
+class JobResponse(BaseModel):
+    """Current state of a conversion job"""
+    id: str
+    status: str = Field(..., description="queued, running or completed")
+    createdAt: float = Field(..., description="Unix timestamp of submission")
+    updatedAt: float = Field(..., description="Unix timestamp of the last item update")
+    items: List[JobItem]
+    summary: dict = Field(..., description="Item counts by status")
@@ -0,0 +1,254 @@
+import re
+import subprocess
+import threading
+import time
+import logging
+from typing import Any, Dict, Iterator, NamedTuple, Optional
+from urllib.parse import parse_qs, urlparse
+
+from engines import EXTRACTOR_ARGS
+from metadata import parse_info_line
+from metrics import track
+from search import video_url
+
+logger = logging.getLogger(__name__)
+
+
+# Seconds yt-dlp may go without printing an entry while a playlist is enumerated
+PAGE_TIMEOUT = 120
+
+# Prefix of the JSON line yt-dlp prints per playlist entry
+ENTRY_PREFIX = "[ytmp3-entry]"
+
+# Fields of a flat playlist entry requested from yt-dlp
+ENTRY_FIELDS = ("id", "title", "duration", "ie_key", "playlist_title")
+
+# Channel URL paths; without a tab they are enumerated as their "Videos" tab
+_CHANNEL_PATH = re.compile(r"^/(@[^/]+|channel/[^/]+|c/[^/]+|user/[^/]+)(/[^/]*)?/?$")
+
+
+class PlaylistError(Exception):
+    """Raised when a playlist could not be enumerated"""
+
+
+class PlaylistEntry(NamedTuple):
+    """One video of a playlist, as known from flat extraction"""
+    video_id: str
+    title: Optional[str]
+    duration: Optional[float]
+
+    @property
+    def url(self) -> str:
+        return video_url(self.video_id)
+
+
+def is_playlist_url(url: str) -> bool:
+    """
+    Whether a YouTube URL names a playlist or channel rather than one video.
+
+    A watch URL carrying a list= parameter is the video itself; only
+    /playlist?list=... and channel pages (/@name, /channel/..., /c/...,
+    /user/...) are expanded.
+    """
+    parsed = urlparse(url if "://" in url else f"https://{url}")
+    if not (parsed.hostname or "").endswith("youtube.com"):
+        return False
+    if parsed.path.rstrip("/") == "/playlist":
+        return bool(parse_qs(parsed.query).get("list"))
+    return _CHANNEL_PATH.match(parsed.path) is not None
+
+
+def collection_url(url: str) -> str:
+    """URL to enumerate for a playlist/channel URL (channels without a tab use /videos)"""
+    parsed = urlparse(url if "://" in url else f"https://{url}")
+    match = _CHANNEL_PATH.match(parsed.path)
+    if match and not (match.group(2) or "").strip("/"):
+        return parsed._replace(scheme=parsed.scheme or "https", path=f"/{match.group(1)}/videos").geturl()
+    return url
+
+
+class PlaylistEnumerator:
+    """
+    Lists the entries of a playlist with yt-dlp's flat extraction.
+
+    --lazy-playlist makes yt-dlp print each entry as soon as the page
+    containing it has been fetched, instead of after the whole list, and
+    entries() yields them as the lines arrive. Closing the iterator early
+    kills yt-dlp, so pages past a limit are never requested.
+    """
+
+    def entries(self, url: str, max_items: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Yield the flat entries of a playlist (ENTRY_FIELDS dicts) in order.
+
+        Args:
+            url: Playlist or channel URL
+            max_items: Stop after this many entries
+
+        Raises:
+            PlaylistError: If yt-dlp could not be run or failed
+        """
+        cmd = [
+            "yt-dlp",
+            *EXTRACTOR_ARGS,
+            "--flat-playlist",
+            "--lazy-playlist",
+            "--skip-download",
+            "--no-warnings",
+            "--print", f"{ENTRY_PREFIX}%(.{{{','.join(ENTRY_FIELDS)}}})j",
+        ]
+        if max_items:
+            cmd += ["-I", f"1:{max_items}"]
+        cmd += ["--", collection_url(url)]
+
+        try:
+            process = subprocess.Popen(
+                cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                text=True, encoding="utf-8", errors="replace", bufsize=1
+            )
+        except OSError as e:
+            raise PlaylistError(f"Could not run yt-dlp: {e}")
+        track(process, "yt-dlp")
+
+        # stderr is drained on the side so a chatty yt-dlp never blocks on it
+        stderr_chunks = []
+        stderr_reader = threading.Thread(target=lambda: stderr_chunks.append(process.stderr.read()), daemon=True)
+        stderr_reader.start()
+        # Kill a yt-dlp that stops producing entries (a hung page request). Only
+        # time spent waiting for a line counts: while the caller holds an entry,
+        # yt-dlp is merely blocked on a full pipe.
+        waiting_since = [None]
+        stalled = threading.Event()
+
+        def watchdog():
+            while process.poll() is None:
+                since = waiting_since[0]
+                if since is not None and time.monotonic() - since > PAGE_TIMEOUT:
+                    stalled.set()
+                    process.kill()
+                    return
+                time.sleep(1)
+
+        threading.Thread(target=watchdog, daemon=True).start()
+        finished = False
+        try:
+            lines = iter(process.stdout)
+            while True:
+                waiting_since[0] = time.monotonic()
+                line = next(lines, None)
+                waiting_since[0] = None
+                if line is None:
+                    break
+                entry = parse_info_line(line.rstrip("\n"), ENTRY_PREFIX)
+                if entry is not None:
+                    yield entry
+            process.wait()
+            finished = True
+        finally:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+            stderr_reader.join()
+            process.stdout.close()
+            process.stderr.close()
+
+        if stalled.is_set():
+            raise PlaylistError(f"Playlist timeout (no entries for {PAGE_TIMEOUT} seconds)")
+        if finished and process.returncode != 0:
+            raise PlaylistError(f"yt-dlp error: {''.join(stderr_chunks)[:200]}")
+
+
+class PlaylistExpansion:
+    """
+    The entries of one playlist within the item and duration limits.
+
+    Iterating yields PlaylistEntry objects while counting them; summary()
+    describes the expansion afterwards (also after an error or an early
+    stop). Entries that are not videos (nested playlists, channel tabs)
+    and entries without an ID are skipped.
+    """
+
+    def __init__(self, url: str, entries: Iterator[Dict[str, Any]], max_items: int, max_duration: float):
+        self.url = url
+        self.title: Optional[str] = None
+        self.count = 0
+        self.skipped = 0
+        self.duration = 0.0
+        self.truncated: Optional[str] = None
+        self._entries = entries
+        self.max_items = max_items
+        self.max_duration = max_duration
+
+    def __iter__(self) -> Iterator[PlaylistEntry]:
+        try:
+            for info in self._entries:
+                self.title = self.title or info.get("playlist_title")
+                if info.get("ie_key", "Youtube") != "Youtube" or not info.get("id"):
+                    self.skipped += 1
+                    continue
+                if self.count >= self.max_items:
+                    self.truncated = "maxItems"
+                    return
+                duration = info.get("duration")
+                duration = float(duration) if isinstance(duration, (int, float)) else None
+                if self.max_duration and self.duration + (duration or 0) > self.max_duration:
+                    self.truncated = "maxDuration"
+                    return
+                self.count += 1
+                self.duration += duration or 0
+                yield PlaylistEntry(info["id"], info.get("title"), duration)
+        finally:
+            close = getattr(self._entries, "close", None)
+            if close is not None:
+                close()
+
+    def summary(self, error: Optional[str] = None) -> Dict[str, Any]:
+        """Result record of the expansion (stored as the playlist item's result)"""
+        return {
+            'success': error is None,
+            'error': error,
+            'title': self.title,
+            'originalInput': self.url,
+            'entries': self.count,
+            'skipped': self.skipped,
+            'durationSeconds': round(self.duration, 3),
+            'truncated': self.truncated,
+        }
+
+
+class PlaylistExpander:
+    """Turns playlist and channel URLs into PlaylistExpansions under configured limits"""
+
+    def __init__(
+        self,
+        enumerator: Optional[PlaylistEnumerator] = None,
+        max_items: int = 200,
+        max_duration_seconds: float = 10 * 3600
+    ):
+        """
+        Initialize the expander
+
+        Args:
+            enumerator: Lists playlist entries (yt-dlp flat extraction if omitted)
+            max_items: Maximum number of videos taken from one playlist
+            max_duration_seconds: Maximum total duration of the videos taken
+                from one playlist (0 for no limit)
+        """
+        self.enumerator = enumerator or PlaylistEnumerator()
+        self.max_items = max(1, max_items)
+        self.max_duration = max_duration_seconds
+
+    def accepts(self, url: str) -> bool:
+        """Whether url is expanded (see is_playlist_url)"""
+        return is_playlist_url(url)
+
+    def expand(self, url: str) -> PlaylistExpansion:
+        """
+        Start enumerating a playlist.
+
+        Nothing is fetched until the returned expansion is iterated. One
+        entry past max_items is requested so that a playlist that was cut
+        off can be told apart from one that fits exactly.
+        """
+        entries = self.enumerator.entries(url, max_items=self.max_items + 1)
+        return PlaylistExpansion(url, entries, self.max_items, self.max_duration)
@@ -0,0 +1,105 @@
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+
+class EncodingProfile(NamedTuple):
+    """
+    How converted audio is encoded.
+
+    source_format is the yt-dlp format selector used for the download: it
+    prefers a source stream that already has the target codec, and when
+    the downloaded stream's codec is in copy_codecs the audio is only
+    remuxed (-codec:a copy) instead of re-encoded.
+    """
+    name: str
+    extension: str
+    media_type: str
+    codec_args: Tuple[str, ...]
+    source_format: str = "bestaudio/best"
+    copy_codecs: Tuple[str, ...] = ()
+    # ffmpeg muxer for piped (streaming) output; None if the container needs a seekable file
+    stream_format: Optional[str] = None
+    description: str = ""
+
+
+PROFILES: Dict[str, EncodingProfile] = {
+    profile.name: profile
+    for profile in (
+        EncodingProfile(
+            "mp3-v0", "mp3", "audio/mpeg",
+            ("-codec:a", "libmp3lame", "-q:a", "0"),
+            copy_codecs=("mp3",),
+            stream_format="mp3",
+            description="MP3, LAME VBR V0 (~245 kbit/s)",
+        ),
+        EncodingProfile(
+            "mp3-320", "mp3", "audio/mpeg",
+            ("-codec:a", "libmp3lame", "-b:a", "320k"),
+            stream_format="mp3",
+            description="MP3, 320 kbit/s CBR",
+        ),
+        EncodingProfile(
+            "mp3-128", "mp3", "audio/mpeg",
+            ("-codec:a", "libmp3lame", "-b:a", "128k"),
+            stream_format="mp3",
+            description="MP3, 128 kbit/s CBR",
+        ),
+        EncodingProfile(
+            "opus", "opus", "audio/ogg",
+            ("-codec:a", "libopus", "-b:a", "128k"),
+            source_format="bestaudio[acodec=opus]/bestaudio/best",
+            copy_codecs=("opus",),
+            stream_format="opus",
+            description="Opus in Ogg; YouTube's Opus streams are remuxed without re-encoding",
+        ),
+        EncodingProfile(
+            "m4a-copy", "m4a", "audio/mp4",
+            ("-codec:a", "aac", "-b:a", "192k"),
+            source_format="bestaudio[ext=m4a]/bestaudio/best",
+            copy_codecs=("mp4a", "aac"),
+            description="AAC in M4A; the source AAC stream is remuxed without re-encoding",
+        ),
+    )
+}
+
+DEFAULT_PROFILE = "mp3-v0"
+
+_MEDIA_TYPES = {profile.extension: profile.media_type for profile in PROFILES.values()}
+
+
+def get_profile(name: Optional[str] = None) -> EncodingProfile:
+    """
+    Look up a profile by name (the default profile for None).
+
+    Raises:
+        ValueError: If there is no profile with that name
+    """
+    profile = PROFILES.get(name or DEFAULT_PROFILE)
+    if profile is None:
+        raise ValueError(f"Unknown encoding profile '{name}'. Available: {', '.join(PROFILES)}")
+    return profile
+
+
+def set_default_profile(name: str) -> None:
+    """Select the profile used when a request does not name one"""
+    global DEFAULT_PROFILE
+    DEFAULT_PROFILE = get_profile(name).name
+
+
+def can_copy(profile: EncodingProfile, source_codec: Optional[str]) -> bool:
+    """Whether a source stream with this codec can be remuxed instead of re-encoded"""
+    if not source_codec:
+        return False
+    codec = source_codec.lower()
+    return any(codec == c or codec.startswith(c + ".") for c in profile.copy_codecs)
+
+
+def codec_args(profile: EncodingProfile, source_codec: Optional[str] = None) -> List[str]:
+    """ffmpeg arguments encoding (or just copying) the audio of a source with source_codec"""
+    if can_copy(profile, source_codec):
+        return ["-codec:a", "copy"]
+    return list(profile.codec_args)
+
+
+def media_type_for(filename: str) -> str:
+    """Content type of a converted file, by extension"""
+    return _MEDIA_TYPES.get(filename.rsplit(".", 1)[-1].lower(), "application/octet-stream")
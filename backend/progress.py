@@ -0,0 +1,177 @@
+import asyncio
+import threading
+import time
+import logging
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+# yt-dlp prints one line per progress update with this template (see
+# engines.SubprocessEngine). Fields are separated by '|' and missing values
+# are printed as "NA".
+PROGRESS_PREFIX = "[ytmp3-progress]"
+PROGRESS_TEMPLATE = (
+    "download:" + PROGRESS_PREFIX +
+    "%(progress.status)s|%(progress.downloaded_bytes)s|"
+    "%(progress.total_bytes,progress.total_bytes_estimate)s|"
+    "%(progress.speed)s|%(progress.eta)s"
+)
+
+# Conversion phases reported to clients
+PHASE_QUEUED = "queued"
+PHASE_DOWNLOADING = "downloading"
+PHASE_POSTPROCESSING = "postprocessing"
+PHASE_DONE = "done"
+
+
+def _number(value: str) -> Optional[float]:
+    """Parse a numeric template field, returning None for NA/empty values"""
+    if not value or value[0] == 'N':
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def parse_progress_line(line: str) -> Optional[Tuple[str, Optional[float], Optional[float], Optional[float], Optional[float]]]:
+    """
+    Parse one yt-dlp progress line printed with PROGRESS_TEMPLATE.
+
+    Args:
+        line: A line of yt-dlp stdout
+
+    Returns:
+        (status, downloaded_bytes, total_bytes, speed, eta) or None if the
+        line is not a progress line
+    """
+    if not line.startswith(PROGRESS_PREFIX):
+        return None
+    fields = line[len(PROGRESS_PREFIX):].rstrip('\r\n').split('|', 4)
+    if len(fields) != 5:
+        return None
+    status, downloaded, total, speed, eta = fields
+    return status, _number(downloaded), _number(total), _number(speed), _number(eta)
+
+
+class ProgressReporter:
+    """
+    Turns yt-dlp progress updates into throttled progress events.
+
+    Updates come either as template lines from the CLI (feed) or as values
+    from an in-process progress hook (update). yt-dlp emits many lines per
+    second; events are only built and passed to the callback when the
+    percentage moved by at least min_step or min_interval seconds elapsed,
+    so the cost per ignored line is one startswith() and a split.
+    """
+
+    __slots__ = ('callback', 'min_interval', 'min_step', '_last_time', '_last_percent')
+
+    def __init__(self, callback: Callable[[Dict[str, Any]], None], min_interval: float = 0.5, min_step: float = 1.0):
+        self.callback = callback
+        self.min_interval = min_interval
+        self.min_step = min_step
+        self._last_time = 0.0
+        self._last_percent = -100.0
+
+    def feed(self, line: str) -> bool:
+        """
+        Handle one line of yt-dlp output.
+
+        Returns:
+            True if the line was a progress line (and should not be treated
+            as regular output), False otherwise
+        """
+        parsed = parse_progress_line(line)
+        if parsed is None:
+            return False
+
+        self.update(*parsed)
+        return True
+
+    def update(
+        self,
+        status: str,
+        downloaded: Optional[float],
+        total: Optional[float],
+        speed: Optional[float],
+        eta: Optional[float]
+    ) -> None:
+        """Handle one structured progress update (from a parsed line or a progress hook)"""
+        percent = round(downloaded * 100.0 / total, 1) if downloaded is not None and total else None
+        now = time.monotonic()
+        finished = status == "finished"
+        if not finished:
+            moved = percent is not None and percent - self._last_percent >= self.min_step
+            if not moved and now - self._last_time < self.min_interval:
+                return
+
+        self._last_time = now
+        if percent is not None:
+            self._last_percent = percent
+        self.emit(
+            PHASE_DOWNLOADING,
+            percent=100.0 if finished else percent,
+            downloadedBytes=downloaded,
+            totalBytes=total,
+            speed=speed,
+            eta=eta
+        )
+
+    def emit(self, phase: str, **fields) -> None:
+        """Send an event for the given phase to the callback"""
+        try:
+            self.callback({'phase': phase, **fields})
+        except Exception as e:
+            logger.debug(f"Progress callback failed: {e}")
+
+
+class ProgressBroker:
+    """
+    Fan-out of job events from worker threads to asyncio subscribers.
+
+    Publishing is thread-safe and never blocks: events are handed to each
+    subscriber's event loop with call_soon_threadsafe, and dropped for a
+    subscriber whose queue is full (a slow client only misses intermediate
+    progress updates, the final job state is always available via polling).
+    """
+
+    def __init__(self, max_queue: int = 1000):
+        self.max_queue = max_queue
+        self._subscribers: Dict[str, List[Tuple[asyncio.AbstractEventLoop, asyncio.Queue]]] = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, job_id: str) -> asyncio.Queue:
+        """Subscribe the running event loop to events of a job"""
+        subscription = (asyncio.get_running_loop(), asyncio.Queue(self.max_queue))
+        with self._lock:
+            self._subscribers.setdefault(job_id, []).append(subscription)
+        return subscription[1]
+
+    def unsubscribe(self, job_id: str, events: asyncio.Queue) -> None:
+        """Remove a subscription created by subscribe()"""
+        with self._lock:
+            subscriptions = [s for s in self._subscribers.get(job_id, []) if s[1] is not events]
+            if subscriptions:
+                self._subscribers[job_id] = subscriptions
+            else:
+                self._subscribers.pop(job_id, None)
+
+    def publish(self, job_id: str, event: Dict[str, Any]) -> None:
+        """Publish an event to every subscriber of a job (callable from any thread)"""
+        with self._lock:
+            subscriptions = list(self._subscribers.get(job_id, ()))
+        for loop, events in subscriptions:
+            try:
+                loop.call_soon_threadsafe(self._deliver, events, event)
+            except RuntimeError:
+                # Event loop already closed
+                pass
+
+    @staticmethod
+    def _deliver(events: asyncio.Queue, event: Dict[str, Any]) -> None:
+        try:
+            events.put_nowait(event)
+        except asyncio.QueueFull:
+            pass
@@ -0,0 +1,256 @@
+import subprocess
+import threading
+import time
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from engines import EXTRACTOR_ARGS
+from metadata import parse_info_line
+from metrics import running, stage
+from singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+
+# Search subprocess timeout (seconds)
+SEARCH_TIMEOUT = 60
+
+# Prefix of the JSON line yt-dlp prints for the search result
+RESULT_PREFIX = "[ytmp3-search]"
+
+
+class SearchError(Exception):
+    """Raised when a search query could not be resolved to a video"""
+
+
+def normalize_query(query: str) -> str:
+    """Identity of a search query: case-insensitive, with collapsed whitespace"""
+    return " ".join(query.casefold().split())
+
+
+def video_url(video_id: str) -> str:
+    """Canonical watch URL of a video"""
+    return f"https://www.youtube.com/watch?v={video_id}"
+
+
+class SearchBackend:
+    """Interface for the component that turns a search query into a video"""
+
+    name = "base"
+
+    def search(self, query: str) -> Tuple[str, Optional[str]]:
+        """
+        Find the first result for query.
+
+        Args:
+            query: Search text as entered by the user
+
+        Returns:
+            (video_id, title) of the first result
+
+        Raises:
+            SearchError: If there is no result or the search failed
+        """
+        raise NotImplementedError
+
+
+class YtDlpSearchBackend(SearchBackend):
+    """
+    Runs "yt-dlp ytsearch1:" without downloading.
+
+    --flat-playlist stops at the search results page, so no player page or
+    JavaScript challenge is fetched for the video itself. The result is
+    printed as one JSON line, so titles of any characters and stray output
+    lines cannot be mistaken for ids.
+    """
+
+    name = "ytdlp"
+
+    def search(self, query):
+        cmd = [
+            "yt-dlp",
+            *EXTRACTOR_ARGS,
+            "--flat-playlist",
+            "--skip-download",
+            "--no-warnings",
+            "--print", f"{RESULT_PREFIX}%(.{{id,title}})j",
+            "--",
+            f"ytsearch1:{query}",
+        ]
+        try:
+            with running("yt-dlp"):
+                result = subprocess.run(cmd, capture_output=True, text=True, timeout=SEARCH_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            raise SearchError(f"Search timeout (exceeded {SEARCH_TIMEOUT} seconds)")
+        except OSError as e:
+            raise SearchError(f"Could not run yt-dlp: {e}")
+        if result.returncode != 0:
+            raise SearchError(f"yt-dlp error: {result.stderr[:200]}")
+
+        for line in result.stdout.split('\n'):
+            entry = parse_info_line(line.strip(), RESULT_PREFIX)
+            if entry and entry.get('id'):
+                return entry['id'], entry.get('title')
+        raise SearchError(f"No results found for '{query}'")
+
+
+class StaticSearchBackend(SearchBackend):
+    """
+    Answers from a fixed query -> video ID mapping, optionally after a delay.
+
+    Stands in for YouTube in tests and benchmarks.
+    """
+
+    name = "static"
+
+    def __init__(self, results: Dict[str, str], delay: float = 0.0):
+        self.results = {normalize_query(query): video_id for query, video_id in results.items()}
+        self.delay = delay
+        self.calls = 0
+
+    def search(self, query):
+        self.calls += 1
+        if self.delay:
+            time.sleep(self.delay)
+        video_id = self.results.get(normalize_query(query))
+        if video_id is None:
+            raise SearchError(f"No results found for '{query}'")
+        return video_id, None
+
+
+def create_search_backend(name: str) -> SearchBackend:
+    """Create the search backend selected by configuration ('ytdlp')"""
+    if name == YtDlpSearchBackend.name:
+        return YtDlpSearchBackend()
+    raise ValueError(f"Unknown search backend: {name}")
+
+
+class SearchCache:
+    """
+    Bounded normalized-query -> (video_id, title) cache with a TTL.
+
+    Least recently used entries are evicted once max_entries is reached;
+    entries older than ttl_seconds are treated as missing, since search
+    rankings change over time. Failed searches are not cached.
+    """
+
+    def __init__(self, max_entries: int = 1000, ttl_seconds: float = 6 * 3600):
+        self.max_entries = max(1, max_entries)
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, str, Optional[str]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, query: str) -> Optional[Tuple[str, Optional[str]]]:
+        key = normalize_query(query)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.time() - entry[0] > self.ttl_seconds:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1], entry[2]
+
+    def put(self, query: str, video_id: str, title: Optional[str] = None) -> None:
+        key = normalize_query(query)
+        with self._lock:
+            self._entries[key] = (time.time(), video_id, title)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, int]:
+        """Counters for monitoring"""
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+class SearchResolver:
+    """
+    Resolves search queries to video IDs ahead of the download pipeline.
+
+    Lookups go through the SearchCache; misses run the backend, with
+    concurrent lookups of the same normalized query sharing one search.
+    resolve_all() resolves the queries of a batch in parallel on a pool of
+    its own, so searches never wait behind downloads.
+    """
+
+    def __init__(self, backend: SearchBackend, cache: Optional[SearchCache] = None, max_workers: int = 8):
+        """
+        Initialize the resolver
+
+        Args:
+            backend: Where searches are run
+            cache: Query cache (a default-sized one if omitted)
+            max_workers: Searches run at the same time
+        """
+        self.backend = backend
+        self.cache = cache if cache is not None else SearchCache()
+        self._flights = SingleFlight()
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="search")
+
+    def resolve(self, query: str) -> Tuple[str, Optional[str]]:
+        """
+        Resolve one query.
+
+        Returns:
+            (video_id, title) of the first result; title may be None
+
+        Raises:
+            SearchError: If the query has no result or the search failed
+        """
+        cached = self.cache.get(query)
+        if cached is not None:
+            return cached
+        result, _ = self._flights.do(normalize_query(query), lambda broadcast: self._search(query))
+        return result
+
+    def _search(self, query: str) -> Tuple[str, Optional[str]]:
+        with stage("search"):
+            video_id, title = self.backend.search(query)
+        self.cache.put(query, video_id, title)
+        logger.info(f"Resolved search '{query}' -> {video_id}")
+        return video_id, title
+
+    def resolve_all(self, queries: Iterable[str]) -> List[object]:
+        """
+        Resolve queries concurrently.
+
+        Returns:
+            One entry per query, in order: (video_id, title) or the SearchError
+            raised for it
+        """
+        futures = [self._executor.submit(self.resolve, query) for query in queries]
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except SearchError as e:
+                results.append(e)
+            except Exception as e:
+                results.append(SearchError(f"Unexpected error: {str(e)}"))
+        return results
+
+    def prefetch(self, queries: Iterable[str]) -> None:
+        """Start resolving queries in the background so later resolve() calls hit the cache"""
+        for query in queries:
+            self._executor.submit(self._prefetch_one, query)
+
+    def _prefetch_one(self, query: str) -> None:
+        try:
+            self.resolve(query)
+        except SearchError as e:
+            logger.debug(f"Prefetch of '{query}' failed: {e}")
+
+    def stats(self) -> Dict[str, int]:
+        """Cache and coalescing counters for monitoring"""
+        return {**self.cache.stats(), 'coalesced': self._flights.coalesced}
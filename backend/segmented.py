@@ -0,0 +1,424 @@
+import os
+import queue
+import shutil
+import struct
+import subprocess
+import threading
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from metrics import running
+
+logger = logging.getLogger(__name__)
+
+
+# Samples per MPEG-1 Layer III frame; segment boundaries fall on this grid
+FRAME_SAMPLES = 1152
+
+# Frames encoded before and after a segment's own frames, so the encoder
+# state at its edges matches that of one continuous encode
+OVERLAP_FRAMES = 4
+
+# Timeout of one segment encode (seconds)
+SEGMENT_TIMEOUT = 600
+
+# MPEG-1 Layer III bitrates (kbit/s) by header index, and the sample rates it supports
+_BITRATES = (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320)
+_SAMPLE_RATES = (44100, 48000, 32000)
+
+
+def _frame_length(header: int) -> int:
+    """Length in bytes of the MPEG-1 Layer III frame with this 4-byte header, 0 if it is none"""
+    if header >> 21 != 0x7FF or (header >> 19) & 3 != 3 or (header >> 17) & 3 != 1:
+        return 0
+    bitrate = _BITRATES[(header >> 12) & 15] if (header >> 12) & 15 != 15 else 0
+    rate_index = (header >> 10) & 3
+    if not bitrate or rate_index == 3:
+        return 0
+    return 144000 * bitrate // _SAMPLE_RATES[rate_index] + ((header >> 9) & 1)
+
+
+def _tag_offset(frame: bytes) -> int:
+    """Offset of the Xing/Info tag in a frame: after the header and the side info"""
+    mono = (frame[3] >> 6) & 3 == 3
+    return 4 + (17 if mono else 32)
+
+
+def split_frames(data: bytes) -> Tuple[Optional[bytes], List[Tuple[int, int]]]:
+    """
+    Split a raw MPEG-1 Layer III stream into frames.
+
+    Args:
+        data: MP3 data without ID3 tags
+
+    Returns:
+        (Xing/Info frame if the stream starts with one, [(offset, length)] of the audio frames)
+
+    Raises:
+        ValueError: If the data is not a sequence of MPEG-1 Layer III frames
+    """
+    frames = []
+    offset = 0
+    while offset + 4 <= len(data):
+        length = _frame_length(struct.unpack_from(">I", data, offset)[0])
+        if not length or offset + length > len(data):
+            raise ValueError(f"No MP3 frame at byte {offset}")
+        frames.append((offset, length))
+        offset += length
+    info_frame = None
+    if frames:
+        start = _tag_offset(data)
+        if data[start:start + 4] in (b"Xing", b"Info"):
+            info_frame = data[:frames[0][1]]
+            frames.pop(0)
+    return info_frame, frames
+
+
+def _crc16(data: bytes) -> int:
+    """CRC-16 (polynomial 0x8005, reflected) used by the LAME tag"""
+    crc = 0
+    for byte in data:
+        crc ^= byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0xA001 if crc & 1 else crc >> 1
+    return crc
+
+
+def _lame_offset(frame: bytes) -> Optional[int]:
+    """Offset of the LAME tag that follows the Xing/Info fields of a frame, None if it has none"""
+    xing = _tag_offset(frame)
+    flags = struct.unpack_from(">I", frame, xing + 4)[0]
+    offset = xing + 8 + 4 * bool(flags & 1) + 4 * bool(flags & 2) + 100 * bool(flags & 4) + 4 * bool(flags & 8)
+    return offset if frame[offset:offset + 4] in (b"LAME", b"Lavc", b"Lavf") else None
+
+
+def build_info_frame(template: bytes, frame_sizes: List[int], total_samples: int) -> bytes:
+    """
+    Xing/Info frame describing a stream assembled from several encodes.
+
+    The frame written by ffmpeg for one of the encodes is reused, so the
+    encoder fields of the LAME tag stay as ffmpeg writes them; the frame
+    and byte counts, the seek table (TOC), the padding (which players use
+    with the encoder delay for gapless playback), the music length and the
+    tag CRC are rewritten for the whole stream. The music CRC is cleared.
+
+    Args:
+        template: Xing/Info frame of one of the encodes
+        frame_sizes: Length of every audio frame of the stream, in order
+        total_samples: Samples per channel of the source audio
+    """
+    frame = bytearray(template)
+    xing = _tag_offset(frame)
+    flags = struct.unpack_from(">I", frame, xing + 4)[0]
+    total_bytes = len(frame) + sum(frame_sizes)
+    position = xing + 8
+    if flags & 1:
+        struct.pack_into(">I", frame, position, len(frame_sizes))
+        position += 4
+    if flags & 2:
+        struct.pack_into(">I", frame, position, total_bytes)
+        position += 4
+    if flags & 4:
+        # Entry i: position of the frame at i% of the duration, in 1/256 of the file
+        offsets = [len(frame)]
+        for size in frame_sizes[:-1]:
+            offsets.append(offsets[-1] + size)
+        for i in range(100):
+            offset = offsets[len(frame_sizes) * i // 100] if frame_sizes else 0
+            frame[position + i] = min(255, offset * 256 // total_bytes)
+    lame = _lame_offset(frame)
+    if lame is not None:
+        # 12 bits encoder delay, 12 bits padding
+        delay = (frame[lame + 21] << 4) | (frame[lame + 22] >> 4)
+        padding = max(0, min(0xFFF, len(frame_sizes) * FRAME_SAMPLES - delay - total_samples))
+        frame[lame + 22] = (frame[lame + 22] & 0xF0) | (padding >> 8)
+        frame[lame + 23] = padding & 0xFF
+        struct.pack_into(">I", frame, lame + 28, total_bytes)
+        struct.pack_into(">H", frame, lame + 32, 0)
+        struct.pack_into(">H", frame, lame + 34, _crc16(bytes(frame[:lame + 34])))
+    return bytes(frame)
+
+
+def _read_wav(path: str) -> Tuple[int, int, int]:
+    """(sample rate, bytes per sample frame, offset of the sample data) of a PCM WAV file"""
+    with open(path, "rb") as f:
+        header = f.read(12)
+        if header[:4] != b"RIFF" or header[8:12] != b"WAVE":
+            raise ValueError("Not a WAV file")
+        rate = block_align = None
+        while True:
+            chunk = f.read(8)
+            if len(chunk) < 8:
+                raise ValueError("WAV file has no data chunk")
+            chunk_id, size = chunk[:4], struct.unpack("<I", chunk[4:])[0]
+            if chunk_id == b"data":
+                if rate is None:
+                    raise ValueError("WAV file has no format chunk")
+                return rate, block_align, f.tell()
+            body = f.read(size + (size & 1))
+            if chunk_id == b"fmt ":
+                rate, block_align = struct.unpack_from("<I", body, 4)[0], struct.unpack_from("<H", body, 12)[0]
+
+
+class SegmentedTranscoder:
+    """
+    MP3 encoding of long audio on several ffmpeg processes at once.
+
+    LAME encodes on one core, so a three-hour mix takes minutes in a single
+    ffmpeg. This decodes the source once to a WAV file, cuts it into
+    segments whose boundaries fall on the MP3 frame grid (FRAME_SAMPLES),
+    encodes the segments in parallel and concatenates their frames. Every
+    segment is encoded with OVERLAP_FRAMES of extra audio on both sides and
+    without the bit reservoir, so its frames do not depend on frames of
+    another encode; only the frames belonging to the segment are kept.
+    Because every encode starts on the frame grid and has the same encoder
+    delay, the kept frames line up exactly with those of one continuous
+    encode. A Xing/Info frame with the frame count, seek table, encoder
+    delay and padding of the whole stream makes the result gapless and
+    lets players show the right duration.
+
+    The calling thread encodes segments with the transcode slot it holds;
+    helper threads join for every further slot that is free, so the
+    segments never use more processes than the transcode limit allows.
+    """
+
+    def __init__(self, min_duration: float = 1200, segment_seconds: float = 120, max_workers: Optional[int] = None):
+        """
+        Initialize the transcoder
+
+        Args:
+            min_duration: Sources shorter than this many seconds are encoded in one piece
+            segment_seconds: Length of a segment
+            max_workers: Upper bound of parallel encodes (default: CPU count)
+        """
+        self.min_duration = min_duration
+        self.segment_seconds = segment_seconds
+        self.max_workers = max(1, max_workers or os.cpu_count() or 1)
+        self._lock = threading.Lock()
+        self.transcodes = 0
+        self.segments = 0
+
+    def accepts(self, extension: str, audio_args: List[str], duration: Any) -> bool:
+        """Whether an encode to extension with audio_args of a source of duration seconds is segmented"""
+        return (
+            extension == "mp3"
+            and "libmp3lame" in audio_args
+            and isinstance(duration, (int, float))
+            and duration >= self.min_duration
+        )
+
+    def transcode(
+        self,
+        source_path: str,
+        output_path: str,
+        ffmpeg: str,
+        audio_args: List[str],
+        slots: Optional[threading.Semaphore] = None
+    ) -> Optional[subprocess.CompletedProcess]:
+        """
+        Encode source_path to the MP3 file output_path in segments.
+
+        Args:
+            source_path: Downloaded audio
+            output_path: MP3 file to write
+            ffmpeg: ffmpeg executable
+            audio_args: libmp3lame encoding arguments of the profile
+            slots: Transcode limit; the caller must hold one of its slots
+
+        Returns:
+            Like subprocess.run() of a single ffmpeg (returncode, stderr), or
+            None if the source cannot be segmented (the caller encodes it
+            in one piece)
+        """
+        work_dir = output_path + ".segments"
+        os.makedirs(work_dir, exist_ok=True)
+        try:
+            wav_path = os.path.join(work_dir, "source.wav")
+            with running("ffmpeg"):
+                decode = subprocess.run(
+                    [ffmpeg, "-y", "-loglevel", "error", "-i", source_path, "-vn", "-map_metadata", "-1",
+                     "-codec:a", "pcm_s16le", "-f", "wav", wav_path],
+                    capture_output=True, text=True, timeout=SEGMENT_TIMEOUT
+                )
+            if decode.returncode != 0:
+                return decode
+            rate, block_align, data_offset = _read_wav(wav_path)
+            if rate not in _SAMPLE_RATES:
+                logger.info(f"Encoding {os.path.basename(output_path)} in one piece: {rate} Hz is no MPEG-1 rate")
+                return None
+            total_samples = (os.path.getsize(wav_path) - data_offset) // block_align
+            plan = self._plan(total_samples, rate)
+
+            def encode(index: int) -> Tuple[str, Optional[bytes], List[Tuple[int, int]]]:
+                first, keep_from, keep_to, last = plan[index]
+                path = os.path.join(work_dir, f"{index:05d}.mp3")
+                self._encode(
+                    ffmpeg, wav_path, data_offset + first * FRAME_SAMPLES * block_align,
+                    (min(total_samples, last * FRAME_SAMPLES) - first * FRAME_SAMPLES) * block_align,
+                    rate, block_align // 2, audio_args, path, xing=index == 0
+                )
+                with open(path, "rb") as f:
+                    info_frame, frames = split_frames(f.read())
+                stop = len(frames) if keep_to is None else keep_to - first
+                if stop > len(frames):
+                    raise ValueError(f"Segment {index} has {len(frames)} frames, expected at least {stop}")
+                return path, info_frame, frames[keep_from - first:stop]
+
+            results = self._run(len(plan), encode, slots)
+            self._assemble(output_path, results, total_samples)
+            with self._lock:
+                self.transcodes += 1
+                self.segments += len(plan)
+            return subprocess.CompletedProcess([ffmpeg], 0, "", "")
+        except (OSError, ValueError, subprocess.SubprocessError) as e:
+            return subprocess.CompletedProcess([ffmpeg], 1, "", f"segmented encode failed: {e}")
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    def _plan(self, total_samples: int, rate: int) -> List[Tuple[int, int, Optional[int], int]]:
+        """
+        Segments as frame numbers on the grid of one continuous encode.
+
+        Returns:
+            [(first encoded, first kept, end of kept (None: to the end), end of encoded input)]
+        """
+        total_frames = -(-total_samples // FRAME_SAMPLES)
+        length = max(1, round(self.segment_seconds * rate / FRAME_SAMPLES))
+        starts = list(range(0, total_frames, length))
+        plan = []
+        for n, start in enumerate(starts):
+            end = starts[n + 1] if n + 1 < len(starts) else None
+            plan.append((
+                max(0, start - OVERLAP_FRAMES),
+                start,
+                end,
+                total_frames if end is None else min(total_frames, end + OVERLAP_FRAMES),
+            ))
+        return plan
+
+    @staticmethod
+    def _encode(
+        ffmpeg: str,
+        wav_path: str,
+        offset: int,
+        length: int,
+        rate: int,
+        channels: int,
+        audio_args: List[str],
+        output_path: str,
+        xing: bool
+    ) -> None:
+        """Encode length bytes of PCM starting at offset of wav_path without the bit reservoir"""
+        cmd = [
+            ffmpeg, "-y", "-loglevel", "error",
+            "-f", "s16le", "-ar", str(rate), "-ac", str(channels), "-i", "pipe:0",
+            *audio_args, "-reservoir", "0", "-id3v2_version", "0",
+        ]
+        if not xing:
+            cmd += ["-write_xing", "0"]
+        with running("ffmpeg"):
+            process = subprocess.Popen(cmd + ["-f", "mp3", output_path], stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+
+            def feed():
+                try:
+                    with open(wav_path, "rb") as f:
+                        f.seek(offset)
+                        remaining = length
+                        while remaining > 0:
+                            chunk = f.read(min(remaining, 1 << 20))
+                            if not chunk:
+                                break
+                            process.stdin.write(chunk)
+                            remaining -= len(chunk)
+                except (BrokenPipeError, ValueError):
+                    pass
+                finally:
+                    try:
+                        process.stdin.close()
+                    except BrokenPipeError:
+                        pass
+
+            feeder = threading.Thread(target=feed, daemon=True)
+            feeder.start()
+            killer = threading.Timer(SEGMENT_TIMEOUT, process.kill)
+            killer.start()
+            try:
+                stderr = process.stderr.read()
+                process.wait()
+            finally:
+                timed_out = not killer.is_alive()
+                killer.cancel()
+                feeder.join()
+                process.stderr.close()
+        if timed_out:
+            raise subprocess.TimeoutExpired(cmd, SEGMENT_TIMEOUT)
+        if process.returncode != 0:
+            raise ValueError(stderr.decode("utf-8", "replace")[:200])
+
+    def _run(self, count: int, encode, slots: Optional[threading.Semaphore]) -> list:
+        """Run encode(0..count-1) on the calling thread plus one helper per free slot"""
+        pending: "queue.Queue[int]" = queue.Queue()
+        for index in range(count):
+            pending.put(index)
+        results: list = [None] * count
+        errors: list = []
+        helpers: List[threading.Thread] = []
+
+        def drain(owns_slot: bool) -> None:
+            try:
+                while not errors:
+                    try:
+                        index = pending.get_nowait()
+                    except queue.Empty:
+                        return
+                    try:
+                        results[index] = encode(index)
+                    except Exception as e:
+                        errors.append(e)
+            finally:
+                if owns_slot:
+                    slots.release()
+
+        def recruit() -> None:
+            while len(helpers) < min(self.max_workers - 1, pending.qsize()):
+                if slots is not None and not slots.acquire(blocking=False):
+                    return
+                helper = threading.Thread(target=drain, args=(slots is not None,), daemon=True)
+                helper.start()
+                helpers.append(helper)
+
+        while not errors:
+            recruit()
+            try:
+                index = pending.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                results[index] = encode(index)
+            except Exception as e:
+                errors.append(e)
+        for helper in helpers:
+            helper.join()
+        if errors:
+            raise errors[0]
+        return results
+
+    @staticmethod
+    def _assemble(output_path: str, results: list, total_samples: int) -> None:
+        """Write the kept frames of every segment after a Xing/Info frame for the whole stream"""
+        template = results[0][1]
+        if template is None:
+            raise ValueError("First segment has no Xing/Info frame")
+        frame_sizes = [length for _, _, frames in results for _, length in frames]
+        with open(output_path, "wb") as out:
+            out.write(build_info_frame(template, frame_sizes, total_samples))
+            for path, _, frames in results:
+                if not frames:
+                    continue
+                with open(path, "rb") as f:
+                    f.seek(frames[0][0])
+                    out.write(f.read(frames[-1][0] + frames[-1][1] - frames[0][0]))
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'transcodes': self.transcodes, 'segments': self.segments}
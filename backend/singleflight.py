@@ -0,0 +1,97 @@
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+class _Flight:
+    """One in-progress call shared by every caller with the same key"""
+
+    __slots__ = ('done', 'result', 'error', 'listeners', 'waiters')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.listeners: List[Callable[[Dict[str, Any]], None]] = []
+        self.waiters = 0
+
+    def broadcast(self, event: Dict[str, Any]) -> None:
+        """Forward a progress event to every caller attached to this flight"""
+        for listener in list(self.listeners):
+            listener(event)
+
+
+class SingleFlight:
+    """
+    Deduplicates concurrent calls for the same key.
+
+    The first caller for a key (the leader) runs the function; callers that
+    arrive while it is still running wait for it and receive the same result
+    instead of starting their own work. Progress events produced by the
+    leader are forwarded to every attached caller.
+    """
+
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.coalesced = 0
+
+    def do(
+        self,
+        key: str,
+        fn: Callable[[Callable[[Dict[str, Any]], None]], Any],
+        progress: Optional[Callable[[Dict[str, Any]], None]] = None
+    ) -> Tuple[Any, bool]:
+        """
+        Run fn once per key among concurrent callers.
+
+        Args:
+            key: Identity of the work, callers with equal keys share one call
+            fn: Called as fn(progress_callback) by the leader only
+            progress: Optional callback for progress events of the shared call
+
+        Returns:
+            (result, shared) where shared is True for callers that attached
+            to another caller's flight
+
+        Raises:
+            Whatever fn raised, in the leader and in every attached caller
+        """
+        with self._lock:
+            self.calls += 1
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self._flights[key] = flight
+            else:
+                self.coalesced += 1
+            flight.waiters += 1
+            if progress is not None:
+                flight.listeners.append(progress)
+
+        if leader:
+            try:
+                flight.result = fn(flight.broadcast)
+            except BaseException as e:
+                flight.error = e
+            finally:
+                with self._lock:
+                    del self._flights[key]
+                flight.done.set()
+        else:
+            flight.done.wait()
+
+        if flight.error is not None:
+            raise flight.error
+        return flight.result, not leader
+
+    def stats(self) -> Dict[str, int]:
+        """Counters for monitoring"""
+        with self._lock:
+            return {
+                'calls': self.calls,
+                'coalesced': self.coalesced,
+                'inFlight': len(self._flights),
+                'waiting': sum(flight.waiters for flight in self._flights.values()),
+            }
@@ -0,0 +1,250 @@
+import heapq
+import json
+import os
+import sqlite3
+import threading
+import time
+import logging
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+# Length of a uuid4 file_id; files are named {file_id}_{title}.{ext}
+FILE_ID_LENGTH = 36
+
+
+def shard_dir(output_dir: str, file_id: str) -> str:
+    """
+    Directory a file is stored in: one subdirectory per 2-character id prefix.
+
+    uuid4 prefixes are uniformly distributed, so 256 shards keep every
+    directory small even with hundreds of thousands of files.
+    """
+    return os.path.join(output_dir, file_id[:2])
+
+
+class FileIndex:
+    """
+    Index of converted files: file_id -> path, display name, size, created
+    time and the file's metadata record (see metadata.build_record).
+
+    Lookups are served from an in-memory dict; every change is written
+    through to SQLite so the index survives restarts. A min-heap ordered by
+    creation time lets cleanup find expired files without touching the disk:
+    removed or re-added files leave stale heap entries that are skipped when
+    popped.
+    """
+
+    def __init__(self, db_path: str, output_dir: str, seed: bool = True):
+        """
+        Initialize the index
+
+        Args:
+            db_path: SQLite database file
+            output_dir: Directory holding the converted files (scanned once
+                to seed a new, empty index)
+            seed: Whether a new, empty index is seeded from output_dir
+        """
+        self.db_path = db_path
+        self.output_dir = output_dir
+        self._files: Dict[str, Dict[str, Any]] = {}
+        self._expiry: List[Tuple[float, str]] = []
+        self._bytes = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS files (
+                id TEXT PRIMARY KEY,
+                path TEXT NOT NULL,
+                display_name TEXT NOT NULL,
+                size INTEGER,
+                created_at REAL NOT NULL,
+                metadata TEXT
+            )
+            """
+        )
+        # Indexes created before metadata records existed lack the column
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(files)")}
+        if "metadata" not in columns:
+            self._conn.execute("ALTER TABLE files ADD COLUMN metadata TEXT")
+        self._conn.commit()
+        self._load(seed)
+
+    def _load(self, seed: bool = True) -> None:
+        rows = self._conn.execute("SELECT id, path, display_name, size, created_at, metadata FROM files").fetchall()
+        for file_id, path, display_name, size, created_at, metadata in rows:
+            self._files[file_id] = self._record(
+                file_id, path, display_name, size, created_at, json.loads(metadata) if metadata else None
+            )
+            self._expiry.append((created_at, file_id))
+            self._bytes += size or 0
+        heapq.heapify(self._expiry)
+        if rows:
+            logger.info(f"File index loaded: {len(rows)} files")
+        elif seed:
+            self._seed_from_disk()
+
+    @staticmethod
+    def _record(
+        file_id: str,
+        path: str,
+        display_name: str,
+        size: Optional[int],
+        created_at: float,
+        metadata: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        return {
+            'id': file_id,
+            'path': path,
+            'displayName': display_name,
+            'size': size,
+            'createdAt': created_at,
+            'metadata': metadata,
+        }
+
+    def _seed_from_disk(self) -> None:
+        """Index files already on disk (flat layout or shards) when starting with an empty index"""
+        if not os.path.isdir(self.output_dir):
+            return
+        count = 0
+        for directory, subdirs, filenames in os.walk(self.output_dir):
+            # Skip hidden directories such as the conversion cache
+            subdirs[:] = [d for d in subdirs if not d.startswith(".")]
+            for filename in filenames:
+                if len(filename) <= FILE_ID_LENGTH or filename[FILE_ID_LENGTH] != "_":
+                    continue
+                path = os.path.join(directory, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                self.add(filename[:FILE_ID_LENGTH], path, size=stat.st_size, created_at=stat.st_mtime)
+                count += 1
+        if count:
+            logger.info(f"File index seeded from disk: {count} files")
+
+    def add(
+        self,
+        file_id: str,
+        path: str,
+        size: Optional[int] = None,
+        created_at: Optional[float] = None,
+        metadata: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """
+        Register a converted file.
+
+        Args:
+            file_id: Identifier handed out to clients
+            path: Location of the file on disk
+            size: File size in bytes (read from disk when omitted)
+            created_at: Unix timestamp (now when omitted)
+            metadata: Metadata record of the file, if known
+
+        Returns:
+            The index record
+        """
+        filename = os.path.basename(path)
+        display_name = filename.replace(f"{file_id}_", "", 1)
+        if size is None:
+            size = os.path.getsize(path)
+        record = self._record(file_id, path, display_name, size, created_at or time.time(), metadata)
+        with self._lock:
+            replaced = self._files.get(file_id)
+            self._bytes += (size or 0) - ((replaced['size'] or 0) if replaced else 0)
+            self._files[file_id] = record
+            heapq.heappush(self._expiry, (record['createdAt'], file_id))
+            with self._conn:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO files (id, path, display_name, size, created_at, metadata)"
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    (file_id, path, display_name, size, record['createdAt'],
+                     json.dumps(metadata, separators=(",", ":")) if metadata else None)
+                )
+        return record
+
+    def get(self, file_id: str) -> Optional[Dict[str, Any]]:
+        """Look up a file by id (O(1), no disk access)"""
+        return self._files.get(file_id)
+
+    def remove(self, file_id: str) -> Optional[Dict[str, Any]]:
+        """Forget a file (does not delete it from disk)"""
+        with self._lock:
+            record = self._files.pop(file_id, None)
+            if record is not None:
+                self._bytes -= record['size'] or 0
+                with self._conn:
+                    self._conn.execute("DELETE FROM files WHERE id = ?", (file_id,))
+                self._compact()
+        return record
+
+    def pop_expired(self, cutoff: float) -> List[Dict[str, Any]]:
+        """
+        Remove and return every record created at or before cutoff.
+
+        Costs O(k log n) for k expired files; files are not deleted from disk.
+        """
+        with self._lock:
+            expired = []
+            while self._expiry and self._expiry[0][0] <= cutoff:
+                record = self._pop_current()
+                if record is not None:
+                    expired.append(record)
+            self._forget(expired)
+            return expired
+
+    def pop_oldest(self) -> Optional[Dict[str, Any]]:
+        """Remove and return the oldest record (None if the index is empty)"""
+        with self._lock:
+            while self._expiry:
+                record = self._pop_current()
+                if record is not None:
+                    self._forget([record])
+                    return record
+            return None
+
+    def _pop_current(self) -> Optional[Dict[str, Any]]:
+        """Pop the heap top, returning its record unless the entry is stale"""
+        created_at, file_id = heapq.heappop(self._expiry)
+        record = self._files.get(file_id)
+        if record is None or record['createdAt'] != created_at:
+            return None
+        return record
+
+    def _forget(self, records: List[Dict[str, Any]]) -> None:
+        if not records:
+            return
+        for record in records:
+            del self._files[record['id']]
+            self._bytes -= record['size'] or 0
+        with self._conn:
+            self._conn.executemany("DELETE FROM files WHERE id = ?", [(record['id'],) for record in records])
+        self._compact()
+
+    def _compact(self) -> None:
+        """Rebuild the heap once stale entries clearly outnumber live ones"""
+        if len(self._expiry) > 2 * len(self._files) + 1024:
+            self._expiry = [(r['createdAt'], r['id']) for r in self._files.values()]
+            heapq.heapify(self._expiry)
+
+    def records(self) -> Iterator[Dict[str, Any]]:
+        """Snapshot of every record"""
+        with self._lock:
+            return iter(list(self._files.values()))
+
+    def __len__(self) -> int:
+        return len(self._files)
+
+    @property
+    def total_bytes(self) -> int:
+        """Sum of the sizes of the indexed files, kept up to date on every change"""
+        return self._bytes
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,122 @@
+import asyncio
+import os
+import threading
+import logging
+from typing import AsyncIterator, List, Optional, Tuple
+
+import anyio
+
+from metrics import count_served
+
+logger = logging.getLogger(__name__)
+
+
+class StreamFailed(IOError):
+    """The conversion feeding a GrowingFile failed before it was complete"""
+
+
+class GrowingFile:
+    """
+    A file that is being written while clients read it.
+
+    One writer thread appends the encoder output with write(); any number of
+    asyncio readers follow it with chunks(), each with its own file handle,
+    reading up to the current write offset and then waiting for the writer
+    to make progress. The data goes to disk once, so late joiners start
+    from the first byte without the writer buffering anything in memory.
+    """
+
+    def __init__(self, path: str, file_id: str, display_name: str, completed: bool = False):
+        """
+        Initialize the file
+
+        Args:
+            path: Location on disk
+            file_id: Identifier handed out to clients
+            display_name: Filename offered to clients
+            completed: Wrap an existing, finished file instead of creating one
+        """
+        self.path = path
+        self.file_id = file_id
+        self.display_name = display_name
+        self.error: Optional[str] = None
+        self._lock = threading.Lock()
+        self._waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+        if completed:
+            self.size = os.path.getsize(path)
+            self.done = True
+            self._file = None
+        else:
+            self.size = 0
+            self.done = False
+            # Unbuffered: every write is visible to readers right away
+            self._file = open(path, "wb", buffering=0)
+
+    def write(self, data: bytes) -> None:
+        """Append data and wake up waiting readers (writer thread only)"""
+        self._file.write(data)
+        with self._lock:
+            self.size += len(data)
+            waiters, self._waiters = self._waiters, []
+        self._wake(waiters)
+
+    def finish(self, error: Optional[str] = None) -> None:
+        """Mark the file complete, or failed with error (writer thread only)"""
+        self._file.close()
+        with self._lock:
+            self.error = error
+            self.done = True
+            waiters, self._waiters = self._waiters, []
+        self._wake(waiters)
+
+    @staticmethod
+    def _wake(waiters) -> None:
+        for loop, future in waiters:
+            try:
+                loop.call_soon_threadsafe(_resolve, future)
+            except RuntimeError:
+                # Event loop already closed
+                pass
+
+    async def _wait_beyond(self, offset: int) -> None:
+        """Wait until more than offset bytes are written or the file is done"""
+        future = asyncio.get_running_loop().create_future()
+        with self._lock:
+            if self.size > offset or self.done:
+                return
+            self._waiters.append((asyncio.get_running_loop(), future))
+        await future
+
+    async def chunks(self, chunk_size: int = 64 * 1024) -> AsyncIterator[bytes]:
+        """
+        Read the file from the start, following the writer until it is done.
+
+        Raises:
+            StreamFailed: If the writer failed; the response is aborted
+                instead of ending like a complete file
+        """
+        offset = 0
+        try:
+            async with await anyio.open_file(self.path, "rb") as f:
+                while True:
+                    # Read done before size: once done is seen, size is final
+                    done = self.done
+                    if offset < self.size:
+                        chunk = await f.read(min(chunk_size, self.size - offset))
+                        if not chunk:
+                            raise StreamFailed(f"{self.path} is shorter than the data written to it")
+                        offset += len(chunk)
+                        yield chunk
+                        continue
+                    if done:
+                        if self.error is not None:
+                            raise StreamFailed(self.error)
+                        return
+                    await self._wait_beyond(offset)
+        finally:
+            count_served("stream", offset)
+
+
+def _resolve(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
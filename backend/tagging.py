@@ -0,0 +1,345 @@
+import base64
+import os
+import threading
+import time
+import logging
+import urllib.request
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from metrics import stage
+from singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+
+# Thumbnail download timeout (seconds) and largest accepted image
+THUMBNAIL_TIMEOUT = 10
+THUMBNAIL_MAX_BYTES = 2 * 1024 * 1024
+
+# Seconds a failed thumbnail download is not retried for the same video
+THUMBNAIL_RETRY_SECONDS = 600
+
+
+def image_mime(data: bytes) -> Optional[str]:
+    """MIME type of JPEG/PNG image data (the formats players show as cover art)"""
+    if data.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if data.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    return None
+
+
+def thumbnail_url(video_id: Optional[str], url: Optional[str]) -> Optional[str]:
+    """
+    URL of a JPEG/PNG thumbnail of a video.
+
+    yt-dlp often reports a WebP thumbnail, which most players do not show
+    as cover art; YouTube serves a JPEG of every video under a fixed URL.
+    """
+    if url and url.split("?")[0].lower().endswith((".jpg", ".jpeg", ".png")):
+        return url
+    if video_id:
+        return f"https://i.ytimg.com/vi/{video_id}/hqdefault.jpg"
+    return None
+
+
+class ThumbnailCache:
+    """
+    Thumbnails on disk, one file per video ID.
+
+    Concurrent requests for the same video share one download. Once
+    max_entries files are stored, the least recently used ones are removed.
+    Failed downloads are remembered for THUMBNAIL_RETRY_SECONDS, so a video
+    without a usable thumbnail (or a host without network) does not cost a
+    timeout per file.
+    """
+
+    def __init__(self, cache_dir: str, max_entries: int = 1000, timeout: float = THUMBNAIL_TIMEOUT):
+        """
+        Initialize the cache
+
+        Args:
+            cache_dir: Directory the thumbnails are stored in
+            max_entries: Maximum number of stored thumbnails
+            timeout: Download timeout in seconds
+        """
+        self.cache_dir = cache_dir
+        self.max_entries = max(1, max_entries)
+        self.timeout = timeout
+        self._flights = SingleFlight()
+        self._failed: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.failures = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, video_id: str) -> str:
+        return os.path.join(self.cache_dir, f"{video_id}.img")
+
+    def get(self, video_id: str, url: Optional[str]) -> Optional[Tuple[bytes, str]]:
+        """
+        Thumbnail of a video, downloading it on the first request.
+
+        Args:
+            video_id: Video the thumbnail belongs to (the cache key)
+            url: Thumbnail URL reported by yt-dlp (see thumbnail_url)
+
+        Returns:
+            (image data, MIME type), or None if no usable thumbnail is available
+        """
+        path = self._path(video_id)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+            with self._lock:
+                self.hits += 1
+            return data, image_mime(data)
+        except FileNotFoundError:
+            pass
+
+        with self._lock:
+            failed_at = self._failed.get(video_id)
+            if failed_at is not None and time.time() - failed_at < THUMBNAIL_RETRY_SECONDS:
+                return None
+            self.misses += 1
+        result, _ = self._flights.do(video_id, lambda broadcast: self._fetch(video_id, url))
+        return result
+
+    def _fetch(self, video_id: str, url: Optional[str]) -> Optional[Tuple[bytes, str]]:
+        source = thumbnail_url(video_id, url)
+        try:
+            if source is None:
+                raise ValueError("no thumbnail URL")
+            with urllib.request.urlopen(source, timeout=self.timeout) as response:
+                data = response.read(THUMBNAIL_MAX_BYTES + 1)
+            mime = image_mime(data)
+            if mime is None or len(data) > THUMBNAIL_MAX_BYTES:
+                raise ValueError("not a JPEG/PNG image of acceptable size")
+        except Exception as e:
+            logger.info(f"No cover art for {video_id}: {e}")
+            with self._lock:
+                self.failures += 1
+                self._failed[video_id] = time.time()
+            return None
+
+        path = self._path(video_id)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(temp_path, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, path)
+            self._prune()
+        except OSError as e:
+            logger.warning(f"Could not cache thumbnail of {video_id}: {e}")
+        return data, mime
+
+    def _prune(self) -> None:
+        """Remove the least recently used thumbnails beyond max_entries"""
+        with os.scandir(self.cache_dir) as entries:
+            files = [(entry.stat().st_mtime, entry.path) for entry in entries if entry.name.endswith(".img")]
+        if len(files) <= self.max_entries:
+            return
+        files.sort()
+        for _, path in files[:len(files) - self.max_entries]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def stats(self) -> Dict[str, int]:
+        """Counters for monitoring"""
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'failures': self.failures}
+
+
+class Tagger:
+    """
+    Writes tags and cover art into converted files with mutagen.
+
+    MP3 files get an ID3v2.3 tag (title, artist, album, year, source URL
+    and an attached picture); Opus and M4A files get the equivalent
+    Vorbis comments and MP4 atoms. mutagen edits the file in place: only
+    the tag at the start of the file is written, and the audio after it
+    is moved within the same file when the tag grows, instead of the whole
+    file being copied to a new one.
+    """
+
+    def __init__(self, thumbnails: Optional[ThumbnailCache] = None):
+        """
+        Initialize the tagger
+
+        Args:
+            thumbnails: Where cover art comes from; None writes no cover art
+
+        Raises:
+            ImportError: If mutagen is not installed
+        """
+        import mutagen
+        self._mutagen = mutagen
+        self.thumbnails = thumbnails
+
+    def tag(self, path: str, record: Dict[str, Any]) -> None:
+        """
+        Tag one file from its metadata record (see metadata.build_record).
+
+        Raises:
+            ValueError: If the file type cannot be tagged
+            mutagen.MutagenError: If the file cannot be read or written
+        """
+        cover = None
+        if self.thumbnails is not None and record.get("videoId"):
+            cover = self.thumbnails.get(record["videoId"], record.get("thumbnail"))
+
+        extension = os.path.splitext(path)[1].lower()
+        if extension == ".mp3":
+            self._tag_mp3(path, record, cover)
+        elif extension == ".opus":
+            self._tag_opus(path, record, cover)
+        elif extension == ".m4a":
+            self._tag_m4a(path, record, cover)
+        else:
+            raise ValueError(f"Cannot tag {extension} files")
+
+    def _tag_mp3(self, path, record, cover):
+        from mutagen.id3 import APIC, ID3, ID3NoHeaderError, TALB, TDRC, TIT2, TPE1, WOAS
+
+        try:
+            tags = ID3(path)
+        except ID3NoHeaderError:
+            tags = ID3()
+        frames = [
+            (TIT2, record.get("title")),
+            (TPE1, record.get("artist") or record.get("uploader")),
+            (TALB, record.get("album")),
+            (TDRC, record.get("year")),
+        ]
+        for frame, text in frames:
+            if text:
+                tags.setall(frame.__name__, [frame(encoding=3, text=text)])
+        if record.get("sourceUrl"):
+            tags.setall("WOAS", [WOAS(url=record["sourceUrl"])])
+        if cover is not None:
+            data, mime = cover
+            tags.setall("APIC", [APIC(encoding=3, mime=mime, type=3, desc="Cover", data=data)])
+        # v2.3 is what most players and file managers read
+        tags.save(path, v2_version=3)
+
+    def _tag_opus(self, path, record, cover):
+        from mutagen.flac import Picture
+        from mutagen.oggopus import OggOpus
+
+        audio = OggOpus(path)
+        for key, value in self._text_tags(record).items():
+            audio[key] = [value]
+        if cover is not None:
+            picture = Picture()
+            picture.data, picture.mime = cover
+            picture.type = 3
+            audio["metadata_block_picture"] = [base64.b64encode(picture.write()).decode("ascii")]
+        audio.save()
+
+    def _tag_m4a(self, path, record, cover):
+        from mutagen.mp4 import MP4, MP4Cover
+
+        audio = MP4(path)
+        atoms = {"title": "\xa9nam", "artist": "\xa9ART", "album": "\xa9alb", "date": "\xa9day", "comment": "\xa9cmt"}
+        for key, value in self._text_tags(record).items():
+            audio[atoms[key]] = [value]
+        if cover is not None:
+            data, mime = cover
+            image_format = MP4Cover.FORMAT_PNG if mime == "image/png" else MP4Cover.FORMAT_JPEG
+            audio["covr"] = [MP4Cover(data, imageformat=image_format)]
+        audio.save()
+
+    @staticmethod
+    def _text_tags(record: Dict[str, Any]) -> Dict[str, str]:
+        """Vorbis-comment style text tags; the source URL goes into the comment"""
+        tags = {
+            "title": record.get("title"),
+            "artist": record.get("artist") or record.get("uploader"),
+            "album": record.get("album"),
+            "date": record.get("year"),
+            "comment": record.get("sourceUrl"),
+        }
+        return {key: value for key, value in tags.items() if value}
+
+
+class TaggingStage:
+    """
+    Worker pool tagging converted files behind the transcode stage.
+
+    Conversions hand their file over with submit() and return right away,
+    so the worker that produced item N moves on to downloading item N+1
+    while item N is being tagged. The file is registered (on_done) only
+    once its tags are written, so it is never served half-modified;
+    pending() lets readers wait for a file that is still being tagged.
+    A failed tagging is logged and the file is registered untagged.
+    """
+
+    def __init__(self, tagger: Tagger, max_workers: int = 2):
+        """
+        Initialize the stage
+
+        Args:
+            tagger: Writes the tags
+            max_workers: Files tagged at the same time
+        """
+        self.tagger = tagger
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="tagging")
+        self._pending: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self.tagged = 0
+        self.failed = 0
+
+    def submit(self, file_id: str, path: str, record: Dict[str, Any], on_done: Callable[[], None]) -> Future:
+        """
+        Queue a file for tagging.
+
+        Args:
+            file_id: ID of the file (see pending())
+            path: File to tag
+            record: Metadata record the tags are taken from
+            on_done: Called on the tagging thread once the file is final
+        """
+        with self._lock:
+            future = self._executor.submit(self._run, file_id, path, record, on_done)
+            self._pending[file_id] = future
+        return future
+
+    def _run(self, file_id, path, record, on_done) -> None:
+        try:
+            with stage("tagging"):
+                self.tagger.tag(path, record)
+            with self._lock:
+                self.tagged += 1
+        except Exception as e:
+            logger.warning(f"Could not tag {os.path.basename(path)}: {e}")
+            with self._lock:
+                self.failed += 1
+        try:
+            on_done()
+        except Exception as e:
+            logger.error(f"Error registering tagged file {file_id}: {e}")
+        finally:
+            with self._lock:
+                self._pending.pop(file_id, None)
+
+    def pending(self, file_id: str) -> Optional[Future]:
+        """Future of a file that is still queued or being tagged, else None"""
+        with self._lock:
+            return self._pending.get(file_id)
+
+    def shutdown(self) -> None:
+        """Finish the queued files and stop the workers"""
+        self._executor.shutdown(wait=True)
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters for monitoring"""
+        with self._lock:
+            stats = {'pending': len(self._pending), 'tagged': self.tagged, 'failed': self.failed}
+        if self.tagger.thumbnails is not None:
+            stats['thumbnails'] = self.tagger.thumbnails.stats()
+        return stats
@@ -0,0 +1,290 @@
+import random
+import re
+import subprocess
+import threading
+import time
+import logging
+from collections import deque
+from typing import Any, Callable, Dict, Optional
+
+from engines import DownloadError
+
+logger = logging.getLogger(__name__)
+
+
+# Outcomes of a download attempt. Throttling and transient errors say
+# something about YouTube or the network and are retried; geo blocks and
+# unavailable videos are properties of the video and fail at once, as do
+# errors that match no pattern.
+SUCCESS = "success"
+THROTTLED = "throttled"
+GEO_BLOCKED = "geo_blocked"
+UNAVAILABLE = "unavailable"
+TRANSIENT = "transient"
+UNKNOWN = "unknown"
+
+RETRYABLE = (THROTTLED, TRANSIENT)
+
+# Checked in order: "Unable to download webpage: HTTP Error 429" is
+# throttling, "Video unavailable. ... not available in your country" a geo block
+_PATTERNS = (
+    (THROTTLED, re.compile(
+        r"HTTP Error 429|Too Many Requests|HTTP Error 403|Forbidden|rate.?limit|confirm you.re not a bot",
+        re.IGNORECASE
+    )),
+    (GEO_BLOCKED, re.compile(
+        r"available (?:in your country|from your location)|geo.?restrict|blocked it in your country",
+        re.IGNORECASE
+    )),
+    (UNAVAILABLE, re.compile(
+        r"Video unavailable|Private video|has been removed|account .* has been terminated|members.only"
+        r"|Join this channel|live event will begin|Premieres in|confirm your age|age.restricted"
+        r"|No video formats found|Requested format is not available|Unsupported URL|no video found",
+        re.IGNORECASE
+    )),
+    (TRANSIENT, re.compile(
+        r"timed out|Connection (?:reset|refused|aborted)|Remote end closed|IncompleteRead"
+        r"|Temporary failure in name resolution|Name or service not known|Network is unreachable"
+        r"|HTTP Error 5\d\d|Unable to download (?:webpage|API page)|urlopen error|EOF occurred|SSL",
+        re.IGNORECASE
+    )),
+)
+
+
+def classify_error(message: str) -> str:
+    """
+    Classify the error output of a failed yt-dlp run.
+
+    Args:
+        message: Error message (stderr excerpt) of yt-dlp
+
+    Returns:
+        THROTTLED, GEO_BLOCKED, UNAVAILABLE, TRANSIENT or UNKNOWN
+    """
+    for kind, pattern in _PATTERNS:
+        if pattern.search(message):
+            return kind
+    return UNKNOWN
+
+
+class AdaptiveLimiter:
+    """
+    Concurrency limit on downloads that adapts to upstream health (AIMD).
+
+    Works like a semaphore whose size moves between min_limit and
+    max_limit. Every download attempt reports its outcome: a throttled
+    attempt, or transient errors above error_threshold of the last
+    window outcomes, cut the limit by decrease_factor; successes while
+    the error rate is below the threshold grow it by one slot per limit
+    successes. Like TCP congestion control, only attempts started after
+    the last decrease can decrease it again, so the failures of one burst
+    of downloads count once. Running downloads are never interrupted; a
+    smaller limit only holds back new ones. With min_limit equal to
+    max_limit the limit is fixed.
+    """
+
+    def __init__(
+        self,
+        max_limit: int,
+        min_limit: int = 1,
+        decrease_factor: float = 0.5,
+        error_threshold: float = 0.2,
+        window: int = 20
+    ):
+        """
+        Initialize the limiter at max_limit
+
+        Args:
+            max_limit: Upper bound (and starting value) of the limit
+            min_limit: Lower bound of the limit
+            decrease_factor: Factor applied to the limit on a decrease
+            error_threshold: Share of throttled/transient outcomes in the
+                window above which the limit stops growing and transient
+                errors decrease it
+            window: Number of recent outcomes the error rate is computed over
+        """
+        self.max_limit = max(1, max_limit)
+        self.min_limit = max(1, min(min_limit, self.max_limit))
+        self.decrease_factor = decrease_factor
+        self.error_threshold = error_threshold
+        self._limit = float(self.max_limit)
+        self._active = 0
+        self._outcomes: "deque[str]" = deque(maxlen=max(1, window))
+        self._counts: Dict[str, int] = {}
+        self._last_decrease = float("-inf")
+        self._cond = threading.Condition()
+
+    @property
+    def limit(self) -> int:
+        """Downloads currently allowed to run at once"""
+        return int(self._limit)
+
+    def acquire(self) -> None:
+        with self._cond:
+            while self._active >= int(self._limit):
+                self._cond.wait()
+            self._active += 1
+
+    def release(self) -> None:
+        with self._cond:
+            self._active -= 1
+            self._cond.notify()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+    def _error_rate(self) -> float:
+        if not self._outcomes:
+            return 0.0
+        return sum(1 for kind in self._outcomes if kind in RETRYABLE) / len(self._outcomes)
+
+    def record(self, kind: str, started: Optional[float] = None) -> None:
+        """
+        Report the outcome of one download attempt.
+
+        Args:
+            kind: SUCCESS or a failure class (see classify_error)
+            started: time.monotonic() when the attempt got its slot; None
+                counts it as started now
+        """
+        with self._cond:
+            self._outcomes.append(kind)
+            self._counts[kind] = self._counts.get(kind, 0) + 1
+            error_rate = self._error_rate()
+            before = int(self._limit)
+            if kind == SUCCESS:
+                if error_rate < self.error_threshold:
+                    self._limit = min(self.max_limit, self._limit + 1 / self._limit)
+            elif kind == THROTTLED or (kind == TRANSIENT and error_rate >= self.error_threshold):
+                now = time.monotonic()
+                if (now if started is None else started) >= self._last_decrease:
+                    self._last_decrease = now
+                    self._limit = max(self.min_limit, self._limit * self.decrease_factor)
+            after = int(self._limit)
+            if after > before:
+                self._cond.notify(after - before)
+        if after != before:
+            logger.info(f"Download concurrency {before} -> {after} (recent error rate {error_rate:.0%})")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                'limit': int(self._limit),
+                'minLimit': self.min_limit,
+                'maxLimit': self.max_limit,
+                'active': self._active,
+                'errorRate': round(self._error_rate(), 3),
+                'outcomes': dict(self._counts),
+            }
+
+
+class RetryPolicy:
+    """
+    Retries of download attempts that failed with a retryable error.
+
+    The wait before retry n (0-based) is drawn uniformly from the upper
+    half of min(max_delay, base * 2**n), so workers hit by the same
+    failure do not come back in lockstep; throttled attempts start from
+    throttled_delay instead of base_delay.
+    """
+
+    def __init__(
+        self,
+        max_retries: int = 3,
+        base_delay: float = 1.0,
+        throttled_delay: float = 5.0,
+        max_delay: float = 60.0
+    ):
+        """
+        Initialize the policy
+
+        Args:
+            max_retries: Retries after the first attempt (0 disables retrying)
+            base_delay: Base wait in seconds after a transient error
+            throttled_delay: Base wait in seconds after a throttled attempt
+            max_delay: Upper bound of any wait
+        """
+        self.max_retries = max(0, max_retries)
+        self.base_delay = base_delay
+        self.throttled_delay = throttled_delay
+        self.max_delay = max_delay
+        self._lock = threading.Lock()
+        self.retries = 0
+        self.exhausted = 0
+
+    def should_retry(self, kind: str, attempt: int) -> bool:
+        """Whether attempt (0-based) failing with kind gets another attempt"""
+        retry = kind in RETRYABLE and attempt < self.max_retries
+        with self._lock:
+            if retry:
+                self.retries += 1
+            elif kind in RETRYABLE and self.max_retries:
+                self.exhausted += 1
+        return retry
+
+    def delay(self, kind: str, attempt: int) -> float:
+        """Seconds to wait before retrying attempt (0-based) that failed with kind"""
+        base = self.throttled_delay if kind == THROTTLED else self.base_delay
+        ceiling = min(self.max_delay, base * 2 ** attempt)
+        return random.uniform(ceiling / 2, ceiling)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'retries': self.retries, 'exhausted': self.exhausted}
+
+
+def download_with_retries(
+    download: Callable[[], Dict[str, Any]],
+    limiter: AdaptiveLimiter,
+    policy: RetryPolicy,
+    label: str = "",
+    sleep: Callable[[float], None] = time.sleep
+) -> Dict[str, Any]:
+    """
+    Run a download under the limiter, retrying retryable failures.
+
+    Each attempt holds a limiter slot and reports its outcome to the
+    limiter; the waits between attempts hold none.
+
+    Args:
+        download: Runs one attempt; raises DownloadError on failure, or
+            subprocess.TimeoutExpired, which counts as a transient failure
+        limiter: Download concurrency limit
+        policy: Which failures are retried and how long to wait
+        label: Name of the download in log messages
+        sleep: Called with the wait before each retry
+
+    Returns:
+        Result of the successful attempt
+
+    Raises:
+        DownloadError: With the kind of the last failure, once no retry is left
+    """
+    attempt = 0
+    while True:
+        with limiter:
+            started = time.monotonic()
+            try:
+                result = download()
+            except DownloadError as e:
+                kind = classify_error(str(e))
+                limiter.record(kind, started)
+                error = e
+            except subprocess.TimeoutExpired as e:
+                kind = TRANSIENT
+                limiter.record(kind, started)
+                error = DownloadError(f"Conversion timeout (download exceeded {int(e.timeout)} seconds)")
+            else:
+                limiter.record(SUCCESS, started)
+                return result
+        if not policy.should_retry(kind, attempt):
+            message = str(error) if attempt == 0 else f"{error} (after {attempt + 1} attempts)"
+            raise DownloadError(message, kind=kind)
+        wait = policy.delay(kind, attempt)
+        logger.info(f"Download of {label} failed ({kind}), retrying in {wait:.1f}s")
+        sleep(wait)
+        attempt += 1
@@ -0,0 +1,312 @@
+"""
+Conversion worker: runs the conversions API nodes queue on a broker.
+
+    python -m backend.worker        (from the repository root)
+    python worker.py                (from backend/)
+
+Reads the same environment and .env as the API. OUTPUT_DIR must be the
+storage the API nodes serve files from (the same directory, or the same
+share mounted elsewhere), and BROKER / BROKER_URL must name the same
+broker. WORKER_CONCURRENCY sets how many items this process converts at
+a time; start more processes, on this or other machines, to add capacity.
+"""
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+import logging
+from typing import Any, Dict, Optional, Set
+
+# The backend modules import each other by flat name, also under python -m backend.worker
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from dotenv import load_dotenv
+
+import converter
+from broker import LEASE_SECONDS, PLAYLIST_TASK, POLL_INTERVAL, Broker, create_broker, default_broker_url
+from cache import ConversionCache
+from engines import create_engine
+from playlists import PlaylistEnumerator, PlaylistError
+from search import SearchCache, SearchResolver, create_search_backend
+from segmented import SegmentedTranscoder
+from storage import FileIndex
+from tagging import Tagger, TaggingStage, ThumbnailCache
+from upstream import RetryPolicy
+
+logger = logging.getLogger(__name__)
+
+
+# Seconds a produced file stays in the worker's private index, long enough
+# for every task sharing it (coalesced or cached conversions) to report it
+INDEX_RETENTION_SECONDS = 3600
+
+# Seconds between the worker's housekeeping runs (index pruning, cache eviction)
+HOUSEKEEPING_SECONDS = 60
+
+
+class Worker:
+    """
+    Claims conversion tasks from a broker and runs them with convert_single().
+
+    The converter registers every file it produces in a private in-memory
+    FileIndex; the worker reads the file's path (relative to output_dir)
+    and metadata record from there and sends them back with the result,
+    so the API node can index and serve the file. With a tagging stage, a
+    task is completed only once its file is tagged, on the tagging thread,
+    while the worker thread claims its next task. A lease renewer keeps the
+    leases of all unfinished tasks alive, so a task whose worker dies is
+    handed to another worker after LEASE_SECONDS.
+    """
+
+    def __init__(
+        self,
+        broker: Broker,
+        output_dir: str,
+        ffmpeg_path: str,
+        worker_id: str,
+        concurrency: int = 4,
+        lease_seconds: float = LEASE_SECONDS,
+        cache: Optional[ConversionCache] = None
+    ):
+        """
+        Initialize the worker
+
+        Args:
+            broker: Where tasks come from
+            output_dir: Shared storage the files are converted into
+            ffmpeg_path: Path to ffmpeg binary directory
+            worker_id: Name of this worker in the broker
+            concurrency: Tasks converted at the same time
+            lease_seconds: Lease of a claimed task, renewed every third of it
+            cache: Conversion cache to evict from during housekeeping
+        """
+        self.broker = broker
+        self.output_dir = output_dir
+        self.ffmpeg_path = ffmpeg_path
+        self.worker_id = worker_id
+        self.concurrency = max(1, concurrency)
+        self.lease_seconds = lease_seconds
+        self.cache = cache
+        self.file_index = FileIndex(":memory:", output_dir, seed=False)
+        converter.configure_file_index(self.file_index)
+        self.enumerator = PlaylistEnumerator()
+        self.stopping = threading.Event()
+        self._finished = threading.Event()
+        self._held: Set[str] = set()
+        self._lock = threading.Lock()
+        self.completed = 0
+        self.failed = 0
+
+    def run(self) -> None:
+        """Convert tasks until stopping is set, then finish the tasks in hand"""
+        threads = [
+            threading.Thread(target=self._claim_loop, name=f"worker-{n}", daemon=True)
+            for n in range(self.concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+        renewer = threading.Thread(target=self._renew_loop, name="lease-renewer", daemon=True)
+        renewer.start()
+        logger.info(f"Worker {self.worker_id} started ({self.concurrency} concurrent conversions)")
+        for thread in threads:
+            thread.join()
+        # Tasks still being tagged complete from the tagging pool
+        while self._held_count():
+            time.sleep(POLL_INTERVAL)
+        self._finished.set()
+        renewer.join()
+        logger.info(f"Worker {self.worker_id} stopped: {self.completed} completed, {self.failed} failed")
+
+    def _held_count(self) -> int:
+        with self._lock:
+            return len(self._held)
+
+    def _claim_loop(self) -> None:
+        while not self.stopping.is_set():
+            try:
+                claimed = self.broker.claim(self.worker_id, self.lease_seconds)
+            except Exception as e:
+                logger.warning(f"Claiming a task failed: {e}")
+                claimed = None
+            if claimed is None:
+                self.stopping.wait(POLL_INTERVAL)
+                continue
+            task_id, payload = claimed
+            with self._lock:
+                self._held.add(task_id)
+            self._run_task(task_id, payload)
+
+    def _run_task(self, task_id: str, payload: Dict[str, Any]) -> None:
+        if payload.get('kind') == PLAYLIST_TASK:
+            self._complete(task_id, self._enumerate(payload), has_file=False)
+            return
+
+        def progress(event):
+            try:
+                self.broker.progress(task_id, event)
+            except Exception as e:
+                logger.debug(f"Could not report progress of {task_id}: {e}")
+
+        try:
+            result = converter.convert_single(
+                payload['input'],
+                self.output_dir,
+                self.ffmpeg_path,
+                is_search=payload.get('isSearch', False),
+                progress=progress,
+                profile=payload.get('profile')
+            )
+        except Exception as e:
+            result = {'success': False, 'error': f"Unexpected error: {str(e)}"}
+        pending = converter.pending_tagging(result['id']) if result['success'] else None
+        if pending is None:
+            self._complete(task_id, result)
+        else:
+            pending.add_done_callback(lambda _: self._complete(task_id, result))
+
+    def _enumerate(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """List the flat entries of a playlist for an API node (see RemotePlaylistEnumerator)"""
+        try:
+            entries = list(self.enumerator.entries(payload['input'], max_items=payload.get('maxItems')))
+        except PlaylistError as e:
+            return {'success': False, 'error': str(e)}
+        except Exception as e:
+            return {'success': False, 'error': f"Unexpected error: {str(e)}"}
+        return {'success': True, 'entries': entries}
+
+    def _complete(self, task_id: str, result: Dict[str, Any], has_file: bool = True) -> None:
+        """Report a result with the location and metadata record of its file"""
+        if result['success'] and has_file:
+            record = self.file_index.get(result['id'])
+            if record is None:
+                result = {**result, 'success': False, 'error': "Converted file was not registered"}
+            else:
+                result = {
+                    **result,
+                    'path': os.path.relpath(record['path'], self.output_dir),
+                    'metadata': record['metadata'],
+                    'createdAt': record['createdAt'],
+                }
+        try:
+            self.broker.complete(task_id, result)
+        except Exception as e:
+            # The lease runs out and another worker converts the item again
+            logger.error(f"Could not report task {task_id}: {e}")
+        with self._lock:
+            self._held.discard(task_id)
+            if result['success']:
+                self.completed += 1
+            else:
+                self.failed += 1
+
+    def _renew_loop(self) -> None:
+        last_housekeeping = time.monotonic()
+        while not self._finished.wait(self.lease_seconds / 3):
+            with self._lock:
+                held = list(self._held)
+            try:
+                self.broker.renew(held, self.worker_id, self.lease_seconds)
+            except Exception as e:
+                logger.warning(f"Renewing leases failed: {e}")
+            if time.monotonic() - last_housekeeping >= HOUSEKEEPING_SECONDS:
+                last_housekeeping = time.monotonic()
+                self.file_index.pop_expired(time.time() - INDEX_RETENTION_SECONDS)
+                if self.cache is not None:
+                    self.cache.evict()
+
+
+def main() -> int:
+    load_dotenv()
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    output_dir = os.getenv("OUTPUT_DIR", "archivos_mp3")
+    ffmpeg_path = os.getenv("FFMPEG_PATH", "")
+    broker_kind = os.getenv("BROKER", "sqlite")
+    if broker_kind == "local":
+        logger.error("BROKER is 'local': the API converts in-process and queues nothing for workers")
+        return 2
+    concurrency = int(os.getenv("WORKER_CONCURRENCY", os.getenv("CONVERSION_WORKERS", "4")))
+    worker_id = os.getenv("WORKER_ID", f"{socket.gethostname()}-{os.getpid()}")
+    os.makedirs(output_dir, exist_ok=True)
+
+    converter.configure_limits(
+        max_downloads=int(os.getenv("MAX_CONCURRENT_DOWNLOADS", str(concurrency))),
+        max_transcodes=int(os.getenv("MAX_CONCURRENT_TRANSCODES", str(max(1, (os.cpu_count() or 2) // 2)))),
+        min_downloads=int(os.getenv("MIN_CONCURRENT_DOWNLOADS", "1"))
+    )
+    converter.configure_retries(RetryPolicy(
+        max_retries=int(os.getenv("DOWNLOAD_RETRIES", "3")),
+        base_delay=float(os.getenv("DOWNLOAD_RETRY_DELAY_SECONDS", "1")),
+        throttled_delay=float(os.getenv("DOWNLOAD_THROTTLED_DELAY_SECONDS", "5")),
+        max_delay=float(os.getenv("DOWNLOAD_RETRY_MAX_DELAY_SECONDS", "60"))
+    ))
+    converter.configure_engine(create_engine(os.getenv("YTDLP_ENGINE", "subprocess"), pool_size=concurrency))
+    segment_min_duration = float(os.getenv("SEGMENT_MIN_DURATION_SECONDS", "1200"))
+    if segment_min_duration > 0:
+        converter.configure_segmenting(SegmentedTranscoder(
+            segment_min_duration, float(os.getenv("SEGMENT_SECONDS", "120"))
+        ))
+    search_backend = os.getenv("SEARCH_BACKEND", "ytdlp")
+    if search_backend != "off":
+        converter.configure_search(SearchResolver(
+            create_search_backend(search_backend),
+            SearchCache(
+                max_entries=int(os.getenv("SEARCH_CACHE_SIZE", "1000")),
+                ttl_seconds=float(os.getenv("SEARCH_CACHE_TTL_HOURS", "6")) * 3600
+            ),
+            max_workers=int(os.getenv("SEARCH_CONCURRENCY", "8"))
+        ))
+    # The cache's bookkeeping lives in one process, so each worker needs a directory of its own
+    cache = None
+    if os.getenv("WORKER_CACHE_DIR"):
+        cache = ConversionCache(
+            os.getenv("WORKER_CACHE_DIR"),
+            max_bytes=int(os.getenv("CACHE_MAX_MB", "2048")) * 1024 * 1024,
+            max_age_seconds=int(os.getenv("CACHE_TTL_HOURS", "168")) * 3600
+        )
+    converter.configure_cache(cache)
+    tagging = None
+    if os.getenv("TAGGING_ENABLED", "true").lower() in ("1", "true", "yes"):
+        try:
+            thumbnails = None
+            if os.getenv("TAG_COVER_ART", "true").lower() in ("1", "true", "yes"):
+                thumbnails = ThumbnailCache(
+                    os.getenv("THUMBNAIL_CACHE_DIR", os.path.join(output_dir, ".thumbnails")),
+                    max_entries=int(os.getenv("THUMBNAIL_CACHE_SIZE", "1000"))
+                )
+            tagging = TaggingStage(Tagger(thumbnails), max_workers=int(os.getenv("TAG_WORKERS", "2")))
+        except ImportError:
+            logger.warning("mutagen is not installed; converted files will not be tagged")
+    converter.configure_tagging(tagging)
+
+    broker_url = os.getenv("BROKER_URL") or default_broker_url(broker_kind, output_dir)
+    broker = create_broker(broker_kind, broker_url)
+    worker = Worker(
+        broker, output_dir, ffmpeg_path, worker_id,
+        concurrency=concurrency,
+        lease_seconds=float(os.getenv("WORKER_LEASE_SECONDS", str(LEASE_SECONDS))),
+        cache=cache
+    )
+    logger.info(f"Broker: {broker_kind} ({broker_url}), output directory: {output_dir}")
+
+    def stop(signum, frame):
+        logger.info("Stopping: finishing the conversions in progress")
+        worker.stopping.set()
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        worker.run()
+    finally:
+        if tagging is not None:
+            tagging.shutdown()
+        broker.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,39 +1,19 @@
-import subprocess
-import os
-import re
-
-# Lista de entradas: pueden ser URLs o búsquedas
-inputs = [
-    "https://www.youtube.com/watch?v=vz_vU53JvvI",
-    "Aitana - En El Coche"
-]
+"""
+Convert YouTube URLs and search queries listed in a file to MP3.
 
-OUTPUT_DIR = "archivos_mp3"
-os.makedirs(OUTPUT_DIR, exist_ok=True)
+This script is kept for existing users; it runs the backend CLI
+(backend/cli.py) with the same arguments, e.g.:
 
-FFMPEG_PATH = r"C:\ffmpeg-2026-01-07-git-af6a1dd0b2-essentials_build\bin"
+    python link_to_mp3.py canciones.txt -o archivos_mp3 -j 4
 
-# Función para detectar si es link de YouTube
-def es_youtube_url(texto):
-    # Regex simple para detectar URLs de YouTube
-    patron = r"(https?://)?(www\.)?(youtube\.com|youtu\.be)/"
-    return re.match(patron, texto) is not None
+See backend/README.md ("Command-Line Batch Conversion") for the options.
+"""
+import os
+import sys
 
-for entrada in inputs:
-    if es_youtube_url(entrada):
-        # Si es URL, la usamos tal cual
-        target = entrada
-    else:
-        # Si no es URL, usamos búsqueda y descargamos el primer resultado
-        target = f"ytsearch1:{entrada}"
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
 
-    print(f"Procesando: {entrada}")
+from cli import main
 
-    subprocess.run([
-        "yt-dlp",
-        "-x",
-        "--audio-format", "mp3",
-        "--ffmpeg-location", FFMPEG_PATH,
-        "-o", f"{OUTPUT_DIR}/%(title)s.%(ext)s",
-        target
-    ])
+if __name__ == "__main__":
+    sys.exit(main())
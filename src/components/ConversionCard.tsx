@@ -19,7 +19,59 @@ interface ConversionResult {
   error: string | null;
   wasSearch: boolean;
   originalInput: string;
+  videoId?: string | null;
+  uploader?: string | null;
+  durationSeconds?: number | null;
+  thumbnail?: string | null;
+  sourceFormat?: string | null;
+  sourceCodec?: string | null;
+  sourceBitrate?: number | null;
+  bitrate?: number | null;
+  profile?: string | null;
 }
+
+interface ItemProgress {
+  input: string;
+  phase: "queued" | "downloading" | "postprocessing" | "done" | "failed";
+  percent: number | null;
+  speed: number | null;
+  eta: number | null;
+}
+
+interface PlaylistResult {
+  success: boolean;
+  error: string | null;
+  title: string | null;
+  entries: number;
+  truncated: string | null;
+}
+
+interface JobItem {
+  index: number;
+  input: string;
+  status: "queued" | "running" | "completed" | "failed";
+  kind?: "video" | "playlist";
+  parent?: number | null;
+  result: ConversionResult | null;
+  playlist?: PlaylistResult | null;
+}
+
+// Results of a finished job: one per video; expanded playlists only show up when they failed
+const jobResults = (items: JobItem[]): ConversionResult[] =>
+  items
+    .filter((item) => item.kind !== "playlist" || item.status === "failed")
+    .map((item) => item.result ?? {
+      id: "",
+      filename: "",
+      title: item.input,
+      size: null,
+      duration: null,
+      success: false,
+      error: item.playlist?.error ?? "Conversion did not produce a result",
+      wasSearch: false,
+      originalInput: item.input,
+    });
+
 type InputMode = "single" | "batch" | "search";
 
 export const ConversionCard = () => {
@@ -27,6 +79,7 @@ export const ConversionCard = () => {
   const [mode, setMode] = useState<InputMode>("single");
   const [state, setState] = useState<ConversionState>("idle");
   const [results, setResults] = useState<ConversionResult[]>([]);
+  const [progress, setProgress] = useState<ItemProgress[]>([]);
   const { toast } = useToast();
 
   const inputList = input.split("\n").filter((item) => item.trim());
@@ -53,6 +106,7 @@ export const ConversionCard = () => {
 
     setState("validating");
     setResults([]);
+    setProgress([]);
     
     // Short validation delay
     await new Promise((resolve) => setTimeout(resolve, 500));
@@ -85,7 +139,7 @@ export const ConversionCard = () => {
         }
       }
 
-      const response = await fetch(API_ENDPOINTS.convert, {
+      const response = await fetch(API_ENDPOINTS.jobs, {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
@@ -98,29 +152,9 @@ export const ConversionCard = () => {
         throw new Error(errorData.detail || 'Conversion failed');
       }
 
-      const data = await response.json();
-
-      if (data.results) {
-        setResults(data.results);
-        const successCount = data.results.filter((r: ConversionResult) => r.success).length;
-        
-        if (successCount > 0) {
-          setState("ready");
-          toast({
-            title: "Conversion complete!",
-            description: successCount === inputList.length 
-              ? `${successCount} MP3 file${successCount > 1 ? 's are' : ' is'} ready to download`
-              : `${successCount} of ${inputList.length} conversions succeeded`,
-          });
-        } else {
-          setState("error");
-          toast({
-            title: "Conversion failed",
-            description: "Could not convert any of the provided inputs. Please check and try again.",
-            variant: "destructive",
-          });
-        }
-      }
+      const job = await response.json();
+      const finalResults = await followJob(job.id);
+      finishConversion(finalResults);
     } catch (err) {
       console.error('Conversion error:', err);
       setState("error");
@@ -132,6 +166,104 @@ export const ConversionCard = () => {
     }
   };
 
+  // Stream live job progress over Server-Sent Events until every item has finished
+  const followJob = (jobId: string) =>
+    new Promise<ConversionResult[]>((resolve, reject) => {
+      const events = new EventSource(API_ENDPOINTS.jobEvents(jobId));
+      let items: JobItem[] = [];
+
+      events.addEventListener("snapshot", (e) => {
+        items = JSON.parse((e as MessageEvent).data).items;
+        setProgress(items.map((item) => ({
+          input: item.input,
+          phase: item.status === "completed" ? "done" : item.status === "failed" ? "failed" : "queued",
+          percent: item.status === "completed" ? 100 : null,
+          speed: null,
+          eta: null,
+        })));
+      });
+
+      events.addEventListener("progress", (e) => {
+        const event = JSON.parse((e as MessageEvent).data);
+        setProgress((current) => current.map((item, index) =>
+          index === event.index
+            ? { ...item, phase: event.phase, percent: event.percent ?? item.percent, speed: event.speed ?? null, eta: event.eta ?? null }
+            : item
+        ));
+      });
+
+      // A playlist entry became a new item of the job
+      events.addEventListener("added", (e) => {
+        const event = JSON.parse((e as MessageEvent).data);
+        items = [...items, { index: event.index, input: event.input, status: "queued", kind: "video", parent: event.parent, result: null }];
+        setProgress((current) => [...current, {
+          input: event.title ?? event.input,
+          phase: "queued",
+          percent: null,
+          speed: null,
+          eta: null,
+        }]);
+      });
+
+      events.addEventListener("item", (e) => {
+        const event = JSON.parse((e as MessageEvent).data);
+        items = items.map((item) => item.index !== event.index ? item
+          : item.kind === "playlist" ? { ...item, status: event.status, playlist: event.result }
+          : { ...item, status: event.status, result: event.result });
+        setProgress((current) => current.map((item, index) =>
+          index === event.index
+            ? { ...item, phase: event.status === "completed" ? "done" : "failed", percent: event.status === "completed" ? 100 : item.percent }
+            : item
+        ));
+      });
+
+      events.addEventListener("job", () => {
+        events.close();
+        resolve(jobResults(items));
+      });
+
+      events.onerror = () => {
+        // Connection lost: fall back to a single status request
+        events.close();
+        fetch(API_ENDPOINTS.job(jobId))
+          .then((res) => res.json())
+          .then((data) => {
+            if (data.status === "completed") {
+              resolve(jobResults(data.items));
+            } else {
+              reject(new Error("Lost connection to the conversion server"));
+            }
+          })
+          .catch(reject);
+      };
+    });
+
+  const finishConversion = (finalResults: ConversionResult[]) => {
+    setResults(finalResults);
+    const successCount = finalResults.filter((r) => r.success).length;
+
+    if (successCount > 0) {
+      setState("ready");
+      toast({
+        title: "Conversion complete!",
+        description: successCount === finalResults.length
+          ? `${successCount} MP3 file${successCount > 1 ? 's are' : ' is'} ready to download`
+          : `${successCount} of ${finalResults.length} conversions succeeded`,
+      });
+    } else {
+      setState("error");
+      toast({
+        title: "Conversion failed",
+        description: "Could not convert any of the provided inputs. Please check and try again.",
+        variant: "destructive",
+      });
+    }
+  };
+
+  const overallPercent = progress.length
+    ? progress.reduce((sum, item) => sum + (item.phase === "done" || item.phase === "failed" ? 100 : item.percent ?? 0), 0) / progress.length
+    : 0;
+
   const handleDownload = (fileId: string, title: string) => {
     const downloadUrl = API_ENDPOINTS.download(fileId);
     window.open(downloadUrl, '_blank');
@@ -143,15 +275,12 @@ export const ConversionCard = () => {
 
   const handleDownloadAll = () => {
     const successfulResults = results.filter(r => r.success);
-    successfulResults.forEach((result, index) => {
-      setTimeout(() => {
-        const downloadUrl = API_ENDPOINTS.download(result.id);
-        window.open(downloadUrl, '_blank');
-      }, index * 500);
-    });
+    // One request streaming a ZIP instead of one popup per file
+    const downloadUrl = API_ENDPOINTS.downloadBatch(successfulResults.map(r => r.id));
+    window.open(downloadUrl, '_blank');
     toast({
-      title: "Downloads started",
-      description: `Downloading ${successfulResults.length} file(s)`,
+      title: "Download started",
+      description: `Downloading ${successfulResults.length} file(s) as a ZIP archive`,
     });
   };
 
@@ -159,6 +288,7 @@ export const ConversionCard = () => {
     setState("idle");
     setInput("");
     setResults([]);
+    setProgress([]);
   };
 
   return (
@@ -282,12 +412,45 @@ export const ConversionCard = () => {
             <div className="h-2 bg-muted rounded-full overflow-hidden">
               <div
                 className={cn(
-                  "h-full bg-gradient-to-r from-primary to-accent rounded-full transition-all duration-1000",
+                  "h-full bg-gradient-to-r from-primary to-accent rounded-full transition-all duration-500",
                   state === "validating" && "w-1/4",
-                  state === "processing" && "w-3/4 animate-pulse"
+                  state === "processing" && progress.length === 0 && "w-1/4 animate-pulse"
                 )}
+                style={state === "processing" && progress.length > 0 ? { width: `${Math.max(overallPercent, 2)}%` } : undefined}
               />
             </div>
+            {state === "processing" && progress.length > 1 && (
+              <div className="space-y-2 max-h-48 overflow-y-auto">
+                {progress.map((item, index) => (
+                  <div key={index} className="space-y-1">
+                    <div className="flex items-center justify-between text-xs">
+                      <span className="truncate text-muted-foreground">{item.input}</span>
+                      <span className="shrink-0 ml-2 text-muted-foreground">
+                        {item.phase === "downloading" && item.percent !== null
+                          ? `${item.percent.toFixed(0)}%${item.eta !== null ? ` • ${Math.ceil(item.eta)}s` : ""}`
+                          : item.phase === "postprocessing"
+                          ? "Converting..."
+                          : item.phase === "done"
+                          ? "Done"
+                          : item.phase === "failed"
+                          ? "Failed"
+                          : "Queued"}
+                      </span>
+                    </div>
+                    <div className="h-1 bg-muted rounded-full overflow-hidden">
+                      <div
+                        className={cn(
+                          "h-full rounded-full transition-all duration-500",
+                          item.phase === "failed" ? "bg-destructive" : "bg-primary",
+                          item.phase === "postprocessing" && "animate-pulse"
+                        )}
+                        style={{ width: `${item.phase === "done" || item.phase === "failed" ? 100 : item.percent ?? 0}%` }}
+                      />
+                    </div>
+                  </div>
+                ))}
+              </div>
+            )}
           </div>
         )}
 
@@ -9,7 +9,13 @@ export const API_URL = import.meta.env.VITE_API_URL || 'http://localhost:8000';
 export const API_ENDPOINTS = {
   health: `${API_URL}/api/health`,
   convert: `${API_URL}/api/convert`,
+  jobs: `${API_URL}/api/jobs`,
+  job: (jobId: string) => `${API_URL}/api/jobs/${jobId}`,
+  jobEvents: (jobId: string) => `${API_URL}/api/jobs/${jobId}/events`,
+  jobDownload: (jobId: string) => `${API_URL}/api/jobs/${jobId}/download`,
   download: (fileId: string) => `${API_URL}/api/download/${fileId}`,
+  downloadBatch: (fileIds: string[]) =>
+    `${API_URL}/api/download/batch?ids=${fileIds.map(encodeURIComponent).join(',')}`,
 } as const;
 
 /**